@@ -0,0 +1,2 @@
+""" Benchmarks for the Outbound SDK. See benchmarks/load.py and
+benchmarks/payload.py. """
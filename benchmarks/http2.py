@@ -0,0 +1,85 @@
+""" Throughput of HTTP2Transport against the HTTP/1.1 transports at high
+concurrency.
+
+    python -m benchmarks.http2 [--events N] [--concurrency N] [--latency SECONDS]
+        [--max-connections N] [--max-concurrent-streams N]
+
+Each transport sends the same number of track_many() calls with
+--concurrency requests in flight, to a stub server in a separate process
+(HTTP/1.1 for the http.client and requests transports, cleartext HTTP/2 for
+HTTP2Transport). Prints one JSON object per transport with its throughput and
+the number of connections it used. Needs the h2 package.
+"""
+import argparse
+import functools
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import outbound
+from benchmarks.stub import serve_in_process
+from outbound.transport import HTTP2Transport, HTTPClientTransport, RequestsTransport
+
+def connections(pid):
+    """ The number of TCP connections open in this process, on Linux. """
+    try:
+        fds = os.listdir('/proc/%d/fd' % pid)
+    except OSError:
+        return None
+    count = 0
+    for fd in fds:
+        try:
+            count += os.readlink('/proc/%d/fd/%s' % (pid, fd)).startswith('socket:')
+        except OSError:
+            pass
+    return count
+
+def run(name, transport, url, args):
+    client = outbound.Client('benchmark', base_url=url, transport=transport,
+        pool_maxsize=args.concurrency)
+    records = (dict(user_id=i, event='benchmark') for i in range(args.events))
+    started = time.time()
+    failures = sum(1 for _ in client.track_many(records, concurrency=args.concurrency))
+    elapsed = time.time() - started
+    result = dict(
+        transport=name,
+        events=args.events,
+        concurrency=args.concurrency,
+        failures=failures,
+        events_per_second=round(args.events / elapsed, 1),
+        sockets=connections(os.getpid()),
+    )
+    client.close()
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.http2')
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds the stub waits before replying')
+    parser.add_argument('--max-connections', type=int, default=1)
+    parser.add_argument('--max-concurrent-streams', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    http1, http1_url = serve_in_process(latency=args.latency)
+    http2, http2_url = serve_in_process(http2=True, latency=args.latency,
+        max_concurrent_streams=args.max_concurrent_streams)
+    http2_transport = functools.partial(HTTP2Transport, prior_knowledge=True,
+        max_connections=args.max_connections, max_concurrent_streams=args.max_concurrent_streams)
+    try:
+        for name, transport, url in [
+            ('requests', RequestsTransport, http1_url),
+            ('http.client', HTTPClientTransport, http1_url),
+            ('http2', http2_transport, http2_url),
+        ]:
+            sys.stdout.write(json.dumps(run(name, transport, url, args), sort_keys=True) + '\n')
+            sys.stdout.flush()
+    finally:
+        http1.terminate()
+        http2.terminate()
+
+if __name__ == '__main__':
+    main()
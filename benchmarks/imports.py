@@ -0,0 +1,69 @@
+""" Cold-start benchmarks: the cost of importing the SDK and sending a first
+event from a fresh interpreter, as a short-lived job or serverless handler
+would.
+
+    python -m benchmarks.imports [--runs N]
+
+Each scenario runs --runs times in a new interpreter and prints one JSON
+object with its median and minimum wall time in milliseconds. The `python`
+scenario is the bare interpreter start-up, to subtract from the others, and
+`import requests` is what `import outbound` cost before requests was imported
+lazily.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.stub import serve_in_process
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+FIRST_EVENT = '''
+import outbound
+from outbound.transport import %s
+outbound.init('benchmark', base_url=%r, transport=%s)
+outbound.track(1, 'benchmark', on_error=lambda code, err: exit(code))
+outbound.close()
+'''
+
+def scenarios(url):
+    return [
+        ('python', 'pass'),
+        ('import requests', 'import requests'),
+        ('import outbound', 'import outbound'),
+        ('first event, http.client', FIRST_EVENT % ('HTTPClientTransport', url, 'HTTPClientTransport')),
+        ('first event, requests', FIRST_EVENT % ('RequestsTransport', url, 'RequestsTransport')),
+    ]
+
+def run(code):
+    started = time.time()
+    subprocess.check_call([sys.executable, '-c', code], cwd=ROOT)
+    return time.time() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.imports')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    process, url = serve_in_process()
+    try:
+        for name, code in scenarios(url):
+            times = sorted(run(code) for _ in range(args.runs))
+            result = dict(
+                scenario=name,
+                runs=args.runs,
+                median_ms=round(times[len(times) // 2] * 1000, 1),
+                min_ms=round(times[0] * 1000, 1),
+            )
+            sys.stdout.write(json.dumps(result, sort_keys=True) + '\n')
+            sys.stdout.flush()
+    finally:
+        process.terminate()
+
+if __name__ == '__main__':
+    main()
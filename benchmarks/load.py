@@ -0,0 +1,175 @@
+""" Load and latency benchmarks for the public API against a local stub server.
+
+    python -m benchmarks.load [--events N] [--modes sequential,threaded,...]
+        [--latency SECONDS] [--error-rate FRACTION] [--throttle-rate FRACTION]
+        [--trace-allocations]
+
+Each mode sends the same number of track() calls and prints one JSON object
+with its throughput, p50/p99 latency in milliseconds, CPU time per event in
+microseconds and, with --trace-allocations, the peak memory allocated while
+it ran. The stub server runs in a separate process so its CPU time is not
+counted.
+
+Modes:
+    sequential  track() from a single thread.
+    threaded    track() from --threads threads.
+    buffered    track() with init(buffered=True), timed until on_success.
+    async       outbound.aio.Client, with --concurrency calls in flight.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import outbound
+from benchmarks.stub import serve_in_process
+
+PROPERTIES = {'item': 'Widget', 'price': 9.99, 'quantity': 2}
+
+class Recorder(object):
+    """ Collects per-call latencies and error counts from any thread. """
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def callbacks(self, started):
+        def on_success():
+            elapsed = time.time() - started
+            with self.lock:
+                self.latencies.append(elapsed)
+        def on_error(code, err):
+            elapsed = time.time() - started
+            with self.lock:
+                self.latencies.append(elapsed)
+                self.errors += 1
+        return dict(on_success=on_success, on_error=on_error)
+
+def run_sequential(args, recorder):
+    outbound.init(args.key, base_url=args.url)
+    for i in range(args.events):
+        outbound.track(i, 'benchmark', properties=PROPERTIES, **recorder.callbacks(time.time()))
+
+def run_threaded(args, recorder):
+    outbound.init(args.key, base_url=args.url, pool_maxsize=args.threads)
+    def work(offset):
+        for i in range(offset, args.events, args.threads):
+            outbound.track(i, 'benchmark', properties=PROPERTIES, **recorder.callbacks(time.time()))
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def run_buffered(args, recorder):
+    outbound.init(args.key, base_url=args.url, buffered=True, max_queue_size=args.events)
+    for i in range(args.events):
+        outbound.track(i, 'benchmark', properties=PROPERTIES, **recorder.callbacks(time.time()))
+    outbound.flush()
+
+def run_async(args, recorder):
+    import asyncio
+    from outbound import aio
+
+    async def run():
+        async with aio.Client(args.key, base_url=args.url, concurrency=args.concurrency) as client:
+            async def one(i):
+                await client.track(i, 'benchmark', properties=PROPERTIES, **recorder.callbacks(time.time()))
+            await asyncio.gather(*[one(i) for i in range(args.events)])
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+def async_available():
+    try:
+        import asyncio
+        import aiohttp
+        return True
+    except ImportError:
+        return False
+
+MODES = {
+    'sequential': run_sequential,
+    'threaded': run_threaded,
+    'buffered': run_buffered,
+    'async': run_async,
+}
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[int(round(fraction * (len(values) - 1)))]
+
+def cpu_time():
+    if hasattr(time, 'process_time'):
+        return time.process_time()
+    return time.clock()
+
+def measure(mode, args):
+    recorder = Recorder()
+    tracemalloc = None
+    if args.trace_allocations:
+        import tracemalloc
+        tracemalloc.start()
+
+    started, cpu_started = time.time(), cpu_time()
+    try:
+        MODES[mode](args, recorder)
+    finally:
+        outbound.close()
+    seconds, cpu = time.time() - started, cpu_time() - cpu_started
+
+    result = dict(
+        mode=mode,
+        events=args.events,
+        errors=recorder.errors,
+        seconds=round(seconds, 4),
+        events_per_second=round(args.events / seconds, 1),
+        p50_ms=round(percentile(recorder.latencies, 0.5) * 1000, 3),
+        p99_ms=round(percentile(recorder.latencies, 0.99) * 1000, 3),
+        cpu_us_per_event=round(cpu / args.events * 1e6, 1),
+    )
+    if tracemalloc is not None:
+        result['alloc_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load')
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--modes', default=','.join(sorted(MODES)))
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--throttle-rate', type=float, default=0)
+    parser.add_argument('--trace-allocations', action='store_true')
+    parser.add_argument('--key', default='benchmark')
+    args = parser.parse_args(argv)
+
+    process, args.url = serve_in_process(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+    )
+    try:
+        for mode in args.modes.split(','):
+            if mode == 'async' and not async_available():
+                sys.stderr.write('Skipping async mode: aiohttp is not installed.\n')
+                continue
+            sys.stdout.write(json.dumps(measure(mode, args), sort_keys=True) + '\n')
+            sys.stdout.flush()
+    finally:
+        process.terminate()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+""" Micro-benchmarks for payload construction and serialization.
+
+    python benchmarks/payload.py [--number N]
+
+Prints one JSON object per benchmark with the best time per call in
+microseconds for the old code path and the new one side by side. The old
+builders below are the pre-outbound.payload track()/identify() dict building
+and __user(), minus the request, and the old serializer is a plain
+json.dumps().
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import timeit
+from numbers import Number
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from outbound import serializers
+from outbound.payload import STRING_TYPES, identify_payload, track_payload
+
+TRACK = dict(
+    user_id=12345,
+    event='added item to cart',
+    properties={'item': 'Widget', 'price': 9.99, 'quantity': 2},
+)
+TRACK_WITH_USER = dict(
+    user_id='u-12345',
+    event='signed up',
+    first_name='Ada',
+    email='ada@example.com',
+    apns_tokens='740f4707bebcf74f9b7c25d48e3358945f6aa01da5ddb387462c7eaf61bb78ad',
+    user_attributes={'plan': 'pro', 'seats': 3},
+    properties={'source': 'landing page'},
+)
+IDENTIFY = dict(
+    user_id=12345,
+    email='ada@example.com',
+    group_id='acme',
+    group_attributes={'industry': 'manufacturing'},
+    gcm_tokens=['token-1', 'token-2'],
+    attributes={'plan': 'pro', 'seats': 3},
+)
+
+# six.string_types, which the old code checked against.
+string_types = STRING_TYPES
+
+def old_user(first_name, last_name, email, phone_number, apns_tokens,
+        gcm_tokens, attributes, previous_id, group_id, group_attributes):
+
+    data = dict()
+    if previous_id:
+        data['previous_id'] = previous_id
+    if group_id:
+        data['group_id'] = group_id
+    if group_attributes:
+        if isinstance(group_attributes, dict):
+            if len(group_attributes) > 0:
+                data['group_attributes'] = group_attributes
+        else:
+            sys.stderr.write('Invalid group attributes given. Expected dictionary. ' +
+                        'Got %s' % type(group_attributes).__name__)
+    if first_name:
+        data['first_name'] = first_name
+    if last_name:
+        data['last_name'] = last_name
+    if email:
+        data['email'] = email
+    if phone_number:
+        data['phone_number'] = phone_number
+    if apns_tokens:
+        if isinstance(apns_tokens, string_types):
+            apns_tokens = [apns_tokens]
+        if isinstance(apns_tokens, (list, tuple)):
+            data['apns'] = apns_tokens
+        else:
+            sys.stderr.write('Invalid APNS tokens given. Expected string or ' +
+                        'list of strings. Got %s' % type(apns_tokens).__name__)
+    if gcm_tokens:
+        if isinstance(gcm_tokens, string_types):
+            gcm_tokens = [gcm_tokens]
+        if isinstance(gcm_tokens, (list, tuple)):
+            data['gcm'] = gcm_tokens
+        else:
+            sys.stderr.write('Invalid GCM tokens given. Expected string or ' +
+                        'list of strings. Got %s' % type(gcm_tokens).__name__)
+
+    if attributes:
+        if isinstance(attributes, dict):
+            if len(attributes) > 0:
+                data['attributes'] = attributes
+        else:
+            sys.stderr.write('Invalid user attributes given. Expected dictionary. ' +
+                        'Got %s' % type(attributes).__name__)
+
+    return data
+
+def old_identify(user_id, previous_id=None, group_id=None, group_attributes=None,
+            first_name=None, last_name=None, email=None,
+            phone_number=None, apns_tokens=None, gcm_tokens=None,
+            attributes=None):
+    if not isinstance(user_id, string_types + (Number,)):
+        return None
+
+    data = old_user(
+        first_name,
+        last_name,
+        email,
+        phone_number,
+        apns_tokens,
+        gcm_tokens,
+        attributes,
+        previous_id,
+        group_id,
+        group_attributes,)
+    data['user_id'] = user_id
+    return data
+
+def old_track(user_id, event, first_name=None, last_name=None, email=None,
+        phone_number=None, apns_tokens=None, gcm_tokens=None,
+        user_attributes=None, properties=None, timestamp=None):
+    if not isinstance(user_id, string_types + (Number,)):
+        return None
+    if not isinstance(event, string_types):
+        return None
+
+    data = dict(user_id=user_id, event=event)
+    user = old_user(
+        first_name,
+        last_name,
+        email,
+        phone_number,
+        apns_tokens,
+        gcm_tokens,
+        user_attributes,
+        None, None, None)
+    if user:
+        data['user'] = user
+
+    if properties:
+        if isinstance(properties, dict):
+            if len(properties) > 0:
+                data['properties'] = properties
+        else:
+            sys.stderr.write('Invalid event properties given. Expected dictionary. ' +
+                        'Got %s' % type(properties).__name__)
+
+    if timestamp:
+        data['timestamp'] = timestamp
+    else:
+        data['timestamp'] = int(time.time())
+    return data
+
+def best(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+def compare(name, old, new, number):
+    old_us, new_us = best(old, number), best(new, number)
+    sys.stdout.write(json.dumps({
+        'benchmark': name,
+        'old_us_per_call': round(old_us, 3),
+        'new_us_per_call': round(new_us, 3),
+        'speedup': round(old_us / new_us, 2),
+    }) + '\n')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    compare('track_payload', lambda: old_track(**TRACK),
+        lambda: track_payload(**TRACK), args.number)
+    compare('track_payload_with_user', lambda: old_track(**TRACK_WITH_USER),
+        lambda: track_payload(**TRACK_WITH_USER), args.number)
+    compare('identify_payload', lambda: old_identify(**IDENTIFY),
+        lambda: identify_payload(**IDENTIFY), args.number)
+
+    _, _, data = track_payload(**TRACK_WITH_USER)
+    fast = serializers.default()
+    compare('serialize_stdlib', lambda: json.dumps(data),
+        lambda: serializers.stdlib(data), args.number)
+    if fast is not serializers.stdlib:
+        compare('serialize_default', lambda: json.dumps(data),
+            lambda: fast(data), args.number)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+""" A local stub of the Outbound v2 API for benchmarks.
+
+    python -m benchmarks.stub [--port PORT] [--latency SECONDS]
+        [--error-rate FRACTION] [--throttle-rate FRACTION] [--http2]
+
+Accepts POSTs to every endpoint the SDK uses, optionally sleeping before
+replying, failing a fraction of calls with 500 and throttling a fraction with
+429 and a Retry-After header. Anything else gets a 404.
+
+With --http2 it speaks cleartext HTTP/2 with prior knowledge instead of
+HTTP/1.1, which needs the h2 package.
+"""
+import argparse
+import random
+import re
+import socket
+import sys
+import threading
+import time
+
+try:
+    import http.server as BaseHTTPServer
+    import socketserver
+except ImportError:
+    import BaseHTTPServer
+    import SocketServer as socketserver
+
+ROUTES = re.compile(r'^/v2/(identify|track|(apns|gcm)/(register|disable)|(un)?subscribe/(all|campaigns))$')
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('content-length', 0)))
+        status, headers = respond(self.server, self.path)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+def respond(server, path):
+    """ Wait out the server's latency and pick a status and headers for a
+    request to `path`, counting the status. """
+    if server.latency:
+        time.sleep(server.latency)
+
+    headers = {}
+    if not ROUTES.match(path):
+        status = 404
+    elif random.random() < server.throttle_rate:
+        status = 429
+        headers['Retry-After'] = str(server.retry_after)
+    elif random.random() < server.error_rate:
+        status = 500
+    else:
+        status = 200
+
+    with server.lock:
+        server.counts[status] = server.counts.get(status, 0) + 1
+    return status, headers
+
+class StubServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ The stub API, listening on 127.0.0.1:`port` (0 picks a free port). """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port=0, latency=0, error_rate=0, throttle_rate=0, retry_after=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), StubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/v2' % self.server_address[1]
+
+    def start(self):
+        """ Serve from a background thread. """
+        thread = threading.Thread(target=self.serve_forever, args=(0.05,))
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class H2StubHandler(socketserver.BaseRequestHandler):
+    # Serves one HTTP/2 connection, answering each stream from its own thread
+    # so that slow replies overlap as they would on a real server.
+
+    def handle(self):
+        import h2.config
+        import h2.connection
+        import h2.events
+        import h2.exceptions
+        import h2.settings
+
+        server = self.server
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(
+            client_side=False, header_encoding='utf-8'))
+        conn.local_settings = h2.settings.Settings(client=False,
+            initial_values={h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: server.max_concurrent_streams})
+        lock = threading.Lock()
+        paths = {}
+        with server.lock:
+            server.connections += 1
+
+        def reply(stream_id, path):
+            status, headers = respond(server, path)
+            with lock:
+                try:
+                    conn.send_headers(stream_id, [(':status', str(status)), ('content-length', '0')] +
+                        [(name.lower(), value) for name, value in headers.items()], end_stream=True)
+                    sock.sendall(conn.data_to_send())
+                except (EnvironmentError, h2.exceptions.ProtocolError):
+                    # The client reset the stream or went away.
+                    pass
+            with server.lock:
+                server.active -= 1
+
+        with lock:
+            conn.initiate_connection()
+            sock.sendall(conn.data_to_send())
+        while True:
+            try:
+                data = sock.recv(65536)
+            except EnvironmentError:
+                return
+            if not data:
+                return
+            with lock:
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        paths[event.stream_id] = dict(event.headers)[':path']
+                    elif isinstance(event, h2.events.DataReceived):
+                        conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        with server.lock:
+                            server.active += 1
+                            server.max_active = max(server.max_active, server.active)
+                        thread = threading.Thread(target=reply, args=(event.stream_id, paths.pop(event.stream_id)))
+                        thread.daemon = True
+                        thread.start()
+                sock.sendall(conn.data_to_send())
+
+class H2StubServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """ The stub API over cleartext HTTP/2 with prior knowledge. Besides the
+    status counts it records how many `connections` were opened and the
+    most streams answered at once (`max_active`). """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+    def __init__(self, port=0, latency=0, error_rate=0, throttle_rate=0, retry_after=0,
+            max_concurrent_streams=100):
+        socketserver.TCPServer.__init__(self, ('127.0.0.1', port), H2StubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.max_concurrent_streams = max_concurrent_streams
+        self.counts = {}
+        self.connections = 0
+        self.active = self.max_active = 0
+        self.lock = threading.Lock()
+
+    url = StubServer.url
+    start = StubServer.start
+    stop = StubServer.stop
+
+def serve_in_process(http2=False, **options):
+    """ Run a StubServer (or with `http2`, an H2StubServer) in a child process
+    so that it doesn't share the benchmark's CPU time or GIL. Returns
+    (process, url). """
+    import multiprocessing
+
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve, args=(child, http2, options))
+    process.daemon = True
+    process.start()
+    return process, parent.recv()
+
+def _serve(conn, http2, options):
+    server = (H2StubServer if http2 else StubServer)(**options)
+    conn.send(server.url)
+    server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.stub')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help='seconds to wait before replying')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of calls answered with 500')
+    parser.add_argument('--throttle-rate', type=float, default=0, help='fraction of calls answered with 429')
+    parser.add_argument('--retry-after', type=int, default=0, help='Retry-After sent with each 429')
+    parser.add_argument('--http2', action='store_true', help='speak HTTP/2 with prior knowledge')
+    args = parser.parse_args(argv)
+
+    server = (H2StubServer if args.http2 else StubServer)(
+        args.port, args.latency, args.error_rate, args.throttle_rate, args.retry_after)
+    sys.stdout.write('Serving the stub Outbound API at %s\n' % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
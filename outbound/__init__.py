@@ -1,38 +1,121 @@
-import sys
-import json
-from numbers import Number
-import time
+from . import serializers
+from . import version
+from .adaptive import AdaptiveLimit
+from .buffer import QueueFull
+from .client import Client, ClientRegistry
+from .errors import (
+    ERROR_INIT, ERROR_USER_ID, ERROR_EVENT_NAME, ERROR_CONNECTION, ERROR_UNKNOWN,
+    ERROR_TOKEN, ERROR_CAMPAIGN_IDS, ERROR_PREVIOUS_ID, ERROR_QUEUE_FULL,
+    ERROR_CIRCUIT_OPEN, ERROR_RATE_LIMITED, ERROR_TIMEOUT, ERROR_RESPONSE_TIMEOUT,
+    error_message,
+)
+from .metrics import Metrics
+from .payload import identify_payload, track_payload, record_payload
+from .ratelimit import RateLimiter
+from .retry import RetryPolicy
+
+__CLIENT = None
 
-import requests
-import six
+APNS = "apns"
+GCM = "gcm"
 
-from . import version
+def init(key, **options):
+    """ Initialize the library with your Outbound API key.
 
-__BASE_URL = "https://api.outbound.io/v2"
-__HEADERS = None
+    A pooled, keep-alive HTTP session is created here and shared by every API
+    call so that connections (and their TLS handshakes) are reused between
+    events. Calling init() again replaces and closes the previous client.
 
-ERROR_INIT = 1
-ERROR_USER_ID = 2
-ERROR_EVENT_NAME = 3
-ERROR_CONNECTION = 4
-ERROR_UNKNOWN = 5
-ERROR_TOKEN = 6
-ERROR_CAMPAIGN_IDS = 7
-ERROR_PREVIOUS_ID = 2
+    :param str key: your Outbound API key.
 
-APNS = "apns"
-GCM = "gcm"
+    Keyword arguments configure the client, e.g. buffering, spooling, retries,
+    compression and metrics. See outbound.Client for the full list.
+    """
+    global __CLIENT
+    client, previous = Client(key, **options), __CLIENT
+    __CLIENT = client
+    if previous is not None:
+        previous.close()
+        metrics = previous.metrics
+        if metrics is not None and metrics is not client.metrics:
+            metrics.close()
+
+def default_client():
+    """ The default client created by init(), or None if init() has not been
+    called or close() has been called since.
+    """
+    return __CLIENT
 
-def __is_init():
-    return __HEADERS != None
+def flush(timeout=None):
+    """ In buffered mode, send all queued calls and wait for them to resolve.
+    Does nothing otherwise.
 
-def init(key):
-    global __HEADERS
-    __HEADERS = {
-        'content-type': 'application/json',
-        'X-Outbound-Client': 'Python/{0}'.format(version.VERSION),
-        'X-Outbound-Key': key,
-    }
+    :param float timeout: OPTIONAL the maximum number of seconds to wait.
+
+    :returns: True if every queued call was sent.
+    """
+    client = __CLIENT
+    if client is None:
+        return True
+    return client.flush(timeout)
+
+def stats():
+    """ Take a snapshot of the metrics enabled with init(metrics=...).
+
+    :returns: a dictionary described in outbound.metrics, or None if metrics
+    are not enabled.
+    """
+    client = __CLIENT
+    if client is None:
+        return None
+    return client.stats()
+
+def identify_cache_stats():
+    """ Report how effective the cache enabled with init(identify_cache_size=...)
+    has been.
+
+    :returns: a dictionary with the number of identify() calls suppressed
+    (`hits`), the number sent (`misses`) and the number of users currently
+    cached (`size`).
+    """
+    client = __CLIENT
+    if client is None:
+        return dict(hits=0, misses=0, size=0)
+    return client.identify_cache_stats()
+
+def token_cache_stats():
+    """ Report how effective the cache enabled with init(token_cache_size=...)
+    has been.
+
+    :returns: a dictionary with the number of register_token() and
+    disable_token() calls suppressed (`hits`), the number sent (`misses`) and
+    the number of (platform, user) pairs currently cached (`size`).
+    """
+    client = __CLIENT
+    if client is None:
+        return dict(hits=0, misses=0, size=0)
+    return client.token_cache_stats()
+
+def replay_spool():
+    """ Send every call in the spool configured with init(spool_dir=...) and
+    wait for them to complete. Replay stops early if Outbound is unreachable.
+
+    :returns: the number of calls replayed.
+    """
+    client = __CLIENT
+    if client is None:
+        return 0
+    return client.replay_spool()
+
+def close():
+    """ Drain any queued calls and close the pooled HTTP session created by
+    init(). Any further API calls will fail with ERROR_INIT until init() is
+    called again.
+    """
+    global __CLIENT
+    client, __CLIENT = __CLIENT, None
+    if client is not None:
+        client.close()
 
 def unsubscribe(user_id, from_all=False, campaign_ids=None, on_error=None, on_success=None):
     """ Unsubscribe a user from some or all campaigns.
@@ -52,14 +135,7 @@ def unsubscribe(user_id, from_all=False, campaign_ids=None, on_error=None, on_su
     :param func on_success: An optional function to call if/when the API call succeeds.
     on_success callback takes no parameters.
     """
-    __subscription(
-        user_id,
-        unsubscribe=True,
-        all_campaigns=from_all,
-        campaign_ids=campaign_ids,
-        on_error=on_error,
-        on_success=on_success,
-    )
+    __call('unsubscribe', user_id, from_all, campaign_ids, on_error=on_error, on_success=on_success)
 
 def subscribe(user_id, to_all=False, campaign_ids=None, on_error=None, on_success=None):
     """ Resubscribe a user to some or all campaigns.
@@ -79,14 +155,7 @@ def subscribe(user_id, to_all=False, campaign_ids=None, on_error=None, on_succes
     :param func on_success: An optional function to call if/when the API call succeeds.
     on_success callback takes no parameters.
     """
-    __subscription(
-        user_id,
-        unsubscribe=False,
-        all_campaigns=to_all,
-        campaign_ids=campaign_ids,
-        on_error=on_error,
-        on_success=on_success,
-    )
+    __call('subscribe', user_id, to_all, campaign_ids, on_error=on_error, on_success=on_success)
 
 def disable_all_tokens(platform, user_id, on_error=None, on_success=None):
     """ Disable ALL device tokens for the given user on the specified platform.
@@ -105,7 +174,7 @@ def disable_all_tokens(platform, user_id, on_error=None, on_success=None):
     :param func on_success: An optional function to call if/when the API call succeeds.
     on_success callback takes no parameters.
     """
-    __device_token(platform, False, user_id, all=True, on_error=on_error, on_success=on_success)
+    __call('disable_all_tokens', platform, user_id, on_error=on_error, on_success=on_success)
 
 def disable_token(platform, user_id, token, on_error=None, on_success=None):
     """ Disable a device token for a user.
@@ -126,7 +195,7 @@ def disable_token(platform, user_id, token, on_error=None, on_success=None):
     :param func on_success: An optional function to call if/when the API call succeeds.
     on_success callback takes no parameters.
     """
-    __device_token(platform, False, user_id, token=token, on_error=on_error, on_success=on_success)
+    __call('disable_token', platform, user_id, token, on_error=on_error, on_success=on_success)
 
 def register_token(platform, user_id, token, on_error=None, on_success=None):
     """ Register a device token for a user.
@@ -147,7 +216,7 @@ def register_token(platform, user_id, token, on_error=None, on_success=None):
     :param func on_success: An optional function to call if/when the API call succeeds.
     on_success callback takes no parameters.
     """
-    __device_token(platform, True, user_id, token=token, on_error=on_error, on_success=on_success)
+    __call('register_token', platform, user_id, token, on_error=on_error, on_success=on_success)
 
 def alias(user_id, previous_id, on_error=None, on_success=None):
     """ Alias one user id to another.
@@ -165,36 +234,7 @@ def alias(user_id, previous_id, on_error=None, on_success=None):
     :param func on_success: An optional function to call if/when the API call succeeds.
     on_success callback takes no parameters.
     """
-    if not __is_init():
-        on_error(ERROR_INIT, __error_message(ERROR_INIT))
-        return
-
-    if not isinstance(user_id, six.string_types + (Number,)):
-        on_error(ERROR_USER_ID, __error_message(ERROR_USER_ID))
-        return
-
-    if not isinstance(previous_id, six.string_types + (Number,)):
-        on_error(ERROR_PREVIOUS_ID, __error_message(ERROR_PREVIOUS_ID))
-        return
-
-    data = dict(
-        user_id=user_id,
-        previous_id=previous_id,
-    )
-
-    try:
-        resp = requests.post(
-            "%s/identify" % __BASE_URL,
-            data=json.dumps(data),
-            headers=__HEADERS,
-        )
-
-        if resp.status_code >= 200 and resp.status_code < 400:
-            on_success()
-        else:
-            on_error(ERROR_UNKNOWN, resp.text)
-    except requests.exceptions.ConnectionError:
-        on_error(ERROR_CONNECTION, __error_message(ERROR_CONNECTION))
+    __call('alias', user_id, previous_id, on_error=on_error, on_success=on_success)
 
 def identify(user_id, previous_id=None, group_id=None, group_attributes=None,
             first_name=None, last_name=None, email=None,
@@ -238,44 +278,9 @@ def identify(user_id, previous_id=None, group_id=None, group_attributes=None,
     :param func on_success: An optional function to call if/when the API call succeeds.
     on_success callback takes no parameters.
     """
-
-    on_error = on_error or __on_error
-    on_success = on_success or __on_success
-
-    if not __is_init():
-        on_error(ERROR_INIT, __error_message(ERROR_INIT))
-        return
-
-    if not isinstance(user_id, six.string_types + (Number,)):
-        on_error(ERROR_USER_ID, __error_message(ERROR_USER_ID))
-        return
-
-    data = __user(
-        first_name,
-        last_name,
-        email,
-        phone_number,
-        apns_tokens,
-        gcm_tokens,
-        attributes,
-        previous_id,
-        group_id,
-        group_attributes,)
-    data['user_id'] = user_id
-
-    try:
-        resp = requests.post(
-            "%s/identify" % __BASE_URL,
-            data=json.dumps(data),
-            headers=__HEADERS,
-        )
-
-        if resp.status_code >= 200 and resp.status_code < 400:
-            on_success()
-        else:
-            on_error(ERROR_UNKNOWN, resp.text)
-    except requests.exceptions.ConnectionError:
-        on_error(ERROR_CONNECTION, __error_message(ERROR_CONNECTION))
+    __call('identify', user_id, previous_id, group_id, group_attributes,
+        first_name, last_name, email, phone_number, apns_tokens, gcm_tokens,
+        attributes, on_error=on_error, on_success=on_success)
 
 def track(user_id, event, first_name=None, last_name=None, email=None,
         phone_number=None, apns_tokens=None, gcm_tokens=None,
@@ -316,202 +321,171 @@ def track(user_id, event, first_name=None, last_name=None, email=None,
     :param func on_success: An optional function to call if/when the API call succeeds.
     on_success callback takes no parameters.
     """
+    __call('track', user_id, event, first_name, last_name, email,
+        phone_number, apns_tokens, gcm_tokens, user_attributes, properties,
+        on_error=on_error, on_success=on_success, timestamp=timestamp)
 
-    on_error = on_error or __on_error
-    on_success = on_success or __on_success
+def identify_many(records, concurrency=4, chunk_size=100):
+    """ Identify many users, e.g. for a backfill.
 
-    if not __is_init():
-        on_error(ERROR_INIT, __error_message(ERROR_INIT))
-        return
+    Records are read lazily from `records`, validated and sent `chunk_size` at
+    a time over up to `concurrency` connections, so memory use stays bounded
+    however long the input is. Nothing is sent until the returned iterator is
+    consumed.
 
-    if not isinstance(user_id, six.string_types + (Number,)):
-        on_error(ERROR_USER_ID, __error_message(ERROR_USER_ID))
-        return
-    if not isinstance(event, six.string_types):
-        on_error(ERROR_EVENT_NAME, __error_message(ERROR_EVENT_NAME))
-        return
+    :param iterable records: dictionaries of keyword arguments for identify(),
+    without on_error or on_success. A record without user_id fails with
+    ERROR_USER_ID, and one with an unknown key with ERROR_UNKNOWN.
 
-    data = dict(user_id=user_id, event=event)
-    user = __user(
-        first_name,
-        last_name,
-        email,
-        phone_number,
-        apns_tokens,
-        gcm_tokens,
-        user_attributes,
-        None, None, None)
-    if user:
-        data['user'] = user
-
-    if properties:
-        if isinstance(properties, dict):
-            if len(properties) > 0:
-                data['properties'] = properties
-        else:
-            sys.stderr.write('Invalid event properties given. Expected dictionary. ' +
-                        'Got %s' % type(properties).__name__)
-
-    if timestamp:
-        data['timestamp'] = timestamp
-    else:
-        data['timestamp'] = int(time.time())
-
-    try:
-        resp = requests.post(
-            "%s/track" % __BASE_URL,
-            data=json.dumps(data),
-            headers=__HEADERS,
-        )
-
-        if resp.status_code >= 200 and resp.status_code < 400:
-            on_success()
-        else:
-            on_error(ERROR_UNKNOWN, resp.text)
-    except requests.exceptions.ConnectionError:
-        on_error(ERROR_CONNECTION, __error_message(ERROR_CONNECTION))
-
-def __subscription(user_id, unsubscribe, all_campaigns=False, campaign_ids=None, on_error=None, on_success=None):
-    on_error = on_error or __on_error
-    on_success = on_success or __on_success
-
-    if not __is_init():
-        on_error(ERROR_INIT, __error_message(ERROR_INIT))
-        return
+    :param int concurrency: OPTIONAL the number of calls sent in parallel.
 
-    if not isinstance(user_id, six.string_types + (Number,)):
-        on_error(ERROR_USER_ID, __error_message(ERROR_USER_ID))
-        return
+    :param int chunk_size: OPTIONAL the number of records read ahead.
 
-    if not all_campaigns and (not isinstance(campaign_ids, (list, tuple)) or len(campaign_ids) == 0):
-        on_error(ERROR_TOKEN, __error_message(ERROR_CAMPAIGN_IDS))
-        return
+    :returns: an iterator of (index, code, error) tuples, one for each record
+    that failed, in input order. `code` will be one of outbound.ERROR_XXXXXX
+    and `error` the corresponding message.
+    """
+    client = __CLIENT
+    if client is None:
+        return __not_initialized(identify_payload, records)
+    return client.identify_many(records, concurrency, chunk_size)
 
-    url = '/'.join([__BASE_URL, ('unsubscribe' if unsubscribe else 'subscribe'), ('all' if all_campaigns else 'campaigns')])
-    data = dict(
-        user_id=user_id,
-    )
-
-    if not all_campaigns:
-        data['campaign_ids'] = campaign_ids
-
-    try:
-        print __HEADERS
-        resp = requests.post(
-            url,
-            data=json.dumps(data),
-            headers=__HEADERS,
-        )
-
-        if resp.status_code >= 200 and resp.status_code < 400:
-            on_success()
-        else:
-            on_error(ERROR_UNKNOWN, resp.text)
-    except requests.exceptions.ConnectionError:
-        on_error(ERROR_CONNECTION, __error_message(ERROR_CONNECTION))
-
-def __device_token(platform, register, user_id, token='', all=False, on_error=None, on_success=None):
-    on_error = on_error or __on_error
-    on_success = on_success or __on_success
-
-    if not __is_init():
-        on_error(ERROR_INIT, __error_message(ERROR_INIT))
-        return
+def track_many(records, concurrency=4, chunk_size=100):
+    """ Track many events, e.g. for a backfill.
 
-    if not isinstance(user_id, six.string_types + (Number,)):
-        on_error(ERROR_USER_ID, __error_message(ERROR_USER_ID))
-        return
+    Records are read lazily from `records`, validated and sent `chunk_size` at
+    a time over up to `concurrency` connections, so memory use stays bounded
+    however long the input is. Nothing is sent until the returned iterator is
+    consumed.
+
+    :param iterable records: dictionaries of keyword arguments for track(),
+    without on_error or on_success. A record without user_id or event fails
+    with ERROR_USER_ID or ERROR_EVENT_NAME, and one with an unknown key with
+    ERROR_UNKNOWN.
+
+    :param int concurrency: OPTIONAL the number of calls sent in parallel.
+
+    :param int chunk_size: OPTIONAL the number of records read ahead.
+
+    :returns: an iterator of (index, code, error) tuples, one for each record
+    that failed, in input order. `code` will be one of outbound.ERROR_XXXXXX
+    and `error` the corresponding message.
+    """
+    client = __CLIENT
+    if client is None:
+        return __not_initialized(track_payload, records)
+    return client.track_many(records, concurrency, chunk_size)
+
+def unsubscribe_many(items, concurrency=4, chunk_size=1000):
+    """ Unsubscribe many users, e.g. for a compliance sweep.
+
+    Items are read lazily, `chunk_size` at a time, and each user's items in a
+    chunk are merged into a single call, so repeated items are sent once.
+    Calls are sent over up to `concurrency` connections.
+
+    :param iterable items: (user_id, campaign_ids) pairs. campaign_ids is a list
+    of campaign IDs, or None to unsubscribe the user from all campaigns. An
+    item that isn't a pair fails with ERROR_UNKNOWN, and one without campaigns
+    with ERROR_TOKEN, as in subscribe().
+
+    :param int concurrency: OPTIONAL the number of calls sent in parallel.
+
+    :param int chunk_size: OPTIONAL the number of items read ahead, and
+    deduplicated and grouped together.
+
+    :returns: an iterator of (index, code, error) tuples, one for every item, in
+    input order. `code` is None if the item's call succeeded, otherwise one of
+    outbound.ERROR_XXXXXX with `error` the corresponding message.
+    """
+    return __send_many('unsubscribe_many', items, concurrency, chunk_size)
+
+def subscribe_many(items, concurrency=4, chunk_size=1000):
+    """ Resubscribe many users.
+
+    Items are read lazily, `chunk_size` at a time, and each user's items in a
+    chunk are merged into a single call, so repeated items are sent once.
+    Calls are sent over up to `concurrency` connections.
+
+    :param iterable items: (user_id, campaign_ids) pairs. campaign_ids is a list
+    of campaign IDs, or None to resubscribe the user to all campaigns. An
+    item that isn't a pair fails with ERROR_UNKNOWN, and one without campaigns
+    with ERROR_TOKEN, as in subscribe().
+
+    :param int concurrency: OPTIONAL the number of calls sent in parallel.
+
+    :param int chunk_size: OPTIONAL the number of items read ahead, and
+    deduplicated and grouped together.
 
-    if not all and not isinstance(token, six.string_types):
-        on_error(ERROR_TOKEN, __error_message(ERROR_TOKEN))
+    :returns: an iterator of (index, code, error) tuples, one for every item, in
+    input order. `code` is None if the item's call succeeded, otherwise one of
+    outbound.ERROR_XXXXXX with `error` the corresponding message.
+    """
+    return __send_many('subscribe_many', items, concurrency, chunk_size)
+
+def register_token_many(items, concurrency=4, chunk_size=1000):
+    """ Register many device tokens.
+
+    Items are read lazily, `chunk_size` at a time. Repeated items in a chunk
+    are sent once, and calls are grouped by platform and sent over up to
+    `concurrency` connections.
+
+    :param iterable items: (platform, user_id, token) tuples. An item of any
+    other shape fails with ERROR_UNKNOWN.
+
+    :param int concurrency: OPTIONAL the number of calls sent in parallel.
+
+    :param int chunk_size: OPTIONAL the number of items read ahead, and
+    deduplicated and grouped together.
+
+    :returns: an iterator of (index, code, error) tuples, one for every item, in
+    input order. `code` is None if the item's call succeeded, otherwise one of
+    outbound.ERROR_XXXXXX with `error` the corresponding message.
+    """
+    return __send_many('register_token_many', items, concurrency, chunk_size)
+
+def disable_token_many(items, concurrency=4, chunk_size=1000):
+    """ Disable many device tokens, e.g. after a push feedback sweep.
+
+    Items are read lazily, `chunk_size` at a time. Repeated items in a chunk
+    are sent once, and calls are grouped by platform and sent over up to
+    `concurrency` connections. Disabling all of a user's tokens on a platform
+    covers any of their single tokens disabled in the same chunk.
+
+    :param iterable items: (platform, user_id, token) tuples. A token of None
+    disables all of the user's tokens on that platform. An item of any other
+    shape fails with ERROR_UNKNOWN.
+
+    :param int concurrency: OPTIONAL the number of calls sent in parallel.
+
+    :param int chunk_size: OPTIONAL the number of items read ahead, and
+    deduplicated and grouped together.
+
+    :returns: an iterator of (index, code, error) tuples, one for every item, in
+    input order. `code` is None if the item's call succeeded, otherwise one of
+    outbound.ERROR_XXXXXX with `error` the corresponding message.
+    """
+    return __send_many('disable_token_many', items, concurrency, chunk_size)
+
+def __call(method, *args, **kwargs):
+    client = __CLIENT
+    if client is None:
+        on_error = kwargs.get('on_error') or __on_error
+        on_error(ERROR_INIT, error_message(ERROR_INIT))
         return
+    getattr(client, method)(*args, **kwargs)
 
-    try:
-        data = dict(
-            user_id=user_id,
-        )
-        if all:
-            data["all"] = True
-        else:
-            data["token"] = token
-
-        resp = requests.post(
-            "%s/%s/%s" % (__BASE_URL, platform, 'register' if register else 'disable'),
-            data=json.dumps(data),
-            headers=__HEADERS,
-        )
-
-        if resp.status_code >= 200 and resp.status_code < 400:
-            on_success()
-        else:
-            on_error(ERROR_UNKNOWN, resp.text)
-    except requests.exceptions.ConnectionError:
-        on_error(ERROR_CONNECTION, __error_message(ERROR_CONNECTION))
-
-def __user(first_name, last_name, email, phone_number, apns_tokens,
-        gcm_tokens, attributes, previous_id, group_id, group_attributes):
-
-    data = dict()
-    if previous_id:
-        data['previous_id'] = previous_id
-    if group_id:
-        data['group_id'] = group_id
-    if group_attributes:
-        if isinstance(group_attributes, dict):
-            if len(group_attributes) > 0:
-                data['group_attributes'] = group_attributes
-        else:
-            sys.stderr.write('Invalid group attributes given. Expected dictionary. ' +
-                        'Got %s' % type(group_attributes).__name__)
-    if first_name:
-        data['first_name'] = first_name
-    if last_name:
-        data['last_name'] = last_name
-    if email:
-        data['email'] = email
-    if phone_number:
-        data['phone_number'] = phone_number
-    if apns_tokens:
-        if isinstance(apns_tokens, six.string_types):
-            apns_tokens = [apns_tokens]
-        if isinstance(apns_tokens, (list, tuple)):
-            data['apns'] = apns_tokens
-        else:
-            sys.stderr.write('Invalid APNS tokens given. Expected string or ' +
-                        'list of strings. Got %s' % type(apns_tokens).__name__)
-    if gcm_tokens:
-        if isinstance(gcm_tokens, six.string_types):
-            gcm_tokens = [gcm_tokens]
-        if isinstance(gcm_tokens, (list, tuple)):
-            data['gcm'] = gcm_tokens
-        else:
-            sys.stderr.write('Invalid GCM tokens given. Expected string or ' +
-                        'list of strings. Got %s' % type(gcm_tokens).__name__)
-
-    if attributes:
-        if isinstance(attributes, dict):
-            if len(attributes) > 0:
-                data['attributes'] = attributes
-        else:
-            sys.stderr.write('Invalid user attributes given. Expected dictionary. ' +
-                        'Got %s' % type(attributes).__name__)
-
-    return data
-
-def __error_message(code):
-    return {
-        ERROR_INIT: "init() must be called before identifying any users.",
-        ERROR_USER_ID: "User ID must be a string or a number.",
-        ERROR_EVENT_NAME: "Event name must be a string.",
-        ERROR_CONNECTION: "Unable to connect to Outbound.",
-        ERROR_UNKNOWN: "Unknown error occurred.",
-        ERROR_TOKEN: "Token must be a string.",
-        ERROR_CAMPAIGN_IDS: "One or more campaigns must be specified.",
-        ERROR_PREVIOUS_ID: "Previous must be a string or a number.",
-    }.get(code, "Unknown error")
+def __send_many(method, items, concurrency, chunk_size):
+    client = __CLIENT
+    if client is None:
+        return ((index, ERROR_INIT, error_message(ERROR_INIT)) for index, _ in enumerate(items))
+    return getattr(client, method)(items, concurrency, chunk_size)
 
-def __on_error(code, err):
-    pass
+def __not_initialized(build, records):
+    for index, record in enumerate(records):
+        code, _, error = record_payload(build, record)
+        if not code:
+            code, error = ERROR_INIT, None
+        yield index, code, error or error_message(code)
 
-def __on_success():
+def __on_error(code, err):
     pass
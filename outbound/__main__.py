@@ -0,0 +1,81 @@
+""" Command line tools.
+
+    python -m outbound import FILE --key API_KEY [--identify] [--map FIELD=COLUMN ...]
+
+See outbound.importer.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+def main(argv=None):
+    from . import importer
+
+    parser = argparse.ArgumentParser(prog='python -m outbound')
+    commands = parser.add_subparsers(dest='command')
+    imports = commands.add_parser('import', help='send a track or identify call for every record in a file')
+    imports.add_argument('path', help='the NDJSON or CSV file to import')
+    imports.add_argument('--key', default=os.environ.get('OUTBOUND_KEY'),
+        help='your Outbound API key, defaulting to $OUTBOUND_KEY')
+    imports.add_argument('--identify', dest='kind', action='store_const', const=importer.IDENTIFY,
+        default=importer.TRACK, help='import users rather than events')
+    imports.add_argument('--format', choices=(importer.NDJSON, importer.CSV),
+        help='the file format, by default guessed from its extension')
+    imports.add_argument('--map', action='append', default=[], metavar='FIELD=COLUMN',
+        help='read a track or identify argument from a differently named column')
+    imports.add_argument('--workers', type=int, default=4, help='the number of batches sent at once')
+    imports.add_argument('--processes', action='store_true',
+        help='send batches from worker processes rather than threads')
+    imports.add_argument('--concurrency', type=int, default=4,
+        help='the number of requests each worker has in flight')
+    imports.add_argument('--batch-size', type=int, default=4 * 1024 * 1024,
+        help='the approximate number of bytes per batch')
+    imports.add_argument('--checkpoint', help='a file to record progress in and resume from')
+    imports.add_argument('--errors', help='a file to append failed records to, as NDJSON')
+    imports.add_argument('--base-url', help='the Outbound API root')
+    args = parser.parse_args(argv)
+
+    if args.command != 'import':
+        parser.print_usage()
+        return 2
+    if not args.key:
+        parser.error('--key or $OUTBOUND_KEY is required')
+    try:
+        mapping = dict(item.split('=', 1) for item in args.map)
+    except ValueError:
+        parser.error('--map takes FIELD=COLUMN')
+    unknown = sorted(set(mapping) - set(importer.FIELDS[args.kind]))
+    if unknown:
+        parser.error('--map: unknown %s field %s' % (args.kind, ', '.join(unknown)))
+
+    errors = open(args.errors, 'a') if args.errors else None
+    def on_failure(offset, code, error):
+        if errors is not None:
+            errors.write(json.dumps(dict(offset=offset, code=code, error=error)) + '\n')
+
+    last = [0]
+    def progress(report):
+        if time.time() - last[0] >= 1 or report['offset'] == report['size']:
+            last[0] = time.time()
+            sys.stderr.write('%5.1f%%  %d records  %d failed  %.0f records/s  %.1f MB/s\n' % (
+                100.0 * report['offset'] / report['size'], report['records'], report['failed'],
+                report['records_per_second'], report['bytes_per_second'] / 1e6))
+
+    try:
+        report = importer.import_file(args.path, args.key, kind=args.kind, format=args.format,
+            mapping=mapping, workers=args.workers, processes=args.processes,
+            concurrency=args.concurrency, batch_size=args.batch_size,
+            checkpoint=args.checkpoint, progress=progress, on_failure=on_failure,
+            base_url=args.base_url)
+    finally:
+        if errors is not None:
+            errors.close()
+
+    sys.stdout.write('Imported %d records in %.1f seconds, %d failed.\n' % (
+        report['records'], report['elapsed'], report['failed']))
+    return 1 if report['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
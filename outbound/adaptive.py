@@ -0,0 +1,128 @@
+import threading
+import time
+
+from . import fork
+
+class AdaptiveLimit(object):
+    """ Adjusts how many requests a client has in flight, and how many items
+    bulk calls such as track_many read and dispatch per round, to what
+    Outbound can currently take (additive increase, multiplicative decrease).
+
+    Each request waits for a free slot under `limit`. Every response that
+    comes back healthy raises `limit` by about one per round trip and
+    `batch_size` by `batch_step` per round trip. A request that is throttled
+    (429 or a Retry-After header), fails (a timeout, connection error or 5xx)
+    or takes more than `latency_tolerance` times the recent average latency
+    multiplies both by `backoff`, at most once per average round trip.
+
+    Pass one to Client(concurrency_limit=...). Its current values are read
+    with snapshot(), and reported as gauges when the client has metrics.
+
+    :param int initial_limit: OPTIONAL the number of requests in flight to
+    start with.
+
+    :param int min_limit: OPTIONAL the lowest the limit is cut to.
+
+    :param int max_limit: OPTIONAL the highest the limit is raised to. Bulk
+    calls use this many threads.
+
+    :param int initial_batch_size: OPTIONAL the bulk batch size to start with.
+
+    :param int min_batch_size: OPTIONAL the smallest bulk batch size.
+
+    :param int max_batch_size: OPTIONAL the largest bulk batch size.
+
+    :param int batch_step: OPTIONAL how much the batch size grows per round
+    trip.
+
+    :param float backoff: OPTIONAL the factor, between 0 and 1, the limit and
+    batch size are multiplied by on a cut.
+
+    :param float latency_tolerance: OPTIONAL how many times the average
+    latency a response may take before counting as a congestion signal.
+
+    :param float smoothing: OPTIONAL the weight, between 0 and 1, of each new
+    latency in the moving average.
+    """
+
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=64,
+            initial_batch_size=100, min_batch_size=10, max_batch_size=1000, batch_step=10,
+            backoff=0.5, latency_tolerance=2.0, smoothing=0.1):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.batch_step = batch_step
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+
+        self.limit = float(initial_limit)
+        self.batch_size = float(initial_batch_size)
+        self.latency = None
+        self.in_flight = 0
+        self.cuts = 0
+
+        self._cond = threading.Condition()
+        self._cut_at = 0
+        fork.register(self)
+
+    def acquire(self, timeout=None):
+        """ Wait for a slot to send a request in. Returns False if none was
+        free within `timeout` seconds. """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, latency, status=None, retry_after=None):
+        """ Free a slot, adjusting the limits for a request that took
+        `latency` seconds and got `status` (None if it timed out or could not
+        connect). """
+        now = time.time()
+        with self._cond:
+            self.in_flight -= 1
+            average = self.latency
+            if status is not None and status < 500:
+                self.latency = latency if average is None else (
+                    average + self.smoothing * (latency - average))
+
+            if (status is None or status == 429 or status >= 500 or retry_after is not None or
+                    (average is not None and latency > self.latency_tolerance * average)):
+                if now - self._cut_at >= (average or 0):
+                    self._cut_at = now
+                    self.cuts += 1
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self.batch_size = max(self.min_batch_size, self.batch_size * self.backoff)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                self.batch_size = min(self.max_batch_size, self.batch_size + float(self.batch_step) / self.limit)
+            self._cond.notify_all()
+
+    def cancel(self):
+        """ Free a slot without adjusting the limits, for a request that was
+        not sent after all. """
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """ The current limits, as a dictionary with `limit`, `batch_size`,
+        `in_flight`, the average `latency` in seconds and the number of `cuts`
+        made so far. """
+        with self._cond:
+            return dict(limit=int(self.limit), batch_size=int(self.batch_size),
+                in_flight=self.in_flight, latency=self.latency, cuts=self.cuts)
+
+    def _after_fork(self):
+        # Requests in flight belong to the parent.
+        self._cond = threading.Condition()
+        self.in_flight = 0
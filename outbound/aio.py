@@ -0,0 +1,170 @@
+""" asyncio client for the Outbound API (Python 3.5+, requires aiohttp).
+
+Each method is a coroutine taking the same arguments as its module level
+counterpart in `outbound`, running the same validation and reporting errors
+with the same outbound.ERROR_XXXXXX codes. Calls share one aiohttp connection
+pool per client, and a semaphore bounds how many may be in flight at once.
+
+    client = outbound.aio.Client(key)
+    await client.track(user_id, 'signed up')
+    await client.close()
+"""
+import asyncio
+
+import aiohttp
+
+from . import serializers
+from . import version
+from .errors import ERROR_CONNECTION, ERROR_UNKNOWN, ERROR_RESPONSE_TIMEOUT, error_message
+from .payload import (
+    alias_payload, identify_payload, track_payload, subscription_payload,
+    device_token_payload,
+)
+
+BASE_URL = "https://api.outbound.io/v2"
+
+# Raised by aiohttp 3.10+ when a connection can't be made in time, so nothing
+# was sent. Older versions don't tell the two kinds of timeout apart.
+_CONNECT_TIMEOUT = getattr(aiohttp, 'ConnectionTimeoutError', ())
+
+class Client(object):
+    """ An Outbound API client for use from asyncio code.
+
+    :param str key: your Outbound API key.
+
+    :param str base_url: OPTIONAL the API root to send requests to.
+
+    :param int pool_maxsize: OPTIONAL the maximum number of connections kept
+    open to the API.
+
+    :param int concurrency: OPTIONAL the maximum number of calls in flight at
+    once. Further calls wait for a slot.
+
+    :param float timeout: OPTIONAL the number of seconds to wait for Outbound
+    to connect and to respond. A call that times out after being sent fails
+    with ERROR_RESPONSE_TIMEOUT, as it may have been processed.
+
+    :param func serializer: OPTIONAL a function taking a request payload and
+    returning its JSON encoding as bytes. See outbound.serializers.
+    """
+
+    def __init__(self, key, base_url=None, pool_maxsize=100, concurrency=1000,
+            timeout=10, serializer=None):
+        self.base_url = (base_url or BASE_URL).rstrip('/')
+        self.pool_maxsize = pool_maxsize
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.serializer = serializer or serializers.default()
+        self.headers = {
+            'content-type': 'application/json',
+            'X-Outbound-Client': 'Python/{0}'.format(version.VERSION),
+            'X-Outbound-Key': key,
+        }
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """ Close the client's connection pool. """
+        session, self._session = self._session, None
+        if session is not None:
+            await session.close()
+
+    async def unsubscribe(self, user_id, from_all=False, campaign_ids=None, on_error=None, on_success=None):
+        """ Unsubscribe a user from some or all campaigns. See outbound.unsubscribe. """
+        return await self._send(
+            subscription_payload(user_id, True, from_all, campaign_ids),
+            on_error, on_success)
+
+    async def subscribe(self, user_id, to_all=False, campaign_ids=None, on_error=None, on_success=None):
+        """ Resubscribe a user to some or all campaigns. See outbound.subscribe. """
+        return await self._send(
+            subscription_payload(user_id, False, to_all, campaign_ids),
+            on_error, on_success)
+
+    async def disable_all_tokens(self, platform, user_id, on_error=None, on_success=None):
+        """ Disable ALL device tokens for a user. See outbound.disable_all_tokens. """
+        return await self._send(
+            device_token_payload(platform, False, user_id, all=True),
+            on_error, on_success)
+
+    async def disable_token(self, platform, user_id, token, on_error=None, on_success=None):
+        """ Disable a device token for a user. See outbound.disable_token. """
+        return await self._send(
+            device_token_payload(platform, False, user_id, token=token),
+            on_error, on_success)
+
+    async def register_token(self, platform, user_id, token, on_error=None, on_success=None):
+        """ Register a device token for a user. See outbound.register_token. """
+        return await self._send(
+            device_token_payload(platform, True, user_id, token=token),
+            on_error, on_success)
+
+    async def alias(self, user_id, previous_id, on_error=None, on_success=None):
+        """ Alias one user id to another. See outbound.alias. """
+        return await self._send(alias_payload(user_id, previous_id), on_error, on_success)
+
+    async def identify(self, user_id, previous_id=None, group_id=None, group_attributes=None,
+                first_name=None, last_name=None, email=None,
+                phone_number=None, apns_tokens=None, gcm_tokens=None,
+                attributes=None, on_error=None, on_success=None):
+        """ Identify a user. See outbound.identify. """
+        return await self._send(
+            identify_payload(user_id, previous_id, group_id, group_attributes,
+                first_name, last_name, email, phone_number, apns_tokens,
+                gcm_tokens, attributes),
+            on_error, on_success)
+
+    async def track(self, user_id, event, first_name=None, last_name=None, email=None,
+            phone_number=None, apns_tokens=None, gcm_tokens=None,
+            user_attributes=None, properties=None, on_error=None, on_success=None, timestamp=None):
+        """ Track an event for a user. See outbound.track. """
+        return await self._send(
+            track_payload(user_id, event, first_name, last_name, email,
+                phone_number, apns_tokens, gcm_tokens, user_attributes,
+                properties, timestamp),
+            on_error, on_success)
+
+    async def _send(self, payload, on_error, on_success):
+        code, path, data = payload
+        if code:
+            error = data or error_message(code)
+        else:
+            code, error = await self._post("%s/%s" % (self.base_url, path), self.serializer(data))
+
+        if code:
+            if on_error:
+                on_error(code, error)
+            return False
+        if on_success:
+            on_success()
+        return True
+
+    async def _post(self, url, body):
+        if self._session is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_maxsize),
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(
+                    total=None, sock_connect=self.timeout, sock_read=self.timeout),
+            )
+
+        async with self._semaphore:
+            try:
+                async with self._session.post(url, data=body) as resp:
+                    text = await resp.text()
+                    if resp.status >= 200 and resp.status < 400:
+                        return None, None
+                    return ERROR_UNKNOWN, text
+            except _CONNECT_TIMEOUT:
+                return ERROR_CONNECTION, error_message(ERROR_CONNECTION)
+            except asyncio.TimeoutError:
+                return ERROR_RESPONSE_TIMEOUT, error_message(ERROR_RESPONSE_TIMEOUT)
+            except aiohttp.ClientConnectionError:
+                return ERROR_CONNECTION, error_message(ERROR_CONNECTION)
@@ -0,0 +1,320 @@
+import collections
+import threading
+import time
+import zlib
+
+from .errors import ERROR_QUEUE_FULL, ERROR_TIMEOUT
+
+BLOCK = 'block'
+DROP_NEWEST = 'drop_newest'
+DROP_OLDEST = 'drop_oldest'
+RAISE = 'raise'
+
+OVERFLOW_POLICIES = (BLOCK, DROP_NEWEST, DROP_OLDEST, RAISE)
+
+class QueueFull(Exception):
+    """ Raised by track() and identify() when the queue is full and the
+    overflow policy is 'raise'. """
+
+class Call(object):
+    """ A queued API call, held as its serialized body rather than the
+    payload's dictionaries. `deadline` is the time after which it should no
+    longer be sent, or None. """
+
+    __slots__ = ('path', 'body', 'deadline', 'on_error', 'on_success')
+
+    def __init__(self, path, body, deadline, on_error, on_success):
+        self.path = path
+        self.body = body
+        self.deadline = deadline
+        self.on_error = on_error
+        self.on_success = on_success
+
+class BatchQueue(object):
+    """ An in-process queue of pending API calls drained by a background
+    worker thread.
+
+    The worker sends queued calls as soon as `max_batch_size` calls are waiting
+    or `flush_interval` seconds have passed, whichever comes first. Each call's
+    on_error/on_success callback fires from the worker once it resolves.
+
+    :param func send: called as send(call) for every queued Call.
+
+    :param int max_batch_size: the number of queued calls that triggers a flush.
+
+    :param float flush_interval: the maximum number of seconds a call waits in
+    the queue before being sent.
+
+    :param int max_queue_size: the number of queued calls after which the queue
+    is full.
+
+    :param int max_queue_bytes: OPTIONAL the total size of queued call bodies
+    after which the queue is full.
+
+    :param str overflow: OPTIONAL what put() does when the queue is full: wait up
+    to `block_timeout` seconds for room ('block'), reject the new call
+    ('drop_newest'), discard the oldest queued calls to make room
+    ('drop_oldest') or raise QueueFull ('raise').
+
+    :param float block_timeout: OPTIONAL the longest put() waits under the
+    'block' policy before rejecting the call.
+
+    :param func on_drop: OPTIONAL called as on_drop(call, code) for each call
+    discarded, with ERROR_QUEUE_FULL for those discarded by the 'drop_oldest'
+    policy and ERROR_TIMEOUT for those still unsent when close() gives up.
+    """
+
+    def __init__(self, send, max_batch_size=100, flush_interval=0.5, max_queue_size=10000,
+            max_queue_bytes=None, overflow=DROP_NEWEST, block_timeout=1, on_drop=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('overflow must be one of %s' % ', '.join(OVERFLOW_POLICIES))
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.max_queue_bytes = max_queue_bytes
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+
+        self._send = send
+        self._on_drop = on_drop
+        self._items = collections.deque()
+        self._bytes = 0
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._flush_waiters = 0
+        self._stopped = False
+
+        self._thread = threading.Thread(target=self._run, name='outbound-batch')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def bytes(self):
+        """ The total size of the queued call bodies. """
+        return self._bytes
+
+    def put(self, call):
+        """ Queue a call. Returns False if the queue is closed, or full and the
+        call was rejected. """
+        dropped = []
+        with self._cond:
+            if self._stopped:
+                return False
+            if self._full(call):
+                if self.overflow == RAISE:
+                    raise QueueFull()
+                if self.overflow == DROP_NEWEST or self._oversized(call):
+                    return False
+                if self.overflow == BLOCK:
+                    deadline = time.time() + self.block_timeout
+                    while self._full(call) and not self._stopped:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            return False
+                        self._cond.wait(remaining)
+                    if self._stopped:
+                        return False
+                while self._items and self._full(call):
+                    dropped.append(self._popleft())
+                self._pending -= len(dropped)
+
+            self._items.append(call)
+            self._bytes += len(call.body)
+            self._pending += 1
+            if len(self._items) >= self.max_batch_size:
+                self._cond.notify_all()
+
+        self._drop(dropped, ERROR_QUEUE_FULL)
+        return True
+
+    def flush(self, timeout=None):
+        """ Send everything currently queued and wait for it to resolve.
+
+        :param float timeout: OPTIONAL the maximum number of seconds to wait.
+
+        :returns: True if the queue was fully drained.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        self._hold(1)
+        try:
+            return self._wait(deadline)
+        finally:
+            self._hold(-1)
+
+    def close(self, timeout=None):
+        """ Drain the queue (waiting at most `timeout` seconds) and stop the
+        worker thread, waiting for the call it is sending to resolve. Calls
+        still unsent after the deadline are discarded and passed to on_drop.
+        """
+        drained = self.flush(timeout)
+        self._stop()
+        self._join()
+        return drained
+
+    def _stop(self):
+        with self._cond:
+            self._stopped = True
+            dropped = list(self._items)
+            self._pending -= len(self._items)
+            self._items.clear()
+            self._bytes = 0
+            self._cond.notify_all()
+        self._drop(dropped, ERROR_TIMEOUT)
+
+    def _join(self):
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _drop(self, calls, code):
+        if self._on_drop is not None:
+            for call in calls:
+                self._on_drop(call, code)
+
+    def _hold(self, waiters):
+        # While any flush is waiting the worker sends without pausing.
+        with self._cond:
+            self._flush_waiters += waiters
+            self._cond.notify_all()
+
+    def _wait(self, deadline):
+        with self._cond:
+            while self._pending and self._thread.is_alive():
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            return self._pending == 0
+
+    def _full(self, call):
+        if len(self._items) >= self.max_queue_size:
+            return True
+        return (self.max_queue_bytes is not None and
+            self._bytes + len(call.body) > self.max_queue_bytes)
+
+    def _oversized(self, call):
+        return self.max_queue_bytes is not None and len(call.body) > self.max_queue_bytes
+
+    def _popleft(self):
+        call = self._items.popleft()
+        self._bytes -= len(call.body)
+        return call
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.time() + self.flush_interval
+                while (not self._stopped and not self._flush_waiters and
+                        len(self._items) < self.max_batch_size):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stopped:
+                    return
+                batch = []
+                while self._items and len(batch) < self.max_batch_size:
+                    batch.append(self._popleft())
+                if batch:
+                    self._cond.notify_all()
+
+            # Once closed, the rest of the batch is discarded rather than sent.
+            for sent, call in enumerate(batch):
+                if self._stopped:
+                    break
+                try:
+                    self._send(call)
+                except Exception:
+                    import traceback
+                    traceback.print_exc()
+            else:
+                sent = len(batch)
+
+            if batch:
+                with self._cond:
+                    self._pending -= len(batch)
+                    self._cond.notify_all()
+                self._drop(batch[sent:], ERROR_TIMEOUT)
+
+class ShardedQueue(object):
+    """ A set of BatchQueues ("lanes") sharing the same options, each drained
+    by its own worker thread. Calls put with the same key, or keys that read
+    the same as text such as 1 and '1', always go to the same lane, so they are sent one at a time in the order they were put,
+    while calls in different lanes are sent in parallel.
+
+    :param func send: called as send(call) for every queued Call.
+
+    :param int lanes: OPTIONAL the number of lanes.
+
+    :param int max_queue_size: OPTIONAL the number of queued calls after which
+    the queue is full, divided evenly between the lanes.
+
+    :param int max_queue_bytes: OPTIONAL the total size of queued call bodies
+    after which the queue is full, divided evenly between the lanes.
+
+    Other keyword arguments are passed to each lane's BatchQueue.
+    """
+
+    def __init__(self, send, lanes=1, max_queue_size=10000, max_queue_bytes=None, **options):
+        if lanes < 1:
+            raise ValueError('lanes must be at least 1')
+        self.lanes = [
+            BatchQueue(send,
+                max_queue_size=_share(max_queue_size, lanes),
+                max_queue_bytes=None if max_queue_bytes is None else _share(max_queue_bytes, lanes),
+                **options)
+            for _ in range(lanes)
+        ]
+
+    def __len__(self):
+        return sum(len(lane) for lane in self.lanes)
+
+    @property
+    def bytes(self):
+        """ The total size of the queued call bodies. """
+        return sum(lane.bytes for lane in self.lanes)
+
+    def depths(self):
+        """ The number of calls queued in each lane. """
+        return [len(lane) for lane in self.lanes]
+
+    def put(self, call, key=None):
+        """ Queue a call in the lane for `key`. See BatchQueue.put. """
+        return self.lanes[_lane(key, len(self.lanes))].put(call)
+
+    def flush(self, timeout=None):
+        """ Send everything currently queued in every lane, in parallel, and
+        wait for it to resolve. See BatchQueue.flush. """
+        deadline = None if timeout is None else time.time() + timeout
+        for lane in self.lanes:
+            lane._hold(1)
+        try:
+            return all([lane._wait(deadline) for lane in self.lanes])
+        finally:
+            for lane in self.lanes:
+                lane._hold(-1)
+
+    def close(self, timeout=None):
+        """ Drain every lane (waiting at most `timeout` seconds in all) and
+        stop their worker threads. See BatchQueue.close. """
+        drained = self.flush(timeout)
+        for lane in self.lanes:
+            lane._stop()
+        for lane in self.lanes:
+            lane._join()
+        return drained
+
+def _lane(key, lanes):
+    # crc32 of the key as text, unlike hash(), is the same for 1 and '1' and
+    # in every process.
+    if not isinstance(key, bytes):
+        key = ('%s' % (key,)).encode('utf-8')
+    return zlib.crc32(key) % lanes
+
+def _share(total, lanes):
+    return -(-total // lanes)
@@ -0,0 +1,77 @@
+import collections
+import threading
+import time
+
+from . import fork
+
+class LRUCache(object):
+    """ A thread-safe mapping holding at most `max_size` entries, evicting the
+    least recently used first. Entries older than `ttl` seconds are treated as
+    missing.
+
+    check() counts how often a lookup matched in `hits` and `misses`.
+    """
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+        fork.register(self)
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._get(key, default)
+
+    def check(self, key, value):
+        """ Whether `key` is cached with exactly `value`. Counts a hit or miss. """
+        with self._lock:
+            found = self._get(key, None) == value
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return found
+
+    def set(self, key, value):
+        expires = None if self.ttl is None else time.time() + self.ttl
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (value, expires)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._items.pop(key, None)
+            return default if item is None else item[0]
+
+    def items(self):
+        """ The unexpired (key, value) pairs, least recently used first. """
+        now = time.time()
+        with self._lock:
+            return [(key, value) for key, (value, expires) in self._items.items()
+                if expires is None or expires > now]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def _get(self, key, default):
+        item = self._items.pop(key, None)
+        if item is None:
+            return default
+        value, expires = item
+        if expires is not None and expires <= time.time():
+            return default
+        self._items[key] = item
+        return value
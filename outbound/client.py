@@ -0,0 +1,912 @@
+import collections
+import threading
+import time
+import weakref
+import zlib
+
+from . import fork
+from . import serializers
+from . import version
+from .buffer import Call, DROP_NEWEST, ShardedQueue
+from .cache import LRUCache
+from .errors import (
+    ERROR_INIT, ERROR_CONNECTION, ERROR_UNKNOWN,
+    ERROR_QUEUE_FULL, ERROR_CIRCUIT_OPEN, ERROR_RATE_LIMITED, ERROR_TIMEOUT, ERROR_RESPONSE_TIMEOUT,
+    error_message,
+)
+from .payload import (
+    STRING_TYPES, is_id, alias_payload, identify_payload, track_payload,
+    subscription_payload, device_token_payload, record_payload,
+)
+from .retry import RetryPolicy, CircuitBreaker
+from .transport import TIMED_OUT, RequestsTransport
+
+DEFAULT_BASE_URL = "https://api.outbound.io/v2"
+
+_clients = weakref.WeakSet()
+
+class Client(object):
+    """ A client for one Outbound project. Clients are safe to share between
+    threads, and each has its own API key, connection pool and configuration.
+    The module level functions in `outbound` use a default client created by
+    outbound.init().
+
+    :param str key: your Outbound API key.
+
+    :param str base_url: OPTIONAL the API root to send requests to. Defaults to
+    https://api.outbound.io/v2.
+
+    :param int pool_connections: OPTIONAL the number of per-host connection pools
+    to cache.
+
+    :param int pool_maxsize: OPTIONAL the maximum number of connections kept
+    alive per host.
+
+    :param func transport: OPTIONAL the factory for the transport that sends
+    requests, e.g. outbound.transport.HTTPClientTransport to avoid depending
+    on requests. Defaults to RequestsTransport. See outbound.transport.
+
+    :param bool buffered: OPTIONAL True to queue calls and send them from
+    background threads instead of the caller's thread. Their callbacks fire
+    from those threads once each call resolves. Bulk calls such as track_many
+    are not queued.
+
+    :param int lanes: OPTIONAL in buffered mode, the number of background
+    threads sending queued calls in parallel. Calls are assigned to a lane by
+    user ID, and each lane sends its calls one at a time, so the calls for
+    any one user are sent in the order they were made. The queue size limits
+    are divided evenly between the lanes. With metrics, each lane's depth is
+    reported as gauge lane_depth_N.
+
+    :param int max_batch_size: OPTIONAL in buffered mode, the number of queued
+    calls that triggers a flush.
+
+    :param float flush_interval: OPTIONAL in buffered mode, the maximum number
+    of seconds a call waits in the queue before being sent.
+
+    :param int max_queue_size: OPTIONAL in buffered mode, the number of queued
+    calls after which the queue is full.
+
+    :param int max_queue_bytes: OPTIONAL in buffered mode, the total size in
+    bytes of the serialized calls queued after which the queue is full. Calls
+    are queued as serialized bytes, so this bounds the queue's memory use.
+
+    :param str overflow: OPTIONAL in buffered mode, what happens to a call made
+    while the queue is full: 'drop_newest' (the default) fails it with
+    ERROR_QUEUE_FULL, 'drop_oldest' fails the oldest queued calls with
+    ERROR_QUEUE_FULL to make room for it, 'block' waits up to block_timeout
+    seconds for room and then fails it, and 'raise' raises
+    outbound.QueueFull from the call.
+
+    :param float block_timeout: OPTIONAL the longest a call waits for room in
+    the queue under the 'block' overflow policy.
+
+    :param float deadline: OPTIONAL the number of seconds a call has, from when
+    it is made, to be sent, including time spent queued and retrying. Calls
+    still unsent when their deadline passes fail with ERROR_TIMEOUT. Defaults
+    to no deadline.
+
+    :param float timeout: OPTIONAL the number of seconds to wait for Outbound
+    to accept a connection and to respond, per attempt. An attempt that can't
+    connect in time fails like a connection error. One sent but not answered
+    in time fails with ERROR_RESPONSE_TIMEOUT and, as Outbound may have
+    processed it, is neither retried (see RetryPolicy) nor spooled.
+
+    :param float drain_timeout: OPTIONAL in buffered mode, the number of seconds
+    spent sending queued calls on close() or interpreter exit. Calls still
+    queued after that fail with ERROR_TIMEOUT.
+
+    :param str spool_dir: OPTIONAL a directory in which to spool calls that fail
+    with ERROR_CONNECTION. Spooled calls are replayed in order, in the
+    background, after the next call that reaches Outbound. Their on_error
+    callback still fires when they first fail. Clients must not share a spool
+    directory.
+
+    :param int spool_segment_size: OPTIONAL the size in bytes of each spool
+    segment file.
+
+    :param int spool_max_size: OPTIONAL the total size in bytes after which
+    failed calls are no longer spooled.
+
+    :param outbound.RetryPolicy retry_policy: OPTIONAL which failed calls to
+    retry and how long to wait between attempts. Defaults to RetryPolicy().
+    Pass RetryPolicy(max_retries=0) to disable retries.
+
+    :param int breaker_threshold: OPTIONAL the number of consecutive failures
+    (connection errors, 429 or 5xx responses) after which calls to an endpoint
+    fail fast with ERROR_CIRCUIT_OPEN, or are spooled if spool_dir is set. 0
+    disables the circuit breaker.
+
+    :param float breaker_reset_timeout: OPTIONAL the number of seconds an open
+    circuit waits before letting a trial call through.
+
+    :param bool compress: OPTIONAL True to gzip request bodies of at least
+    compress_min_size bytes.
+
+    :param int compress_min_size: OPTIONAL the smallest body, in bytes, that is
+    compressed.
+
+    :param int compress_level: OPTIONAL the zlib compression level, from 1
+    (fastest) to 9 (smallest).
+
+    :param func serializer: OPTIONAL a function taking a request payload and
+    returning it JSON encoded as UTF-8 bytes. Defaults to orjson when it is
+    installed and the json module otherwise. See outbound.serializers.
+
+    :param int identify_cache_size: OPTIONAL the number of users for which to
+    remember the last identify() call. An identify() identical to the last one
+    sent for that user within identify_cache_ttl seconds is not sent, and its
+    on_success callback fires immediately. 0 disables the cache.
+
+    :param float identify_cache_ttl: OPTIONAL the number of seconds a
+    remembered identify() suppresses identical calls.
+
+    :param float identify_coalesce_window: OPTIONAL the number of seconds
+    identify() calls for a user are held to be merged with later ones. The
+    merged payload is sent once and every merged call's callbacks fire with
+    its result. Any other call for the user sends its held identify first.
+    See outbound.coalesce. Defaults to sending each call on its own.
+
+    :param int token_cache_size: OPTIONAL the number of (platform, user) pairs
+    for which to remember the device tokens registered and disabled. A
+    register_token() or disable_token() call that would change nothing is not
+    sent, and its on_success callback fires immediately. Tokens sent with
+    identify() and track() count as registered. 0 disables the cache.
+
+    :param float token_cache_ttl: OPTIONAL the number of seconds remembered
+    tokens suppress calls. None trusts them until they are evicted.
+
+    :param str token_cache_file: OPTIONAL a file the token cache is loaded
+    from when the client is created and saved to when it is closed.
+
+    :param outbound.RateLimiter rate_limiter: OPTIONAL limits on how often
+    track and identify calls are sent. Calls over the limits fail with
+    ERROR_RATE_LIMITED before any work is done for them.
+
+    :param outbound.AdaptiveLimit concurrency_limit: OPTIONAL adapts the
+    number of requests in flight, and the number of items bulk calls send per
+    round, to the latency, throttling and failures observed. See
+    outbound.adaptive.
+
+    :param outbound.Metrics metrics: OPTIONAL collects call counts, error
+    codes, bytes sent and per-phase latencies, readable through stats(). See
+    outbound.metrics.
+
+    :param sender: OPTIONAL the address of a sender process (see
+    outbound.sender) to hand calls to instead of sending them directly. The
+    sender's own options then govern retries, circuit breaking and spooling.
+
+    :param bytes sender_authkey: OPTIONAL the sender's authkey, if it has one.
+
+    Clients are fork-safe. In a forked child, e.g. a gunicorn or
+    multiprocessing worker, a client opens new connections and starts a new,
+    empty queue on its next call. Calls queued before the fork stay with the
+    parent, which sends them once. Only the process that created a client
+    writes to its spool_dir; forked children do not spool.
+    """
+
+    def __init__(self, key, base_url=None, pool_connections=10, pool_maxsize=10,
+            buffered=False, lanes=1, max_batch_size=100, flush_interval=0.5,
+            max_queue_size=10000, max_queue_bytes=None, overflow=DROP_NEWEST,
+            block_timeout=1, deadline=None, timeout=10, drain_timeout=5, spool_dir=None,
+            spool_segment_size=16 * 1024 * 1024, spool_max_size=256 * 1024 * 1024,
+            retry_policy=None, breaker_threshold=0, breaker_reset_timeout=30,
+            compress=False, compress_min_size=1024, compress_level=6,
+            serializer=None, identify_cache_size=0, identify_cache_ttl=300,
+            identify_coalesce_window=None,
+            token_cache_size=0, token_cache_ttl=None, token_cache_file=None,
+            rate_limiter=None, concurrency_limit=None, metrics=None, sender=None,
+            sender_authkey=None, transport=None):
+        self.key = key
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip('/')
+        self.headers = {
+            'content-type': 'application/json',
+            'X-Outbound-Client': 'Python/{0}'.format(version.VERSION),
+            'X-Outbound-Key': key,
+        }
+        self.gzip_headers = dict(self.headers)
+        self.gzip_headers['Content-Encoding'] = 'gzip'
+
+        self.deadline = deadline
+        self.timeout = timeout
+        self.drain_timeout = drain_timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset_timeout = breaker_reset_timeout
+        self.compress_min_size = compress_min_size if compress else None
+        self.compress_level = compress_level
+        self.serializer = serializer or serializers.default()
+        self.rate_limiter = rate_limiter
+        self.concurrency_limit = concurrency_limit
+        self.metrics = metrics
+
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.transport_factory = transport or RequestsTransport
+        self._transport = self._new_transport()
+
+        self._sender = None
+        if sender is not None:
+            from .sender import Remote
+            self._sender = Remote(sender, authkey=sender_authkey)
+
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self._identify_cache = LRUCache(identify_cache_size, identify_cache_ttl) if identify_cache_size else None
+
+        self._coalescer = None
+        if identify_coalesce_window is not None:
+            from .coalesce import Coalescer
+            self._coalescer = Coalescer(self._send_identify, identify_coalesce_window)
+
+        self._token_cache = None
+        if token_cache_size:
+            from .tokens import TokenCache
+            self._token_cache = TokenCache(token_cache_size, token_cache_ttl, token_cache_file)
+
+        self._spool = None
+        if spool_dir:
+            from .spool import Spool
+            self._spool = Spool(spool_dir, segment_size=spool_segment_size, max_size=spool_max_size)
+        self._replayer = None
+        self._replay_wanted = threading.Event()
+        self._replay_lock = threading.Lock()
+
+        self._queue = None
+        self._queue_options = dict(
+            lanes=lanes,
+            max_batch_size=max_batch_size,
+            flush_interval=flush_interval,
+            max_queue_size=max_queue_size,
+            max_queue_bytes=max_queue_bytes,
+            overflow=overflow,
+            block_timeout=block_timeout,
+            on_drop=self._drop,
+        )
+        if buffered:
+            self._queue = ShardedQueue(self._post, **self._queue_options)
+
+        if metrics is not None:
+            metrics.gauge('queue_depth', lambda: len(self._queue or ()))
+            metrics.gauge('queue_bytes', lambda: getattr(self._queue, 'bytes', 0))
+            metrics.gauge('spool_bytes', lambda: len(self._spool or ()))
+            if self._coalescer is not None:
+                metrics.gauge('identify_pending', lambda: len(self._coalescer))
+            if concurrency_limit is not None:
+                for name in ('limit', 'batch_size', 'in_flight'):
+                    metrics.gauge('concurrency_%s' % name,
+                        lambda name=name: concurrency_limit.snapshot()[name])
+            if buffered and lanes > 1:
+                for lane in range(lanes):
+                    metrics.gauge('lane_depth_%d' % lane, lambda lane=lane: self._lane_depth(lane))
+
+        _clients.add(self)
+        fork.register(self)
+
+    @property
+    def closed(self):
+        return self._transport is None
+
+    def close(self):
+        """ Drain any queued calls and close the client's connection pool. Any
+        further API calls will fail with ERROR_INIT.
+        """
+        if self._coalescer is not None:
+            self._coalescer.close()
+        queue, self._queue = self._queue, None
+        if queue is not None:
+            queue.close(self.drain_timeout)
+        spool, self._spool = self._spool, None
+        if spool is not None:
+            self._replay_wanted.set()
+            spool.close()
+        transport, self._transport = self._transport, None
+        if transport is not None:
+            transport.close()
+        if self._sender is not None:
+            self._sender.close()
+        if self._token_cache is not None:
+            self._token_cache.save()
+
+    def flush(self, timeout=None):
+        """ Send all queued calls. See outbound.flush. """
+        fork.check()
+        if self._coalescer is not None:
+            self._coalescer.flush()
+        queue = self._queue
+        if queue is None:
+            return True
+        return queue.flush(timeout)
+
+    def stats(self):
+        """ Take a snapshot of this client's metrics. See outbound.stats. """
+        if self.metrics is None:
+            return None
+        return self.metrics.snapshot()
+
+    def identify_cache_stats(self):
+        """ Report on the identify cache. See outbound.identify_cache_stats. """
+        cache = self._identify_cache
+        if cache is None:
+            return dict(hits=0, misses=0, size=0)
+        return dict(hits=cache.hits, misses=cache.misses, size=len(cache))
+
+    def token_cache_stats(self):
+        """ Report on the device token cache. See outbound.token_cache_stats. """
+        cache = self._token_cache
+        if cache is None:
+            return dict(hits=0, misses=0, size=0)
+        return dict(hits=cache.hits, misses=cache.misses, size=len(cache))
+
+    def replay_spool(self):
+        """ Send every spooled call. See outbound.replay_spool. """
+        spool = self._spool
+        if spool is None or self.closed:
+            return 0
+        return spool.replay(self._replay_send)
+
+    def unsubscribe(self, user_id, from_all=False, campaign_ids=None, on_error=None, on_success=None):
+        """ Unsubscribe a user from some or all campaigns. See outbound.unsubscribe. """
+        self._subscription(user_id, True, from_all, campaign_ids, on_error, on_success)
+
+    def subscribe(self, user_id, to_all=False, campaign_ids=None, on_error=None, on_success=None):
+        """ Resubscribe a user to some or all campaigns. See outbound.subscribe. """
+        self._subscription(user_id, False, to_all, campaign_ids, on_error, on_success)
+
+    def disable_all_tokens(self, platform, user_id, on_error=None, on_success=None):
+        """ Disable ALL device tokens for a user. See outbound.disable_all_tokens. """
+        self._device_token(platform, False, user_id, all=True, on_error=on_error, on_success=on_success)
+
+    def disable_token(self, platform, user_id, token, on_error=None, on_success=None):
+        """ Disable a device token for a user. See outbound.disable_token. """
+        self._device_token(platform, False, user_id, token=token, on_error=on_error, on_success=on_success)
+
+    def register_token(self, platform, user_id, token, on_error=None, on_success=None):
+        """ Register a device token for a user. See outbound.register_token. """
+        self._device_token(platform, True, user_id, token=token, on_error=on_error, on_success=on_success)
+
+    def alias(self, user_id, previous_id, on_error=None, on_success=None):
+        """ Alias one user id to another. See outbound.alias. """
+        on_error, on_success = self._callbacks('alias', on_error, on_success)
+        self._send(self._build(alias_payload, user_id, previous_id), on_error, on_success)
+
+    def identify(self, user_id, previous_id=None, group_id=None, group_attributes=None,
+                first_name=None, last_name=None, email=None,
+                phone_number=None, apns_tokens=None, gcm_tokens=None,
+                attributes=None, on_error=None, on_success=None):
+        """ Identify a user. See outbound.identify. """
+        on_error, on_success = self._callbacks('identify', on_error, on_success)
+
+        if self._rate_limited(user_id):
+            on_error(ERROR_RATE_LIMITED, error_message(ERROR_RATE_LIMITED))
+            return
+
+        payload = self._build(identify_payload, user_id, previous_id, group_id, group_attributes,
+            first_name, last_name, email, phone_number, apns_tokens, gcm_tokens,
+            attributes)
+
+        code, _, data = payload
+        if code:
+            on_error(code, error_message(code))
+        elif self._coalescer is not None:
+            self._coalescer.add(user_id, data, on_error, on_success)
+        else:
+            self._send_identify(data, on_error, on_success)
+
+    def _send_identify(self, data, on_error, on_success):
+        payload = (None, 'identify', data)
+        body = None
+        cache = self._identify_cache
+        if cache is not None:
+            import hashlib
+            body = self._serialize(data)
+            digest = hashlib.sha1(body).digest()
+            if cache.check(data['user_id'], digest):
+                on_success()
+                return
+            on_success = _remember(cache, data['user_id'], digest, on_success)
+
+        if self._token_cache is not None:
+            on_success = _then(self._record_user_tokens, payload, on_success)
+        self._send(payload, on_error, on_success, body=body, coalesced=True)
+
+    def track(self, user_id, event, first_name=None, last_name=None, email=None,
+            phone_number=None, apns_tokens=None, gcm_tokens=None,
+            user_attributes=None, properties=None, on_error=None, on_success=None, timestamp=None):
+        """ Track an event for a user. See outbound.track. """
+        on_error, on_success = self._callbacks('track', on_error, on_success)
+
+        if self._rate_limited(user_id, event):
+            on_error(ERROR_RATE_LIMITED, error_message(ERROR_RATE_LIMITED))
+            return
+
+        payload = self._build(track_payload, user_id, event, first_name, last_name, email,
+            phone_number, apns_tokens, gcm_tokens, user_attributes, properties,
+            timestamp)
+        if self._token_cache is not None and not payload[0]:
+            on_success = _then(self._record_user_tokens, payload, on_success)
+        self._send(payload, on_error, on_success)
+
+    def identify_many(self, records, concurrency=4, chunk_size=100):
+        """ Identify many users. See outbound.identify_many. """
+        return _failures(self._send_many(_each(identify_payload), records, concurrency, chunk_size))
+
+    def track_many(self, records, concurrency=4, chunk_size=100):
+        """ Track many events. See outbound.track_many. """
+        return _failures(self._send_many(_each(track_payload), records, concurrency, chunk_size))
+
+    def unsubscribe_many(self, items, concurrency=4, chunk_size=1000):
+        """ Unsubscribe many users. See outbound.unsubscribe_many. """
+        return self._send_many(_subscriptions(True), items, concurrency, chunk_size)
+
+    def subscribe_many(self, items, concurrency=4, chunk_size=1000):
+        """ Resubscribe many users. See outbound.subscribe_many. """
+        return self._send_many(_subscriptions(False), items, concurrency, chunk_size)
+
+    def register_token_many(self, items, concurrency=4, chunk_size=1000):
+        """ Register many device tokens. See outbound.register_token_many. """
+        return self._send_many(_device_tokens(True, self._token_cache), items, concurrency, chunk_size,
+            self._token_recorder())
+
+    def disable_token_many(self, items, concurrency=4, chunk_size=1000):
+        """ Disable many device tokens. See outbound.disable_token_many. """
+        return self._send_many(_device_tokens(False, self._token_cache), items, concurrency, chunk_size,
+            self._token_recorder())
+
+    def _subscription(self, user_id, unsubscribe, all_campaigns, campaign_ids, on_error, on_success):
+        on_error, on_success = self._callbacks(
+            'unsubscribe' if unsubscribe else 'subscribe', on_error, on_success)
+        self._send(
+            self._build(subscription_payload, user_id, unsubscribe, all_campaigns, campaign_ids),
+            on_error, on_success)
+
+    def _device_token(self, platform, register, user_id, token='', all=False, on_error=None, on_success=None):
+        endpoint = 'register_token' if register else ('disable_all_tokens' if all else 'disable_token')
+        on_error, on_success = self._callbacks(endpoint, on_error, on_success)
+        payload = self._build(device_token_payload, platform, register, user_id, token, all)
+        cache = self._token_cache
+        if cache is not None and not payload[0]:
+            if cache.known(platform, user_id, None if all else token, register):
+                on_success()
+                return
+            on_success = _then(self._record_device_token, payload, on_success)
+        self._send(payload, on_error, on_success)
+
+    def _token_recorder(self):
+        return None if self._token_cache is None else self._record_device_token
+
+    def _record_device_token(self, payload):
+        _, path, data = payload
+        platform, action = path.split('/')
+        self._token_cache.update(platform, data['user_id'], [data.get('token')], action == 'register')
+
+    def _record_user_tokens(self, payload):
+        _, _, data = payload
+        user = data.get('user', data)
+        for platform in ('apns', 'gcm'):
+            if user.get(platform):
+                self._token_cache.update(platform, data['user_id'], user[platform], True)
+
+    def _callbacks(self, endpoint, on_error, on_success):
+        on_error = on_error or _on_error
+        on_success = on_success or _on_success
+        metrics = self.metrics
+        if metrics is None:
+            return on_error, on_success
+        return metrics.wrap(endpoint, on_error, on_success, time.time())
+
+    def _rate_limited(self, user_id, event=None):
+        limiter = self.rate_limiter
+        if limiter is None or not is_id(user_id):
+            return False
+        if event is not None and not isinstance(event, STRING_TYPES):
+            return False
+        return not limiter.allow(user_id, event)
+
+    def _build(self, build, *args):
+        metrics = self.metrics
+        if metrics is None:
+            return build(*args)
+        started = time.time()
+        payload = build(*args)
+        metrics.observe('build', time.time() - started)
+        return payload
+
+    def _serialize(self, data):
+        metrics = self.metrics
+        if metrics is None:
+            return self.serializer(data)
+        started = time.time()
+        body = self.serializer(data)
+        metrics.observe('serialize', time.time() - started)
+        return body
+
+    def _send(self, payload, on_error, on_success, body=None, coalesced=False):
+        code, path, data = payload
+        if code:
+            on_error(code, data or error_message(code))
+            return
+
+        fork.check()
+        if self._coalescer is not None and not coalesced:
+            # Keep the user's calls in order behind any identify being held.
+            self._coalescer.flush_user(data['user_id'])
+        if body is None:
+            body = self._serialize(data)
+        deadline = None if self.deadline is None else time.time() + self.deadline
+        call = Call(path, body, deadline, on_error, on_success)
+
+        queue = self._queue
+        if queue is None:
+            self._post(call)
+        elif not queue.put(call, data['user_id']):
+            on_error(ERROR_QUEUE_FULL, error_message(ERROR_QUEUE_FULL))
+
+    def _post(self, call):
+        code, error = self._deliver(call.path, call.body, call.deadline)
+        if code is None:
+            call.on_success()
+        else:
+            call.on_error(code, error)
+
+    def _lane_depth(self, lane):
+        queue = self._queue
+        return 0 if queue is None else len(queue.lanes[lane])
+
+    def _drop(self, call, code):
+        call.on_error(code, error_message(code))
+
+    def _deliver(self, path, body, deadline=None):
+        fork.check()
+        if deadline is not None and time.time() >= deadline:
+            return ERROR_TIMEOUT, error_message(ERROR_TIMEOUT)
+        if self._sender is not None:
+            if self.closed:
+                return ERROR_INIT, error_message(ERROR_INIT)
+            return self._sender.deliver(path, body, deadline)
+
+        code, text = self._request(path, body, deadline)
+        spool = self._spool
+        if code in (ERROR_CONNECTION, ERROR_CIRCUIT_OPEN) and spool is not None:
+            spool.append(path, body)
+        elif code is None and spool is not None and len(spool):
+            self._wake_replayer()
+
+        if code is None or code == ERROR_UNKNOWN:
+            return code, text
+        return code, error_message(code)
+
+    def _send_many(self, group, items, concurrency, chunk_size, record=None):
+        # Items are read chunk_size at a time. group(chunk) turns a chunk of
+        # (index, item) pairs into (indices, payload) requests, and each
+        # request's result is reported for every item it covers. With a
+        # concurrency_limit, chunks are its current batch size. A payload of
+        # None is a request known to be redundant, reported as a success
+        # without being sent. record(payload) is called for each request sent
+        # successfully.
+        from multiprocessing.pool import ThreadPool
+
+        def deliver(payload):
+            if payload is None:
+                return None, None
+            code, path, data = payload
+            if code:
+                return code, data or error_message(code)
+            if self.closed:
+                return ERROR_INIT, error_message(ERROR_INIT)
+            return self._deliver(path, self._serialize(data))
+
+        def send(chunk):
+            requests = group(chunk)
+            results = []
+            for (indices, payload), (code, error) in zip(requests, pool.map(deliver, [p for _, p in requests])):
+                if record is not None and payload is not None and code is None:
+                    record(payload)
+                results.extend((index, code, error) for index in indices)
+            results.sort(key=lambda result: result[0])
+            return results
+
+        limit = self.concurrency_limit
+        pool = ThreadPool(concurrency if limit is None else max(concurrency, limit.max_limit))
+        try:
+            chunk = []
+            for item in enumerate(items):
+                chunk.append(item)
+                if len(chunk) >= (chunk_size if limit is None else int(limit.batch_size)):
+                    for result in send(chunk):
+                        yield result
+                    chunk = []
+            if chunk:
+                for result in send(chunk):
+                    yield result
+        finally:
+            pool.close()
+            pool.join()
+
+    def _request(self, path, body, deadline=None):
+        transport = self._transport
+        if transport is None:
+            return ERROR_INIT, None
+
+        breaker = self._breaker(path)
+        metrics = self.metrics
+        headers = self.headers
+        if self.compress_min_size is not None and len(body) >= self.compress_min_size:
+            if metrics is not None:
+                started = time.time()
+            body = _gzip(body, self.compress_level)
+            headers = self.gzip_headers
+            if metrics is not None:
+                metrics.observe('compress', time.time() - started)
+
+        url = "%s/%s" % (self.base_url, path)
+        policy = self.retry_policy
+        limit = self.concurrency_limit
+        retry = 0
+        code = None
+        while True:
+            if limit is not None and not limit.acquire(None if deadline is None else deadline - time.time()):
+                code = ERROR_TIMEOUT
+                break
+            timeout = self.timeout
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    if limit is not None:
+                        limit.cancel()
+                    code = ERROR_TIMEOUT
+                    break
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            # The breaker is asked once the call is sure to be sent, so that
+            # any trial call it lets through is made.
+            if not retry and breaker is not None and not breaker.allow():
+                if limit is not None:
+                    limit.cancel()
+                return ERROR_CIRCUIT_OPEN, None
+            started = time.time()
+            try:
+                status, text, retry_after = transport.post(url, body, headers, timeout)
+            except Exception:
+                if limit is not None:
+                    limit.cancel()
+                if breaker is not None:
+                    breaker.record_failure()
+                raise
+            latency = time.time() - started
+            if limit is not None:
+                limit.release(latency, status, retry_after)
+            if metrics is not None:
+                metrics.observe('request', latency)
+                metrics.sent(len(body))
+            if status is not None and status >= 200 and status < 400:
+                if breaker is not None:
+                    breaker.record_success()
+                return None, None
+
+            wait = None
+            if policy is not None and policy.is_retryable(status, text is TIMED_OUT):
+                wait = policy.delay(retry, retry_after)
+            if wait is None or (deadline is not None and time.time() + wait >= deadline):
+                break
+            time.sleep(wait)
+            retry += 1
+
+        if code is not None and not retry:
+            return code, None
+        if breaker is not None:
+            if status is None or status == 429 or status >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+        if code is not None:
+            return code, None
+        if status is None:
+            return ERROR_RESPONSE_TIMEOUT if text is TIMED_OUT else ERROR_CONNECTION, None
+        return ERROR_UNKNOWN, text
+
+    def _breaker(self, path):
+        if not self.breaker_threshold:
+            return None
+        with self._breakers_lock:
+            breaker = self._breakers.get(path)
+            if breaker is None:
+                breaker = self._breakers[path] = CircuitBreaker(
+                    failure_threshold=self.breaker_threshold,
+                    reset_timeout=self.breaker_reset_timeout,
+                )
+            return breaker
+
+    def _new_transport(self):
+        return self.transport_factory(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+        )
+
+    def _after_fork(self):
+        # The parent's sockets, threads and locks are unusable here. Leave the
+        # inherited objects unclosed, as closing them could disturb the parent.
+        if self.closed:
+            return
+        self._transport = self._new_transport()
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self._spool = None
+        self._replayer = None
+        self._replay_wanted = threading.Event()
+        self._replay_lock = threading.Lock()
+        if self._queue is not None:
+            self._queue = ShardedQueue(self._post, **self._queue_options)
+
+    def _wake_replayer(self):
+        # One background thread replays the spool, woken after each call
+        # that reaches Outbound while the spool is not empty.
+        if self._replayer is None:
+            with self._replay_lock:
+                if self._replayer is None:
+                    self._replayer = threading.Thread(target=self._replay, name='outbound-replay')
+                    self._replayer.daemon = True
+                    self._replayer.start()
+        self._replay_wanted.set()
+
+    def _replay(self):
+        wanted = self._replay_wanted
+        while True:
+            wanted.wait()
+            wanted.clear()
+            spool = self._spool
+            if spool is None:
+                return
+            try:
+                spool.replay(self._replay_send)
+            except Exception:
+                import traceback
+                traceback.print_exc()
+
+    def _replay_send(self, path, data):
+        code, _ = self._request(path, self.serializer(data))
+        return code is None or code == ERROR_UNKNOWN
+
+class ClientRegistry(object):
+    """ A bounded cache of Clients keyed by API key, for services that talk to
+    many Outbound projects. When more than `max_size` clients are cached the
+    least recently used one is closed and dropped.
+
+    Keyword arguments other than `max_size` are passed to every Client created.
+
+        registry = outbound.ClientRegistry(max_size=100, buffered=True)
+        registry.get(tenant.outbound_key).track(user_id, 'signed up')
+    """
+
+    def __init__(self, max_size=100, **options):
+        self.max_size = max_size
+        self.options = options
+        self._clients = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def get(self, key):
+        """ Return the Client for `key`, creating it if needed. """
+        evicted = []
+        with self._lock:
+            client = self._clients.pop(key, None)
+            if client is None or client.closed:
+                client = Client(key, **self.options)
+            self._clients[key] = client
+            while len(self._clients) > self.max_size:
+                evicted.append(self._clients.popitem(last=False)[1])
+        for old in evicted:
+            old.close()
+        return client
+
+    def close(self):
+        """ Close and drop every cached client. """
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+def _close_all():
+    for client in list(_clients):
+        client.close()
+
+fork.at_exit(_close_all)
+
+def _failures(results):
+    return (result for result in results if result[1])
+
+def _each(build):
+    def group(chunk):
+        return [([index], record_payload(build, record)) for index, record in chunk]
+    return group
+
+def _subscriptions(unsubscribe):
+    # One request per user and chunk, covering the union of the campaigns
+    # asked for. None for campaign_ids means all campaigns, which takes
+    # precedence as it does for subscribe() and unsubscribe().
+    def group(chunk):
+        requests, users = [], collections.OrderedDict()
+        for index, item in chunk:
+            try:
+                user_id, campaign_ids = item
+            except (TypeError, ValueError) as e:
+                requests.append(([index], _invalid(e)))
+                continue
+            payload = subscription_payload(user_id, unsubscribe, campaign_ids is None, campaign_ids)
+            if payload[0]:
+                requests.append(([index], payload))
+                continue
+            indices, campaigns = users.setdefault(user_id, ([], collections.OrderedDict()))
+            indices.append(index)
+            if campaign_ids is None:
+                campaigns[None] = True
+            else:
+                campaigns.update((campaign_id, True) for campaign_id in campaign_ids)
+        for user_id, (indices, campaigns) in users.items():
+            all_campaigns = None in campaigns
+            campaign_ids = None if all_campaigns else list(campaigns)
+            requests.append((indices, subscription_payload(user_id, unsubscribe, all_campaigns, campaign_ids)))
+        return requests
+    return group
+
+def _device_tokens(register, cache=None):
+    # One request per distinct (platform, user, token), grouped by platform.
+    # When disabling, a None token disables all of a user's tokens on that
+    # platform and covers any single tokens disabled alongside it. Requests
+    # the token cache knows to be redundant are skipped.
+    def group(chunk):
+        requests, tokens = [], collections.OrderedDict()
+        for index, item in chunk:
+            try:
+                platform, user_id, token = item
+            except (TypeError, ValueError) as e:
+                requests.append(([index], _invalid(e)))
+                continue
+            all = not register and token is None
+            payload = device_token_payload(platform, register, user_id, token, all)
+            if payload[0]:
+                requests.append(([index], payload))
+                continue
+            platform_tokens = tokens.setdefault(platform, collections.OrderedDict())
+            platform_tokens.setdefault((user_id, token), []).append(index)
+        for platform, platform_tokens in tokens.items():
+            for (user_id, token), indices in platform_tokens.items():
+                if token is not None and (user_id, None) in platform_tokens:
+                    platform_tokens[(user_id, None)].extend(indices)
+                    continue
+                if cache is not None and cache.known(platform, user_id, token, register):
+                    requests.append((indices, None))
+                    continue
+                requests.append((indices, device_token_payload(platform, register, user_id, token, token is None)))
+        return requests
+    return group
+
+def _invalid(e):
+    # The payload reporting a bulk item of the wrong shape, as record_payload
+    # reports a record that doesn't fit.
+    return ERROR_UNKNOWN, None, 'Invalid item: %s' % e
+
+def _remember(cache, key, value, on_success):
+    def remember():
+        cache.set(key, value)
+        on_success()
+    return remember
+
+def _then(record, payload, on_success):
+    def then():
+        record(payload)
+        on_success()
+    return then
+
+def _gzip(body, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+def _on_error(code, err):
+    pass
+
+def _on_success():
+    pass
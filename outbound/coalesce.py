@@ -0,0 +1,191 @@
+""" Coalescing of identify() calls made for the same user in quick succession.
+
+The first identify() for a user opens a window of `window` seconds. Every
+identify() for that user until the window closes is deep-merged into one
+payload: nested dictionaries such as attributes are merged key by key, later
+values win, and the apns and gcm token lists are unioned. The merged payload
+is then sent once, and each merged call's callbacks fire with its result.
+A user's payloads are sent one at a time, each only once the one before has
+resolved, however they come to be sent.
+"""
+import collections
+import itertools
+import threading
+import time
+
+from . import fork
+
+TOKEN_FIELDS = ('apns', 'gcm')
+
+class Coalescer(object):
+    """ Holds identify payloads for up to `window` seconds, merging those for
+    the same user, and passes each merged payload to
+    send(data, on_error, on_success) from a background thread.
+
+    :param func send: called with each merged payload and callbacks that fan
+    its result out to every merged call.
+
+    :param float window: the number of seconds a user's first call waits for
+    others to merge with.
+
+    :param int max_pending: OPTIONAL the number of users with calls waiting
+    after which the oldest are sent straight away, from the caller's thread.
+    """
+
+    def __init__(self, send, window, max_pending=10000):
+        self.window = window
+        self.max_pending = max_pending
+
+        self._send = send
+        self._reset()
+        fork.register(self)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, user_id, data, on_error, on_success):
+        """ Merge a call into the user's pending payload. Once closed, calls
+        are sent straight away. """
+        overflow = []
+        with self._cond:
+            stopped = self._stopped
+            if stopped:
+                pending = _Pending(None)
+                pending.data = data
+                taken = self._take(user_id, pending)
+            else:
+                pending = self._pending.get(user_id)
+                if pending is None:
+                    pending = self._pending[user_id] = _Pending(time.time() + self.window)
+                    excess = len(self._pending) - self.max_pending
+                    if excess > 0:
+                        overflow = list(itertools.islice(self._pending, excess))
+                    self._start()
+                    self._cond.notify_all()
+                merge(pending.data, data)
+            pending.on_errors.append(on_error)
+            pending.on_successes.append(on_success)
+        if stopped:
+            self._send_taken(user_id, *taken)
+        for user_id in overflow:
+            self.flush_user(user_id)
+
+    def flush_user(self, user_id):
+        """ Send the user's pending payload now, if there is one, waiting
+        first for any of theirs already being sent to resolve. """
+        with self._cond:
+            taken = self._take(user_id)
+        self._send_taken(user_id, *taken)
+
+    def flush(self):
+        """ Send every pending payload now. """
+        with self._cond:
+            users = list(self._pending)
+        for user_id in users:
+            self.flush_user(user_id)
+
+    def close(self):
+        """ Send every pending payload and stop the background thread. """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self.flush()
+
+    def _take(self, user_id, pending=None):
+        # Called with the lock held. Waits until no other thread is sending a
+        # payload for the user, then takes `pending`, by default the user's
+        # pending payload, marking the user as being sent for. Returns the
+        # payload (or None) and whether this call set the mark, which it
+        # doesn't if a callback of this thread's own send made it.
+        me = threading.current_thread()
+        while self._sending.get(user_id, me) is not me:
+            self._cond.wait()
+        if pending is None:
+            pending = self._pending.pop(user_id, None)
+        marked = pending is not None and user_id not in self._sending
+        if marked:
+            self._sending[user_id] = me
+        return pending, marked
+
+    def _send_taken(self, user_id, pending, marked):
+        try:
+            if pending is not None:
+                self._flush(pending)
+        finally:
+            if marked:
+                with self._cond:
+                    del self._sending[user_id]
+                    self._cond.notify_all()
+
+    def _flush(self, pending):
+        def on_error(code, err):
+            for callback in pending.on_errors:
+                callback(code, err)
+        def on_success():
+            for callback in pending.on_successes:
+                callback()
+        self._send(pending.data, on_error, on_success)
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='outbound-coalesce')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._pending:
+                        user_id, pending = next(iter(self._pending.items()))
+                        remaining = pending.deadline - time.time()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._stopped:
+                    return
+                taken = self._take(user_id)
+            try:
+                self._send_taken(user_id, *taken)
+            except Exception:
+                import traceback
+                traceback.print_exc()
+
+    def _reset(self):
+        self._pending = collections.OrderedDict()
+        self._sending = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def _after_fork(self):
+        # Pending calls stay with the parent, which sends them.
+        self._reset()
+
+class _Pending(object):
+    __slots__ = ('deadline', 'data', 'on_errors', 'on_successes')
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.data = {}
+        self.on_errors = []
+        self.on_successes = []
+
+def merge(target, source):
+    """ Deep-merge `source` into `target`. Later values win, except that the
+    apns and gcm token lists (or tuples) are unioned into lists. """
+    for key, value in source.items():
+        current = target.get(key)
+        if isinstance(current, dict) and isinstance(value, dict):
+            merge(current, value)
+        elif key in TOKEN_FIELDS and isinstance(current, list) and isinstance(value, (list, tuple)):
+            current.extend(token for token in value if token not in current)
+        elif isinstance(value, dict):
+            target[key] = merge({}, value)
+        elif key in TOKEN_FIELDS and isinstance(value, (list, tuple)):
+            target[key] = list(value)
+        else:
+            target[key] = value
+    return target
@@ -0,0 +1,32 @@
+ERROR_INIT = 1
+ERROR_USER_ID = 2
+ERROR_EVENT_NAME = 3
+ERROR_CONNECTION = 4
+ERROR_UNKNOWN = 5
+ERROR_TOKEN = 6
+ERROR_CAMPAIGN_IDS = 7
+ERROR_PREVIOUS_ID = 2
+ERROR_QUEUE_FULL = 8
+ERROR_CIRCUIT_OPEN = 9
+ERROR_RATE_LIMITED = 10
+ERROR_TIMEOUT = 11
+ERROR_RESPONSE_TIMEOUT = 12
+
+def error_message(code):
+    return _MESSAGES.get(code, "Unknown error")
+
+_MESSAGES = {
+    ERROR_INIT: "init() must be called before identifying any users.",
+    ERROR_USER_ID: "User ID must be a string or a number.",
+    ERROR_EVENT_NAME: "Event name must be a string.",
+    ERROR_CONNECTION: "Unable to connect to Outbound.",
+    ERROR_UNKNOWN: "Unknown error occurred.",
+    ERROR_TOKEN: "Token must be a string.",
+    ERROR_CAMPAIGN_IDS: "One or more campaigns must be specified.",
+    ERROR_PREVIOUS_ID: "Previous must be a string or a number.",
+    ERROR_QUEUE_FULL: "Event queue is full.",
+    ERROR_CIRCUIT_OPEN: "Outbound is unavailable. Call not attempted.",
+    ERROR_RATE_LIMITED: "Rate limit exceeded. Call not sent.",
+    ERROR_TIMEOUT: "Call deadline passed before it could be sent.",
+    ERROR_RESPONSE_TIMEOUT: "Outbound did not respond in time. The call may have been processed.",
+}
@@ -0,0 +1,62 @@
+""" Fork detection for pre-fork servers such as gunicorn and uwsgi, and for
+multiprocessing pools.
+
+A forked child inherits the parent's sockets, locks and queues but none of its
+threads, so objects holding them register here and have their _after_fork()
+method called in the child to start afresh. The child is noticed immediately
+through os.register_at_fork where it exists, and otherwise by check(), which
+the SDK calls before each API call.
+"""
+import atexit
+import os
+import sys
+import weakref
+
+_objects = weakref.WeakSet()
+_exit_handlers = []
+_pid = os.getpid()
+
+class _Marker(object):
+    pass
+
+_MARKER = _Marker()
+
+def register(obj):
+    """ Call obj._after_fork() in every forked child of this process. """
+    _objects.add(obj)
+
+def check():
+    """ Run the after-fork handlers if this process has forked since they last
+    ran. """
+    if _pid != os.getpid():
+        _after_fork()
+
+def at_exit(func):
+    """ Call func() when the process exits, like atexit.register, but also in
+    multiprocessing children, which exit without running atexit handlers. """
+    _exit_handlers.append(func)
+    atexit.register(func)
+
+def _after_fork():
+    global _pid
+    _pid = os.getpid()
+    for obj in list(_objects):
+        obj._after_fork()
+
+    util = sys.modules.get('multiprocessing.util')
+    if util is not None and _exit_handlers:
+        # A multiprocessing child drops finalizers registered before its
+        # target starts, so register again from its own after-fork hook too.
+        _finalize()
+        util.register_after_fork(_MARKER, _finalize)
+
+def _finalize(marker=None):
+    from multiprocessing.util import Finalize
+    Finalize(None, _run_exit_handlers, exitpriority=10)
+
+def _run_exit_handlers():
+    for func in _exit_handlers:
+        func()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,272 @@
+""" Bulk backfills of track or identify calls from NDJSON or CSV files.
+
+The file is memory-mapped and cut into batches of about `batch_size` bytes at
+line boundaries. A pool of worker threads (or processes) reads, maps and sends
+each batch with track_many() or identify_many(). Batches complete in file
+order, and after each one the byte offset it ends at is written to the
+checkpoint file. An interrupted import restarted with the same checkpoint
+resumes from there, resending at most the batches that were in flight.
+
+    python -m outbound import events.ndjson --key API_KEY --checkpoint events.ckpt
+
+Each NDJSON line is a JSON object and each CSV row (after a header row naming
+the columns) is one record. Quoted CSV fields may not contain newlines. Fields
+named after a track() or identify() argument are passed as that argument,
+`mapping` renames columns to arguments, and any other fields are merged into
+the event's properties or the user's attributes. Empty CSV fields are ignored
+and a CSV column passed as the timestamp argument is read as a number.
+"""
+import collections
+import csv
+import json
+import mmap
+import os
+import time
+
+from .client import Client
+from .errors import ERROR_UNKNOWN
+
+TRACK = 'track'
+IDENTIFY = 'identify'
+
+FIELDS = {
+    TRACK: ('user_id', 'event', 'first_name', 'last_name', 'email', 'phone_number',
+        'apns_tokens', 'gcm_tokens', 'user_attributes', 'properties', 'timestamp'),
+    IDENTIFY: ('user_id', 'previous_id', 'group_id', 'group_attributes', 'first_name',
+        'last_name', 'email', 'phone_number', 'apns_tokens', 'gcm_tokens', 'attributes'),
+}
+EXTRA_FIELD = {TRACK: 'properties', IDENTIFY: 'attributes'}
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+
+def import_file(path, key, kind=TRACK, format=None, mapping=None, workers=4, processes=False,
+        concurrency=4, batch_size=4 * 1024 * 1024, checkpoint=None, progress=None,
+        on_failure=None, **options):
+    """ Send a track or identify call for every record in a file.
+
+    :param str path: the NDJSON or CSV file to import.
+
+    :param str key: your Outbound API key.
+
+    :param str kind: OPTIONAL 'track' or 'identify'.
+
+    :param str format: OPTIONAL 'ndjson' or 'csv'. Defaults to 'csv' for files
+    ending in .csv and 'ndjson' otherwise.
+
+    :param dict mapping: OPTIONAL maps track() or identify() argument names to
+    the fields holding them, e.g. {'user_id': 'uid', 'event': 'name'}.
+    Raises ValueError if it names an unknown argument.
+
+    :param int workers: OPTIONAL the number of batches sent at once.
+
+    :param bool processes: OPTIONAL True to send batches from worker processes
+    rather than threads, for imports where parsing is the bottleneck.
+
+    :param int concurrency: OPTIONAL the number of requests each worker has in
+    flight.
+
+    :param int batch_size: OPTIONAL the approximate number of bytes per batch.
+
+    :param str checkpoint: OPTIONAL a file recording how far the import got. If
+    it exists, the import resumes from it.
+
+    :param func progress: OPTIONAL called with a report (see below) after each
+    batch.
+
+    :param func on_failure: OPTIONAL called as on_failure(offset, code, error)
+    for each record that could not be parsed or sent, `offset` being the byte
+    offset of its line. Records missing user_id (or event) are reported with
+    ERROR_USER_ID (or ERROR_EVENT_NAME).
+
+    Other keyword arguments are passed to each worker's outbound.Client.
+
+    :returns: a report: a dictionary with the file's `size` in bytes, the
+    `offset` imported up to, the number of `records` read and of those
+    `failed`, the `elapsed` seconds, and `records_per_second` and
+    `bytes_per_second` for this run.
+    """
+    if kind not in FIELDS:
+        raise ValueError('kind must be one of %s' % ', '.join(sorted(FIELDS)))
+    if format is None:
+        format = CSV if path.lower().endswith('.csv') else NDJSON
+    if format not in (NDJSON, CSV):
+        raise ValueError('format must be one of %s, %s' % (NDJSON, CSV))
+    unknown = sorted(set(mapping or ()) - set(FIELDS[kind]))
+    if unknown:
+        raise ValueError('mapping has unknown %s arguments: %s' % (kind, ', '.join(unknown)))
+
+    path = os.path.abspath(path)
+    size = os.path.getsize(path)
+    state = dict(path=path, size=size, offset=0, records=0, failed=0)
+    if checkpoint is not None and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            saved = json.load(f)
+        if saved['path'] != path or saved['size'] != size:
+            raise ValueError('checkpoint %s is for a different file' % checkpoint)
+        state = saved
+
+    report = _reporter(state)
+    if size == 0:
+        return report()
+
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        header = None
+        if format == CSV:
+            header_end = _line_end(buf, 0, size)
+            header = _csv_row(buf[:header_end])
+            state['offset'] = max(state['offset'], header_end)
+        ranges = list(_ranges(buf, state['offset'], size, batch_size))
+    finally:
+        buf.close()
+
+    args = (path, kind, format, header, mapping or {}, concurrency)
+    if processes:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers, _start_process, (key, options) + args)
+        send = _send_in_process
+        client = None
+    else:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(workers)
+        client = Client(key, **options)
+        send = _Worker(client, *args)
+
+    def finish(result):
+        end, records, failures = result.get()
+        state['offset'] = end
+        state['records'] += records
+        state['failed'] += len(failures)
+        if on_failure is not None:
+            for offset, code, error in failures:
+                on_failure(offset, code, error)
+        if checkpoint is not None:
+            _save(checkpoint, state)
+        if progress is not None:
+            progress(report())
+
+    # Batches are started no more than `workers` ahead of the last one
+    # checkpointed, so a restart resends at most that many.
+    results = collections.deque()
+    try:
+        for batch in ranges:
+            results.append(pool.apply_async(send, (batch,)))
+            if len(results) >= workers:
+                finish(results.popleft())
+        while results:
+            finish(results.popleft())
+    finally:
+        pool.close()
+        pool.join()
+        if client is not None:
+            client.close()
+    return report()
+
+class _Worker(object):
+    # Reads, maps and sends the records between two byte offsets, returning
+    # (end, records, failures).
+
+    def __init__(self, client, path, kind, format, header, mapping, concurrency):
+        self.client = client
+        self.path = path
+        self.kind = kind
+        self.format = format
+        self.header = header
+        self.mapping = mapping
+        self.concurrency = concurrency
+
+    def __call__(self, batch):
+        start, end = batch
+        offsets, records, failures = [], [], []
+        with open(self.path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            pos = start
+            while pos < end:
+                line_end = _line_end(buf, pos, end)
+                line = buf[pos:line_end].strip()
+                if line:
+                    try:
+                        records.append(self._arguments(line))
+                        offsets.append(pos)
+                    except ValueError as e:
+                        failures.append((pos, ERROR_UNKNOWN, 'Invalid record: %s' % e))
+                pos = line_end
+        finally:
+            buf.close()
+
+        count = len(records) + len(failures)
+        send_many = self.client.track_many if self.kind == TRACK else self.client.identify_many
+        for index, code, error in send_many(records, self.concurrency):
+            failures.append((offsets[index], code, error))
+        failures.sort(key=lambda failure: failure[0])
+        return end, count, failures
+
+    def _arguments(self, line):
+        if self.format == CSV:
+            row = _csv_row(line)
+            if len(row) != len(self.header):
+                raise ValueError('expected %d fields, got %d' % (len(self.header), len(row)))
+            record = dict((name, value) for name, value in zip(self.header, row) if value != '')
+        else:
+            record = json.loads(line.decode('utf-8'))
+            if not isinstance(record, dict):
+                raise ValueError('expected a JSON object')
+
+        arguments = {}
+        for field, column in self.mapping.items():
+            if column in record:
+                arguments[field] = record.pop(column)
+        for field in FIELDS[self.kind]:
+            if field in record and field not in arguments:
+                arguments[field] = record.pop(field)
+        if self.format == CSV and 'timestamp' in arguments:
+            arguments['timestamp'] = int(float(arguments['timestamp']))
+        if record:
+            extra = EXTRA_FIELD[self.kind]
+            merged = dict(arguments.get(extra) or {})
+            merged.update(record)
+            arguments[extra] = merged
+        return arguments
+
+_worker = None
+
+def _start_process(key, options, *args):
+    global _worker
+    _worker = _Worker(Client(key, **options), *args)
+
+def _send_in_process(batch):
+    return _worker(batch)
+
+def _ranges(buf, start, size, batch_size):
+    while start < size:
+        end = _line_end(buf, min(start + batch_size, size) - 1, size)
+        yield start, end
+        start = end
+
+def _line_end(buf, pos, end):
+    newline = buf.find(b'\n', pos, end)
+    return end if newline < 0 else newline + 1
+
+def _csv_row(line):
+    rows = list(csv.reader([line.decode('utf-8').rstrip('\r\n')]))
+    return rows[0] if rows else []
+
+def _reporter(state):
+    started, offset, records = time.time(), state['offset'], state['records']
+    def report():
+        elapsed = time.time() - started
+        result = dict((k, state[k]) for k in ('size', 'offset', 'records', 'failed'))
+        result['elapsed'] = elapsed
+        result['records_per_second'] = (state['records'] - records) / elapsed if elapsed else 0.0
+        result['bytes_per_second'] = (state['offset'] - offset) / elapsed if elapsed else 0.0
+        return result
+    return report
+
+def _save(checkpoint, state):
+    tmp = '%s.%d.tmp' % (checkpoint, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.rename(tmp, checkpoint)
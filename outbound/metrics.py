@@ -0,0 +1,233 @@
+""" Counters and timing histograms for the SDK's own behaviour.
+
+Enable with outbound.init(metrics=Metrics(...)) and read with outbound.stats().
+When no Metrics object is configured nothing is measured.
+
+Snapshots are plain dictionaries:
+
+    {
+        'calls': {'track': {'success': 10, 'error': 1}},
+        'errors': {'track': {4: 1}},
+        'bytes_sent': 2048,
+        'latency': {'request': {'count': 11, 'sum': 0.21, 'buckets': [[0.001, 0], ...]}},
+        'gauges': {'queue_depth': 0},
+    }
+
+`latency` holds one histogram per phase of a call: `build` (validation and
+payload construction), `serialize`, `compress` (when bodies are gzipped),
+`request` (each HTTP attempt, including any connection setup) and `total`
+(from the call to its callback). Bucket counts are cumulative, as in
+Prometheus.
+
+Each process counts its own calls: a forked child starts again from zero and
+runs its own exporters.
+"""
+import threading
+import time
+
+from . import fork
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram(object):
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = 0
+        for bound in BUCKETS:
+            if value <= bound:
+                break
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        buckets, total = [], 0
+        for bound, count in zip(BUCKETS + ('+Inf',), self.counts):
+            total += count
+            buckets.append([bound, total])
+        return dict(count=self.count, sum=self.sum, buckets=buckets)
+
+class Metrics(object):
+    """ Collects counters and latency histograms.
+
+    :param list exporters: OPTIONAL functions called with a snapshot every
+    `export_interval` seconds, e.g. a StatsdExporter.
+
+    :param float export_interval: OPTIONAL seconds between exports.
+    """
+
+    def __init__(self, exporters=(), export_interval=10):
+        self.exporters = list(exporters)
+        self.export_interval = export_interval
+
+        self._gauges = {}
+        self._stopped = threading.Event()
+        self._reset()
+        fork.register(self)
+
+    def success(self, endpoint):
+        with self._lock:
+            counts = self._calls.setdefault(endpoint, dict(success=0, error=0))
+            counts['success'] += 1
+
+    def error(self, endpoint, code):
+        with self._lock:
+            counts = self._calls.setdefault(endpoint, dict(success=0, error=0))
+            counts['error'] += 1
+            errors = self._errors.setdefault(endpoint, {})
+            errors[code] = errors.get(code, 0) + 1
+
+    def sent(self, size):
+        with self._lock:
+            self._bytes_sent += size
+
+    def observe(self, phase, seconds):
+        with self._lock:
+            histogram = self._latency.get(phase)
+            if histogram is None:
+                histogram = self._latency[phase] = Histogram()
+            histogram.observe(seconds)
+
+    def gauge(self, name, func):
+        """ Report func() as gauge `name` in every snapshot. """
+        with self._lock:
+            self._gauges[name] = func
+
+    def wrap(self, endpoint, on_error, on_success, started):
+        """ Wrap a call's callbacks to count its outcome and total latency. """
+        def error(code, err):
+            self.observe('total', time.time() - started)
+            self.error(endpoint, code)
+            on_error(code, err)
+        def success():
+            self.observe('total', time.time() - started)
+            self.success(endpoint)
+            on_success()
+        return error, success
+
+    def snapshot(self):
+        with self._lock:
+            gauges = list(self._gauges.items())
+            snapshot = dict(
+                calls=dict((k, dict(v)) for k, v in self._calls.items()),
+                errors=dict((k, dict(v)) for k, v in self._errors.items()),
+                bytes_sent=self._bytes_sent,
+                latency=dict((k, v.snapshot()) for k, v in self._latency.items()),
+            )
+        snapshot['gauges'] = dict((name, func()) for name, func in gauges)
+        return snapshot
+
+    def close(self):
+        """ Stop exporting. """
+        self._stopped.set()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._errors = {}
+        self._bytes_sent = 0
+        self._latency = {}
+        self._thread = None
+        if self.exporters and not self._stopped.is_set():
+            self._thread = threading.Thread(target=self._export_forever, name='outbound-metrics')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _after_fork(self):
+        closed = self._stopped.is_set()
+        self._stopped = threading.Event()
+        if closed:
+            self._stopped.set()
+        self._reset()
+
+    def _export_forever(self):
+        while not self._stopped.wait(self.export_interval):
+            snapshot = self.snapshot()
+            for exporter in self.exporters:
+                try:
+                    exporter(snapshot)
+                except Exception:
+                    pass
+
+def prometheus_text(snapshot, prefix='outbound'):
+    """ Render a snapshot in the Prometheus text exposition format. """
+    lines = []
+    lines.append('# TYPE %s_calls_total counter' % prefix)
+    for endpoint, counts in sorted(snapshot['calls'].items()):
+        for result, value in sorted(counts.items()):
+            lines.append('%s_calls_total{endpoint="%s",result="%s"} %d' % (prefix, endpoint, result, value))
+    lines.append('# TYPE %s_errors_total counter' % prefix)
+    for endpoint, codes in sorted(snapshot['errors'].items()):
+        for code, value in sorted(codes.items()):
+            lines.append('%s_errors_total{endpoint="%s",code="%s"} %d' % (prefix, endpoint, code, value))
+    lines.append('# TYPE %s_bytes_sent_total counter' % prefix)
+    lines.append('%s_bytes_sent_total %d' % (prefix, snapshot['bytes_sent']))
+    lines.append('# TYPE %s_phase_seconds histogram' % prefix)
+    for phase, histogram in sorted(snapshot['latency'].items()):
+        for bound, count in histogram['buckets']:
+            lines.append('%s_phase_seconds_bucket{phase="%s",le="%s"} %d' % (prefix, phase, bound, count))
+        lines.append('%s_phase_seconds_sum{phase="%s"} %r' % (prefix, phase, histogram['sum']))
+        lines.append('%s_phase_seconds_count{phase="%s"} %d' % (prefix, phase, histogram['count']))
+    for name, value in sorted(snapshot['gauges'].items()):
+        lines.append('# TYPE %s_%s gauge' % (prefix, name))
+        lines.append('%s_%s %s' % (prefix, name, value))
+    return '\n'.join(lines) + '\n'
+
+def statsd_lines(snapshot, previous=None, prefix='outbound'):
+    """ Render the change between two snapshots as StatsD lines: counters as
+    `|c` deltas, mean phase latencies as `|ms` timings and gauges as `|g`. """
+    previous = previous or dict(calls={}, errors={}, bytes_sent=0, latency={})
+    lines = []
+    for endpoint, counts in sorted(snapshot['calls'].items()):
+        before = previous['calls'].get(endpoint, {})
+        for result, value in sorted(counts.items()):
+            delta = value - before.get(result, 0)
+            if delta:
+                lines.append('%s.calls.%s.%s:%d|c' % (prefix, endpoint.replace('/', '_'), result, delta))
+    for endpoint, codes in sorted(snapshot['errors'].items()):
+        before = previous['errors'].get(endpoint, {})
+        for code, value in sorted(codes.items()):
+            delta = value - before.get(code, 0)
+            if delta:
+                lines.append('%s.errors.%s.%s:%d|c' % (prefix, endpoint.replace('/', '_'), code, delta))
+    delta = snapshot['bytes_sent'] - previous['bytes_sent']
+    if delta:
+        lines.append('%s.bytes_sent:%d|c' % (prefix, delta))
+    for phase, histogram in sorted(snapshot['latency'].items()):
+        before = previous['latency'].get(phase, dict(count=0, sum=0.0))
+        count = histogram['count'] - before['count']
+        if count:
+            mean = (histogram['sum'] - before['sum']) / count
+            lines.append('%s.latency.%s:%.3f|ms' % (prefix, phase, mean * 1000))
+    for name, value in sorted(snapshot['gauges'].items()):
+        lines.append('%s.%s:%s|g' % (prefix, name, value))
+    return lines
+
+class StatsdExporter(object):
+    """ An exporter sending each snapshot's changes to a StatsD server over UDP. """
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='outbound'):
+        self.address = (host, port)
+        self.prefix = prefix
+        import socket
+
+        self._previous = None
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        fork.register(self)
+
+    def __call__(self, snapshot):
+        lines = statsd_lines(snapshot, self._previous, self.prefix)
+        self._previous = snapshot
+        if lines:
+            self._socket.sendto('\n'.join(lines).encode('utf-8'), self.address)
+
+    def _after_fork(self):
+        self._previous = None
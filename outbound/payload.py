@@ -0,0 +1,195 @@
+""" Validation and construction of API request payloads.
+
+Each *_payload function takes the arguments of the corresponding API call and
+returns a (code, path, data) tuple. `code` is None if the arguments are valid,
+in which case `data` should be POSTed to `path` under the API root. Otherwise
+it is the outbound.ERROR_XXXXXX describing the problem, and `data` may hold
+a message to report in place of the code's usual one.
+"""
+import sys
+import time
+from numbers import Number
+
+from .errors import (
+    ERROR_USER_ID, ERROR_EVENT_NAME, ERROR_UNKNOWN, ERROR_TOKEN, ERROR_CAMPAIGN_IDS,
+    ERROR_PREVIOUS_ID, error_message,
+)
+
+try:
+    STRING_TYPES = (basestring,)
+    INTEGER_TYPES = (int, long)
+except NameError:
+    STRING_TYPES = (str,)
+    INTEGER_TYPES = (int,)
+ID_TYPES = STRING_TYPES + (Number,)
+EXACT_ID_TYPES = frozenset(STRING_TYPES + INTEGER_TYPES + (str, float, type(u'')))
+
+def is_id(value):
+    return type(value) in EXACT_ID_TYPES or isinstance(value, ID_TYPES)
+
+def alias_payload(user_id, previous_id):
+    if not is_id(user_id):
+        return ERROR_USER_ID, None, None
+
+    if not is_id(previous_id):
+        return ERROR_PREVIOUS_ID, None, None
+
+    data = dict(
+        user_id=user_id,
+        previous_id=previous_id,
+    )
+    return None, 'identify', data
+
+def identify_payload(user_id, previous_id=None, group_id=None, group_attributes=None,
+            first_name=None, last_name=None, email=None,
+            phone_number=None, apns_tokens=None, gcm_tokens=None,
+            attributes=None):
+    if not is_id(user_id):
+        return ERROR_USER_ID, None, None
+
+    data = user(
+        first_name,
+        last_name,
+        email,
+        phone_number,
+        apns_tokens,
+        gcm_tokens,
+        attributes,
+        previous_id,
+        group_id,
+        group_attributes,)
+    data['user_id'] = user_id
+    return None, 'identify', data
+
+def track_payload(user_id, event, first_name=None, last_name=None, email=None,
+        phone_number=None, apns_tokens=None, gcm_tokens=None,
+        user_attributes=None, properties=None, timestamp=None):
+    if not is_id(user_id):
+        return ERROR_USER_ID, None, None
+    if not isinstance(event, STRING_TYPES):
+        return ERROR_EVENT_NAME, None, None
+
+    data = {'user_id': user_id, 'event': event}
+    if (first_name or last_name or email or phone_number or apns_tokens or
+            gcm_tokens or user_attributes):
+        user_data = user(
+            first_name,
+            last_name,
+            email,
+            phone_number,
+            apns_tokens,
+            gcm_tokens,
+            user_attributes,
+            None, None, None)
+        if user_data:
+            data['user'] = user_data
+
+    if properties:
+        if isinstance(properties, dict):
+            data['properties'] = properties
+        else:
+            sys.stderr.write('Invalid event properties given. Expected dictionary. ' +
+                        'Got %s' % type(properties).__name__)
+
+    if timestamp:
+        data['timestamp'] = timestamp
+    else:
+        data['timestamp'] = int(time.time())
+    return None, 'track', data
+
+def subscription_payload(user_id, unsubscribe, all_campaigns=False, campaign_ids=None):
+    if not is_id(user_id):
+        return ERROR_USER_ID, None, None
+
+    if not all_campaigns and (not isinstance(campaign_ids, (list, tuple)) or len(campaign_ids) == 0):
+        # subscribe() and unsubscribe() have always reported missing
+        # campaigns with the ERROR_TOKEN code.
+        return ERROR_TOKEN, None, error_message(ERROR_CAMPAIGN_IDS)
+
+    path = '/'.join([('unsubscribe' if unsubscribe else 'subscribe'), ('all' if all_campaigns else 'campaigns')])
+    data = dict(
+        user_id=user_id,
+    )
+
+    if not all_campaigns:
+        data['campaign_ids'] = campaign_ids
+    return None, path, data
+
+def device_token_payload(platform, register, user_id, token='', all=False):
+    if not is_id(user_id):
+        return ERROR_USER_ID, None, None
+
+    if not all and not isinstance(token, STRING_TYPES):
+        return ERROR_TOKEN, None, None
+
+    data = dict(
+        user_id=user_id,
+    )
+    if all:
+        data["all"] = True
+    else:
+        data["token"] = token
+    return None, "%s/%s" % (platform, 'register' if register else 'disable'), data
+
+def record_payload(build, record):
+    """ Build the payload for one record of a bulk call, a dictionary of
+    keyword arguments for `build`. A record missing user_id or event fails as
+    if it were None. One that can't be passed to `build` at all, e.g. for an
+    unknown key, fails with ERROR_UNKNOWN and the reason in place of data. """
+    try:
+        return build(**record)
+    except TypeError as e:
+        if isinstance(record, dict):
+            if 'user_id' not in record:
+                return ERROR_USER_ID, None, None
+            if build is track_payload and 'event' not in record:
+                return ERROR_EVENT_NAME, None, None
+        return ERROR_UNKNOWN, None, 'Invalid record: %s' % e
+
+def user(first_name, last_name, email, phone_number, apns_tokens,
+        gcm_tokens, attributes, previous_id, group_id, group_attributes):
+
+    data = {}
+    if previous_id:
+        data['previous_id'] = previous_id
+    if group_id:
+        data['group_id'] = group_id
+    if group_attributes:
+        if isinstance(group_attributes, dict):
+            data['group_attributes'] = group_attributes
+        else:
+            sys.stderr.write('Invalid group attributes given. Expected dictionary. ' +
+                        'Got %s' % type(group_attributes).__name__)
+    if first_name:
+        data['first_name'] = first_name
+    if last_name:
+        data['last_name'] = last_name
+    if email:
+        data['email'] = email
+    if phone_number:
+        data['phone_number'] = phone_number
+    if apns_tokens:
+        if isinstance(apns_tokens, (list, tuple)):
+            data['apns'] = apns_tokens
+        elif isinstance(apns_tokens, STRING_TYPES):
+            data['apns'] = [apns_tokens]
+        else:
+            sys.stderr.write('Invalid APNS tokens given. Expected string or ' +
+                        'list of strings. Got %s' % type(apns_tokens).__name__)
+    if gcm_tokens:
+        if isinstance(gcm_tokens, (list, tuple)):
+            data['gcm'] = gcm_tokens
+        elif isinstance(gcm_tokens, STRING_TYPES):
+            data['gcm'] = [gcm_tokens]
+        else:
+            sys.stderr.write('Invalid GCM tokens given. Expected string or ' +
+                        'list of strings. Got %s' % type(gcm_tokens).__name__)
+
+    if attributes:
+        if isinstance(attributes, dict):
+            data['attributes'] = attributes
+        else:
+            sys.stderr.write('Invalid user attributes given. Expected dictionary. ' +
+                        'Got %s' % type(attributes).__name__)
+
+    return data
@@ -0,0 +1,107 @@
+import threading
+import time
+import zlib
+
+from . import fork
+from .cache import LRUCache
+
+class TokenBucket(object):
+    """ Holds up to `burst` tokens, refilled at `rate` tokens per second. """
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+class RateLimiter(object):
+    """ Token bucket rate limits for calls, checked before any work is done
+    to build or send them.
+
+    Limits can be set globally, per event name and per user. A call is allowed
+    only if every applicable bucket has a token, and then takes one from each.
+    Rejected calls fail with ERROR_RATE_LIMITED, except for a deterministic
+    `sample_rate` fraction of users and events that are always let through.
+
+    :param float rate: OPTIONAL calls per second allowed in total.
+
+    :param float event_rate: OPTIONAL calls per second allowed for each event
+    name.
+
+    :param float user_rate: OPTIONAL calls per second allowed for each user.
+
+    :param float burst: OPTIONAL the bucket sizes, i.e. how many calls may be
+    made at once after a quiet period. At least 1. Defaults to one second's
+    worth, or 1 for rates below one call per second.
+
+    :param int max_users: OPTIONAL the number of per-user buckets kept. The
+    least recently used are discarded first.
+
+    :param int max_events: OPTIONAL the number of per-event buckets kept.
+
+    :param float sample_rate: OPTIONAL the fraction, between 0 and 1, of
+    (user, event) pairs whose calls bypass the limits. The same pairs are
+    always chosen.
+    """
+
+    def __init__(self, rate=None, event_rate=None, user_rate=None, burst=None,
+            max_users=100000, max_events=1000, sample_rate=0):
+        if burst is not None and burst < 1:
+            raise ValueError('burst must be at least 1')
+        self.rate = rate
+        self.event_rate = event_rate
+        self.user_rate = user_rate
+        self.burst = burst
+        self.sample_rate = sample_rate
+
+        self._lock = threading.Lock()
+        self._global = TokenBucket(rate, self._burst(rate), time.time()) if rate else None
+        self._events = LRUCache(max_events)
+        self._users = LRUCache(max_users)
+        fork.register(self)
+
+    def allow(self, user_id, event=None):
+        """ Whether a call for `user_id` (and `event`, for track calls) may be
+        made now. """
+        now = time.time()
+        with self._lock:
+            buckets = []
+            if self._global is not None:
+                buckets.append(self._global)
+            if self.event_rate and event is not None:
+                buckets.append(self._bucket(self._events, event, self.event_rate, now))
+            if self.user_rate:
+                buckets.append(self._bucket(self._users, user_id, self.user_rate, now))
+
+            for bucket in buckets:
+                bucket.refill(now)
+            if all(bucket.tokens >= 1 for bucket in buckets):
+                for bucket in buckets:
+                    bucket.tokens -= 1
+                return True
+
+        return bool(self.sample_rate) and self._sampled(user_id, event)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def _bucket(self, buckets, key, rate, now):
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate, self._burst(rate), now)
+            buckets.set(key, bucket)
+        return bucket
+
+    def _burst(self, rate):
+        # A bucket holding less than one token would never allow a call.
+        return self.burst or max(1, rate)
+
+    def _sampled(self, user_id, event):
+        key = u'{0}\x00{1}'.format(user_id, event).encode('utf-8')
+        return (zlib.crc32(key) & 0xffffffff) < self.sample_rate * 0x100000000
@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+
+class RetryPolicy(object):
+    """ Decides which failed API calls are retried and how long to wait
+    between attempts.
+
+    Only failures where Outbound cannot have processed the call are retried:
+    connection errors and the statuses in `retry_statuses` (by default 429 Too
+    Many Requests and 503 Service Unavailable). Calls sent but not answered in
+    time (ERROR_RESPONSE_TIMEOUT) are not retried unless `retry_timeouts` is
+    set, as they may have been processed. Waits grow exponentially with
+    full jitter, and a Retry-After header on the response takes precedence.
+
+    :param int max_retries: OPTIONAL the number of retries after the first
+    attempt. 0 disables retrying.
+
+    :param float backoff_factor: OPTIONAL the base wait in seconds. The wait
+    before retry n is drawn uniformly from [0, backoff_factor * 2 ** n].
+
+    :param float max_backoff: OPTIONAL the longest wait in seconds. A
+    Retry-After asking for longer than this ends the retries.
+
+    :param tuple retry_statuses: OPTIONAL the HTTP statuses to retry.
+
+    :param bool retry_connection_errors: OPTIONAL False to not retry calls that
+    fail with ERROR_CONNECTION.
+
+    :param bool retry_timeouts: OPTIONAL True to retry calls that fail with
+    ERROR_RESPONSE_TIMEOUT, accepting that they may be processed twice.
+    """
+
+    def __init__(self, max_retries=3, backoff_factor=0.5, max_backoff=30,
+            retry_statuses=(429, 503), retry_connection_errors=True, retry_timeouts=False):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_connection_errors = retry_connection_errors
+        self.retry_timeouts = retry_timeouts
+
+    def is_retryable(self, status, timed_out=False):
+        """ Whether a call that got `status` (None for a connection error, or
+        if `timed_out` waiting for the response) may be retried. """
+        if status is None:
+            return self.retry_timeouts if timed_out else self.retry_connection_errors
+        return status in self.retry_statuses
+
+    def delay(self, retry, retry_after=None):
+        """ The number of seconds to wait before retry number `retry` (starting
+        at 0), or None if no further retry should be made.
+
+        :param str retry_after: OPTIONAL the Retry-After header of the failed
+        response, either a number of seconds or an HTTP date.
+        """
+        if retry >= self.max_retries:
+            return None
+        if retry_after is not None:
+            wait = parse_retry_after(retry_after)
+            if wait is not None:
+                return wait if wait <= self.max_backoff else None
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * (2 ** retry)))
+
+def parse_retry_after(value):
+    """ Convert a Retry-After header to seconds from now. Returns None if the
+    header can't be parsed. """
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    import email.utils
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(parsed) - time.time())
+
+class CircuitBreaker(object):
+    """ Fails calls fast while an endpoint is unhealthy.
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    allow() returns False. Once `reset_timeout` seconds have passed a single
+    trial call is allowed through. If it succeeds the breaker closes again,
+    otherwise it stays open for another `reset_timeout`.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.time()
@@ -0,0 +1,138 @@
+""" A sender process that delivers calls on behalf of many worker processes.
+
+Under a pre-fork server each worker would otherwise open its own connection
+pool to Outbound. Instead, start one sender before forking and point every
+worker's client at it; workers then hand their calls to the sender over a
+local socket (a named pipe on Windows) and it sends them over one shared pool,
+with its own retries, circuit breakers and spool.
+
+    # in the gunicorn master, e.g. from the on_starting hook
+    process, address = outbound.sender.start(key, spool_dir='/var/spool/outbound')
+
+    # before forking or in each worker
+    outbound.init(key, sender=address)
+
+Each call is written to the sender as one JSON encoded [path, data, deadline]
+message and answered with [code, error] once it resolves, so callbacks in the
+workers fire exactly as if they had sent the call themselves. The deadline is
+the call's own, a Unix time or null, and the sender keeps to it as the worker
+would have.
+"""
+import json
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client as connect
+
+from . import fork
+from .errors import ERROR_CONNECTION, ERROR_RESPONSE_TIMEOUT, error_message
+
+def start(key, address=None, authkey=None, **options):
+    """ Run a sender in a daemon child process.
+
+    :param str key: your Outbound API key.
+
+    :param address: OPTIONAL where to listen, as accepted by
+    multiprocessing.connection.Listener. Defaults to a fresh Unix socket (or
+    named pipe on Windows).
+
+    :param bytes authkey: OPTIONAL a secret workers must present to connect.
+
+    Other keyword arguments are passed to the sender's outbound.Client.
+
+    :returns: a tuple of the multiprocessing.Process and the address it listens
+    on.
+    """
+    import multiprocessing
+
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(
+        target=serve,
+        args=(key, address, authkey, child),
+        kwargs=options,
+        name='outbound-sender',
+    )
+    process.daemon = True
+    process.start()
+    return process, parent.recv()
+
+def serve(key, address=None, authkey=None, ready=None, **options):
+    """ Deliver calls from workers with a Client(key, **options) until the
+    process exits. If `ready` is a Connection, the listening address is sent
+    on it once workers can connect. """
+    from .client import Client
+
+    client = Client(key, **options)
+    listener = Listener(address, authkey=authkey)
+    if ready is not None:
+        ready.send(listener.address)
+    try:
+        while True:
+            try:
+                conn = listener.accept()
+            except (IOError, OSError, EOFError, AuthenticationError):
+                continue
+            thread = threading.Thread(target=_handle, args=(client, conn), name='outbound-sender')
+            thread.daemon = True
+            thread.start()
+    finally:
+        listener.close()
+        client.close()
+
+def _handle(client, conn):
+    try:
+        while True:
+            path, data, deadline = json.loads(conn.recv_bytes().decode('utf-8'))
+            code, error = client._deliver(path, client.serializer(data), deadline)
+            conn.send_bytes(json.dumps([code, error]).encode('utf-8'))
+    except (IOError, OSError, EOFError):
+        pass
+    finally:
+        conn.close()
+
+class Remote(object):
+    """ A worker's link to a sender. Each thread gets its own connection,
+    opened on first use and reopened after errors or a fork. """
+
+    def __init__(self, address, authkey=None):
+        self.address = address
+        self.authkey = authkey
+
+        self._local = threading.local()
+        fork.register(self)
+
+    def deliver(self, path, body, deadline=None):
+        """ Have the sender deliver a call, given its serialized body. Returns
+        (code, error) as Client._deliver does, or ERROR_RESPONSE_TIMEOUT if the
+        sender has not answered by `deadline`, as it may have sent the call. """
+        message = b'[' + _dumps(path) + b',' + body + b',' + _dumps(deadline) + b']'
+        conn = getattr(self._local, 'conn', None)
+        try:
+            if conn is None:
+                conn = self._local.conn = connect(self.address, authkey=self.authkey)
+            conn.send_bytes(message)
+            if deadline is not None and not conn.poll(max(0, deadline - time.time())):
+                # The answer would arrive out of turn on a reused connection.
+                self._local.conn = None
+                conn.close()
+                return ERROR_RESPONSE_TIMEOUT, error_message(ERROR_RESPONSE_TIMEOUT)
+            code, error = json.loads(conn.recv_bytes().decode('utf-8'))
+        except (IOError, OSError, EOFError, AuthenticationError):
+            self._local.conn = None
+            if conn is not None:
+                conn.close()
+            return ERROR_CONNECTION, error_message(ERROR_CONNECTION)
+        return code, error
+
+    def close(self):
+        """ Close the calling thread's connection. Others close when their
+        threads exit. """
+        conn, self._local.conn = getattr(self._local, 'conn', None), None
+        if conn is not None:
+            conn.close()
+
+    def _after_fork(self):
+        self._local = threading.local()
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,27 @@
+""" Request body serializers.
+
+A serializer takes an API payload and returns its JSON encoding as UTF-8
+bytes. Any such callable can be passed to outbound.init(serializer=...).
+"""
+import json
+
+def stdlib(data):
+    """ Serialize with the standard library json module. """
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+def default():
+    """ Return the fastest serializer available: orjson if it is installed,
+    otherwise stdlib. """
+    try:
+        import orjson
+    except ImportError:
+        return stdlib
+
+    dumps = orjson.dumps
+    def fast(data):
+        try:
+            return dumps(data)
+        except TypeError:
+            # orjson rejects a few things json accepts, e.g. non-string keys.
+            return stdlib(data)
+    return fast
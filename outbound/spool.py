@@ -0,0 +1,212 @@
+""" Durable on-disk spool for API calls that could not reach Outbound.
+
+Calls are appended to numbered segment files in a spool directory. Each record
+is framed as a 4 byte length and a 4 byte CRC32 (both big-endian) followed by
+the JSON encoded [path, data] pair, where path is relative to the API root.
+Segments are rotated once they reach `segment_size` and appends are refused
+once the spool holds `max_size` bytes.
+
+Replay streams records back in order, reading each sealed segment through
+mmap, and deletes segments once every record in them has been delivered. To
+drain a spool from the command line:
+
+    python -m outbound.spool replay DIRECTORY --key API_KEY
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+
+FRAME = struct.Struct('>II')
+SEGMENT_SUFFIX = '.seg'
+CURSOR_NAME = 'cursor'
+
+class Spool(object):
+    """ An append-only spool of API calls stored in `directory`.
+
+    :param str directory: the directory holding the spool's segment files. It
+    is created if it does not exist.
+
+    :param int segment_size: OPTIONAL the size in bytes after which a new
+    segment is started.
+
+    :param int max_size: OPTIONAL the total size in bytes after which appends
+    are refused.
+    """
+
+    def __init__(self, directory, segment_size=16 * 1024 * 1024, max_size=256 * 1024 * 1024):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_size = max_size
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._file = None
+        self._active = None
+        self._size = sum(os.path.getsize(self._path(seq)) for seq in self._segments())
+
+    def __len__(self):
+        return self._size
+
+    def append(self, path, data):
+        """ Append a call to the spool. `data` may be the payload or its JSON
+        encoding as bytes. Returns False if the spool is full. """
+        if isinstance(data, bytes):
+            record = b'[' + json.dumps(path).encode('utf-8') + b',' + data + b']'
+        else:
+            record = json.dumps([path, data], separators=(',', ':')).encode('utf-8')
+        frame = FRAME.pack(len(record), zlib.crc32(record) & 0xffffffff) + record
+
+        with self._lock:
+            if self._size + len(frame) > self.max_size:
+                return False
+            if self._file is None or self._file.tell() + len(frame) > self.segment_size:
+                self._seal()
+                segments = self._segments()
+                self._active = (segments[-1] + 1) if segments else 1
+                self._file = open(self._path(self._active), 'ab')
+            self._file.write(frame)
+            self._file.flush()
+            self._size += len(frame)
+        return True
+
+    def replay(self, send):
+        """ Stream spooled calls, oldest first, to `send`.
+
+        :param func send: called as send(path, data) for each spooled call. It
+        should return True once the call is delivered (or permanently rejected)
+        and False to stop replaying, e.g. while Outbound is still unreachable.
+
+        :returns: the number of calls replayed. Returns 0 without replaying if
+        another replay is already running.
+        """
+        if not self._replay_lock.acquire(False):
+            return 0
+        try:
+            with self._lock:
+                self._seal()
+                segments = self._segments()
+
+            count = 0
+            cursor_seq, cursor_offset = self._read_cursor()
+            for seq in segments:
+                offset = cursor_offset if seq == cursor_seq else 0
+                records = _read_segment(self._path(seq), offset)
+                try:
+                    for end, path, data in records:
+                        if not send(path, data):
+                            self._write_cursor(seq, offset)
+                            return count
+                        count += 1
+                        offset = end
+                finally:
+                    records.close()
+
+                size = os.path.getsize(self._path(seq))
+                os.remove(self._path(seq))
+                with self._lock:
+                    self._size -= size
+            self._write_cursor(None, 0)
+            return count
+        finally:
+            self._replay_lock.release()
+
+    def close(self):
+        """ Close the active segment file. """
+        with self._lock:
+            self._seal()
+
+    def _seal(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._active = None
+
+    def _path(self, seq):
+        return os.path.join(self.directory, '%016d%s' % (seq, SEGMENT_SUFFIX))
+
+    def _segments(self):
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _read_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_NAME)) as f:
+                seq, offset = f.read().split()
+                return int(seq), int(offset)
+        except (IOError, OSError, ValueError):
+            return None, 0
+
+    def _write_cursor(self, seq, offset):
+        path = os.path.join(self.directory, CURSOR_NAME)
+        if seq is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        with open(path + '.tmp', 'w') as f:
+            f.write('%d %d' % (seq, offset))
+        os.rename(path + '.tmp', path)
+
+def _read_segment(filename, offset):
+    """ Yield (end offset, path, data) for each intact record in a segment,
+    starting at `offset`. Stops at the first torn or corrupt frame. """
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= offset:
+            return
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            pos = offset
+            while pos + FRAME.size <= size:
+                length, crc = FRAME.unpack_from(buf, pos)
+                start = pos + FRAME.size
+                end = start + length
+                if end > size:
+                    break
+                record = buf[start:end]
+                if zlib.crc32(record) & 0xffffffff != crc:
+                    sys.stderr.write('Corrupt record in %s at offset %d. ' % (filename, pos) +
+                                'Skipping the rest of the segment.')
+                    break
+                path, data = json.loads(record.decode('utf-8'))
+                yield end, path, data
+                pos = end
+        finally:
+            buf.close()
+
+def main(argv=None):
+    import outbound
+
+    parser = argparse.ArgumentParser(prog='python -m outbound.spool')
+    commands = parser.add_subparsers(dest='command')
+    replay = commands.add_parser('replay', help='send every spooled call to Outbound')
+    replay.add_argument('directory', help='the spool directory')
+    replay.add_argument('--key', required=True, help='your Outbound API key')
+    args = parser.parse_args(argv)
+
+    if args.command != 'replay':
+        parser.print_usage()
+        return 2
+
+    outbound.init(args.key, spool_dir=args.directory)
+    try:
+        count = outbound.replay_spool()
+    finally:
+        outbound.close()
+    remaining = len(Spool(args.directory))
+
+    sys.stdout.write('Replayed %d calls. %d bytes remain spooled.\n' % (count, remaining))
+    return 1 if remaining else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+""" A local record of which device tokens are registered with Outbound, used to
+skip register_token() and disable_token() calls that would change nothing.
+
+State is kept per (platform, user) and only updated once a call succeeds:
+registering or disabling a token, disabling all of a user's tokens, and
+identify() or track() calls carrying apns_tokens or gcm_tokens.
+"""
+import json
+import os
+import threading
+import time
+
+from . import fork
+from .cache import LRUCache
+
+class TokenCache(object):
+    """ Remembers the device tokens registered and disabled for up to
+    `max_size` (platform, user) pairs, evicting the least recently used first.
+    State older than `ttl` seconds is forgotten.
+
+    :param int max_size: the number of (platform, user) pairs remembered.
+
+    :param float ttl: OPTIONAL the number of seconds state is trusted for.
+
+    :param str path: OPTIONAL a file the cache is loaded from when created and
+    saved to by save(). Processes sharing a file each save their own state,
+    the last one to save winning.
+    """
+
+    def __init__(self, max_size, ttl=None, path=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        self._users = LRUCache(max_size)
+        self._lock = threading.Lock()
+        if path is not None:
+            self._load()
+        fork.register(self)
+
+    def __len__(self):
+        return len(self._users)
+
+    def known(self, platform, user_id, token, register):
+        """ Whether registering (or disabling) `token` is known to change
+        nothing. A token of None stands for all of the user's tokens. Counts
+        a hit or miss. """
+        registered, disabled, all_disabled = self._get(platform, user_id)
+        if token is None:
+            found = not register and all_disabled and not registered
+        elif register:
+            found = token in registered
+        else:
+            found = token in disabled or (all_disabled and token not in registered)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def update(self, platform, user_id, tokens, register):
+        """ Record that `tokens` were registered (or disabled). A token of None
+        stands for all of the user's tokens. """
+        with self._lock:
+            registered, disabled, all_disabled = self._get(platform, user_id)
+            if None in tokens:
+                registered, disabled, all_disabled = frozenset(), frozenset(), True
+            elif register:
+                registered, disabled = registered.union(tokens), disabled.difference(tokens)
+            else:
+                registered, disabled = registered.difference(tokens), disabled.union(tokens)
+            self._users.set((platform, user_id), (registered, disabled, all_disabled, time.time()))
+
+    def save(self):
+        """ Write the cache to its file, if it has one. """
+        if self.path is None:
+            return
+        now = time.time()
+        entries = [
+            [platform, user_id, sorted(registered), sorted(disabled), all_disabled, updated]
+            for (platform, user_id), (registered, disabled, all_disabled, updated) in self._users.items()
+            if self.ttl is None or updated + self.ttl > now
+        ]
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(entries, f, separators=(',', ':'))
+        os.rename(tmp, self.path)
+
+    def _get(self, platform, user_id):
+        state = self._users.get((platform, user_id))
+        if state is None or (self.ttl is not None and state[3] + self.ttl <= time.time()):
+            return frozenset(), frozenset(), False
+        return state[:3]
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        for platform, user_id, registered, disabled, all_disabled, updated in entries:
+            self._users.set((platform, user_id),
+                (frozenset(registered), frozenset(disabled), all_disabled, updated))
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
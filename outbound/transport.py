@@ -0,0 +1,483 @@
+""" HTTP transports used by Client to POST request bodies.
+
+A transport is created by calling a factory with the client's pool options,
+transport(pool_connections=..., pool_maxsize=...), and must provide:
+
+    post(url, body, headers, timeout) -> (status, text, retry_after)
+        Send one POST, waiting at most `timeout` seconds (None for no limit)
+        to connect and for each read. `retry_after` is the Retry-After
+        header, if any. `status` is None if no response was received: `text`
+        is then TIMED_OUT if the request was sent in full but not answered,
+        whether it timed out or the connection failed, as Outbound may have
+        processed it, and None if the request could not be sent. `retry_after`
+        is None too.
+
+    close()
+        Close any pooled connections.
+
+Pass the factory to outbound.init(transport=...). Three are provided: the
+default RequestsTransport, which honours proxy settings from the environment,
+HTTPClientTransport, which uses only the standard library and so starts
+faster, and HTTP2Transport, which multiplexes concurrent requests over a few
+HTTP/2 connections. None imports its HTTP library until its first request.
+"""
+import threading
+import time
+
+TIMED_OUT = 'timed out'
+
+class RequestsTransport(object):
+    """ Sends requests through a pooled, keep-alive requests.Session. """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+
+        self._session = None
+        self._lock = threading.Lock()
+
+    def post(self, url, body, headers, timeout=None):
+        import requests
+        from urllib3.exceptions import ProtocolError
+
+        session = self._session or self._connect()
+        try:
+            resp = session.post(url, data=body, headers=headers, timeout=timeout)
+            return resp.status_code, resp.text, resp.headers.get('Retry-After')
+        except (requests.exceptions.ReadTimeout, requests.exceptions.ChunkedEncodingError):
+            return None, TIMED_OUT, None
+        except requests.exceptions.ConnectionError as e:
+            # urllib3 reports a connection that failed once open, after the
+            # request may have gone out, as "Connection aborted." ProtocolError.
+            # Failures to connect come wrapped in MaxRetryError instead.
+            if e.args and isinstance(e.args[0], ProtocolError):
+                return None, TIMED_OUT, None
+            return None, None, None
+        except requests.exceptions.Timeout:
+            return None, None, None
+
+    def close(self):
+        session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+    def _connect(self):
+        import requests
+
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+            return self._session
+
+class HTTPClientTransport(object):
+    """ Sends requests over keep-alive http.client connections, keeping up to
+    `pool_maxsize` idle connections per host. Idle connections the server has
+    closed are discarded before use, and a request that fails once sent is
+    not resent but reported as TIMED_OUT. Proxies are not supported. """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._ssl_context = None
+
+    def post(self, url, body, headers, timeout=None):
+        http_client = _http_client()
+        host, path = self._split(url)
+        conn = self._checkout(host) or self._open(http_client, host)
+        conn.timeout = timeout
+        try:
+            if conn.sock is None:
+                conn.connect()
+            else:
+                conn.sock.settimeout(timeout)
+            conn.request('POST', path, body, headers)
+        except (EnvironmentError, http_client.HTTPException):
+            conn.close()
+            return None, None, None
+        try:
+            resp = conn.getresponse()
+            text = resp.read()
+        except (EnvironmentError, http_client.HTTPException):
+            # Sent, so Outbound may have processed it whatever went wrong,
+            # a timeout included.
+            conn.close()
+            return None, TIMED_OUT, None
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self._checkin(host, conn)
+        return resp.status, text.decode('utf-8', 'replace'), resp.getheader('Retry-After')
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def _split(self, url):
+        scheme, rest = url.split('://', 1)
+        netloc, _, path = rest.partition('/')
+        return (scheme, netloc), '/' + path
+
+    def _checkout(self, host):
+        while True:
+            with self._lock:
+                conns = self._idle.get(host)
+                if not conns:
+                    return None
+                conn = conns.pop()
+            if not _dropped(conn.sock):
+                return conn
+            conn.close()
+
+    def _checkin(self, host, conn):
+        with self._lock:
+            conns = self._idle.get(host)
+            if conns is None and len(self._idle) < self.pool_connections:
+                conns = self._idle[host] = []
+            if conns is not None and len(conns) < self.pool_maxsize:
+                conns.append(conn)
+                return
+        conn.close()
+
+    def _open(self, http_client, host):
+        scheme, netloc = host
+        if scheme == 'https':
+            if self._ssl_context is None:
+                import ssl
+                self._ssl_context = ssl.create_default_context()
+            return http_client.HTTPSConnection(netloc, context=self._ssl_context)
+        return http_client.HTTPConnection(netloc)
+
+class HTTP2Transport(object):
+    """ Sends requests as concurrent streams over at most `max_connections`
+    HTTP/2 connections per host, each carrying up to `max_concurrent_streams`
+    requests at once (or fewer if the server says so). Requests wait for a
+    free stream, within their timeout, once every connection is full. HPACK
+    header compression means the headers repeated on every request, such as
+    X-Outbound-Key, are sent in full only once per connection.
+
+    Requires the h2 package (pip install outbound[http2]). Requests are sent
+    over HTTP/1.1 by an HTTPClientTransport instead if h2 is not installed,
+    if the server does not negotiate HTTP/2 through TLS ALPN, or for http://
+    URLs unless `prior_knowledge` is set. Proxies are not supported.
+
+    Options other than the pool sizes, which apply to the HTTP/1.1 fallback,
+    can be bound with functools.partial:
+
+        outbound.init(key, transport=functools.partial(HTTP2Transport, max_connections=4))
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, max_connections=1,
+            max_concurrent_streams=100, prior_knowledge=False):
+        self.max_connections = max_connections
+        self.max_concurrent_streams = max_concurrent_streams
+        self.prior_knowledge = prior_knowledge
+
+        self._http1 = HTTPClientTransport(pool_connections, pool_maxsize)
+        self._http1_hosts = set()
+        self._connections = {}
+        self._opening = {}
+        self._cond = threading.Condition()
+        self._ssl_context = None
+        self._h2 = _UNLOADED
+
+    def post(self, url, body, headers, timeout=None):
+        h2 = self._h2
+        if h2 is _UNLOADED:
+            h2 = self._h2 = _h2()
+        host, path = self._http1._split(url)
+        if (h2 is None or host in self._http1_hosts or
+                (host[0] == 'http' and not self.prior_knowledge)):
+            return self._http1.post(url, body, headers, timeout)
+
+        deadline = None if timeout is None else time.time() + timeout
+        conn = self._checkout(h2, host, deadline)
+        if conn is _HTTP1:
+            return self._http1.post(url, body, headers, timeout)
+        if conn is None:
+            return None, None, None
+        try:
+            return conn.request(path, body, headers, deadline)
+        finally:
+            self._checkin(host, conn)
+
+    def close(self):
+        with self._cond:
+            connections, self._connections = self._connections, {}
+        for conns in connections.values():
+            for conn in conns:
+                conn.close()
+        self._http1.close()
+
+    def _checkout(self, h2, host, deadline):
+        # Reserve a stream on the least busy connection, opening another if
+        # they are all full and the limit allows, or else wait for one.
+        with self._cond:
+            while True:
+                conns = self._connections.setdefault(host, [])
+                conns[:] = [conn for conn in conns if not conn.dead]
+                free = [conn for conn in conns if conn.active < min(self.max_concurrent_streams, conn.limit)]
+                if free:
+                    conn = min(free, key=lambda conn: conn.active)
+                    conn.active += 1
+                    return conn
+                if len(conns) + self._opening.get(host, 0) < self.max_connections:
+                    self._opening[host] = self._opening.get(host, 0) + 1
+                    break
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+        conn = None
+        try:
+            conn = self._open(h2, host, deadline)
+        except (EnvironmentError, h2.exceptions.ProtocolError):
+            pass
+        with self._cond:
+            self._opening[host] -= 1
+            if conn is _HTTP1:
+                self._http1_hosts.add(host)
+            elif conn is not None:
+                conn.active += 1
+                self._connections.setdefault(host, []).append(conn)
+            self._cond.notify_all()
+        return conn
+
+    def _checkin(self, host, conn):
+        with self._cond:
+            conn.active -= 1
+            self._cond.notify_all()
+
+    def _open(self, h2, host, deadline):
+        import socket
+
+        scheme, netloc = host
+        hostname, _, port = netloc.partition(':')
+        port = int(port or (443 if scheme == 'https' else 80))
+        timeout = None if deadline is None else max(deadline - time.time(), 0.001)
+        sock = socket.create_connection((hostname, port), timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if scheme == 'https':
+            if self._ssl_context is None:
+                import ssl
+                context = ssl.create_default_context()
+                context.set_alpn_protocols(['h2', 'http/1.1'])
+                self._ssl_context = context
+            sock = self._ssl_context.wrap_socket(sock, server_hostname=hostname)
+            if sock.selected_alpn_protocol() != 'h2':
+                sock.close()
+                return _HTTP1
+        sock.settimeout(None)
+        conn = _H2Connection(h2, sock, scheme, netloc)
+        # Streams are only opened once the server's limit on them is known.
+        if not conn.settled.wait(None if deadline is None else max(deadline - time.time(), 0)) or conn.dead:
+            conn.close()
+            return None
+        return conn
+
+_HTTP1 = object()
+_UNLOADED = object()
+
+class _H2Connection(object):
+    # One HTTP/2 connection. Callers send their streams under `lock`, and a
+    # reader thread dispatches the server's frames to the waiting streams.
+
+    def __init__(self, h2, sock, scheme, authority):
+        self.h2 = h2
+        self.sock = sock
+        self.scheme = scheme
+        self.authority = authority
+        self.active = 0
+        self.dead = False
+
+        self.conn = h2.connection.H2Connection(config=h2.config.H2Configuration(
+            client_side=True, header_encoding='utf-8'))
+        self.lock = threading.Lock()
+        self.window = threading.Condition(self.lock)
+        self.streams = {}
+        self.settled = threading.Event()
+
+        with self.lock:
+            self.conn.initiate_connection()
+            self.sock.sendall(self.conn.data_to_send())
+        thread = threading.Thread(target=self._read, name='outbound-h2')
+        thread.daemon = True
+        thread.start()
+
+    @property
+    def limit(self):
+        return self.conn.remote_settings.max_concurrent_streams
+
+    def request(self, path, body, headers, deadline):
+        stream = _Stream()
+        request_headers = [
+            (':method', 'POST'), (':scheme', self.scheme),
+            (':authority', self.authority), (':path', path),
+            ('content-length', str(len(body))),
+        ] + [(name.lower(), value) for name, value in headers.items()]
+        try:
+            with self.lock:
+                if self.dead:
+                    return None, None, None
+                stream_id = self.conn.get_next_available_stream_id()
+                self.streams[stream_id] = stream
+                self.conn.send_headers(stream_id, request_headers, end_stream=not body)
+                sent = 0
+                while sent < len(body):
+                    size = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size)
+                    if size <= 0:
+                        self.sock.sendall(self.conn.data_to_send())
+                        remaining = None if deadline is None else deadline - time.time()
+                        if self.dead or (remaining is not None and remaining <= 0):
+                            return self._abandon(stream_id)
+                        self.window.wait(remaining)
+                        continue
+                    self.conn.send_data(stream_id, body[sent:sent + size], end_stream=sent + size >= len(body))
+                    sent += size
+                self.sock.sendall(self.conn.data_to_send())
+        except (EnvironmentError, self.h2.exceptions.ProtocolError):
+            self.close()
+            return None, None, None
+
+        # The request is sent in full from here on, so unless the server
+        # refused the stream it may have been processed.
+        if not stream.done.wait(None if deadline is None else max(deadline - time.time(), 0)):
+            with self.lock:
+                self._abandon(stream_id)
+            return None, TIMED_OUT, None
+        if stream.status is None:
+            return None, None if stream.refused else TIMED_OUT, None
+        return stream.status, b''.join(stream.data).decode('utf-8', 'replace'), stream.retry_after
+
+    def close(self):
+        import socket
+
+        self.dead = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except EnvironmentError:
+            pass
+        self.sock.close()
+
+    def _abandon(self, stream_id):
+        # Called with the lock held when a stream's deadline passes.
+        self.streams.pop(stream_id, None)
+        if not self.dead:
+            try:
+                self.conn.reset_stream(stream_id, error_code=8)
+                self.sock.sendall(self.conn.data_to_send())
+            except (EnvironmentError, self.h2.exceptions.ProtocolError):
+                pass
+        return None, None, None
+
+    def _read(self):
+        events = self.h2.events
+        try:
+            while True:
+                data = self.sock.recv(65536)
+                if not data:
+                    break
+                with self.lock:
+                    for event in self.conn.receive_data(data):
+                        stream = self.streams.get(getattr(event, 'stream_id', None))
+                        if isinstance(event, events.ResponseReceived) and stream is not None:
+                            for name, value in event.headers:
+                                if name == ':status':
+                                    stream.status = int(value)
+                                elif name == 'retry-after':
+                                    stream.retry_after = value
+                        elif isinstance(event, events.DataReceived):
+                            if stream is not None:
+                                stream.data.append(event.data)
+                            try:
+                                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                            except self.h2.exceptions.StreamClosedError:
+                                pass
+                        elif isinstance(event, (events.StreamEnded, events.StreamReset)):
+                            if stream is not None:
+                                if isinstance(event, events.StreamReset):
+                                    stream.status = None
+                                    # REFUSED_STREAM: not processed at all.
+                                    stream.refused = event.error_code == 7
+                                del self.streams[event.stream_id]
+                                stream.done.set()
+                        elif isinstance(event, events.RemoteSettingsChanged):
+                            self.settled.set()
+                        elif isinstance(event, events.ConnectionTerminated):
+                            # The server did not process streams after the
+                            # last one it names. They end, unanswered, when
+                            # the connection closes and may be retried.
+                            self.dead = True
+                            last = event.last_stream_id
+                            for stream_id, other in self.streams.items():
+                                if last is not None and stream_id > last:
+                                    other.refused = True
+                        self.window.notify_all()
+                    self.sock.sendall(self.conn.data_to_send())
+        except (EnvironmentError, self.h2.exceptions.ProtocolError):
+            pass
+        finally:
+            with self.lock:
+                self.dead = True
+                streams, self.streams = self.streams, {}
+                self.window.notify_all()
+            self.settled.set()
+            for stream in streams.values():
+                stream.status = None
+                stream.done.set()
+            self.sock.close()
+
+class _Stream(object):
+    __slots__ = ('status', 'data', 'retry_after', 'refused', 'done')
+
+    def __init__(self):
+        self.status = None
+        self.data = []
+        self.retry_after = None
+        self.refused = False
+        self.done = threading.Event()
+
+def _dropped(sock):
+    # An idle keep-alive socket is readable only if the server closed it (or
+    # sent something unsolicited), either way making it unusable.
+    import select
+
+    try:
+        if hasattr(select, 'poll'):
+            poll = select.poll()
+            poll.register(sock, select.POLLIN)
+            return bool(poll.poll(0))
+        return bool(select.select([sock], [], [], 0)[0])
+    except (EnvironmentError, ValueError):
+        return True
+
+def _h2():
+    try:
+        import h2.config
+        import h2.connection
+        import h2.events
+        import h2.exceptions
+    except ImportError:
+        return None
+    return h2
+
+def _http_client():
+    try:
+        from http import client as http_client
+    except ImportError:
+        import httplib as http_client
+    return http_client
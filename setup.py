@@ -31,8 +31,11 @@ setup(
     license='MIT License',
     install_requires=[
         'requests',
-        'six',
     ],
+    extras_require={
+        'aio': ['aiohttp'],
+        'http2': ['h2'],
+    },
     description='Outbound sends automated email, SMS, phone calls and push notifications based on the actions users take (or do not take) in your app.',
     long_description=long_description
 )
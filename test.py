@@ -1,6 +1,32 @@
+import functools
+import gzip
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
 import unittest
 
+try:
+    import http.server as BaseHTTPServer
+    import socketserver
+except ImportError:
+    import BaseHTTPServer
+    import SocketServer as socketserver
+
 import outbound
+from benchmarks.stub import H2StubServer
+from outbound.cache import LRUCache
+from outbound.spool import Spool
+from outbound.transport import HTTP2Transport, HTTPClientTransport, RequestsTransport
+
+try:
+    import h2
+except ImportError:
+    h2 = None
 
 api_key = "testapikey"
 first_run = True
@@ -37,5 +63,1075 @@ class AnalyticsBasicTests(unittest.TestCase):
         outbound.register_token(outbound.APNS, [1,2], "token", on_error=user_id_on_error)
         outbound.register_token(outbound.APNS, 1, None, on_error=token_on_error)
 
+    def test_subscribe(self):
+        errors = []
+        outbound.subscribe(1, on_error=lambda code, err: errors.append((code, err)))
+        outbound.unsubscribe(1, campaign_ids=[], on_error=lambda code, err: errors.append((code, err)))
+        message = "One or more campaigns must be specified."
+        self.assertEqual([(outbound.ERROR_TOKEN, message)] * 2, errors)
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('content-length', 0)))
+        if self.headers.get('content-encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+        with self.server.lock:
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.active -= 1
+        self.server.requests.append((self.path, self.client_address, body))
+        self.server.encodings.append(self.headers.get('content-encoding'))
+        self.server.keys.append(self.headers.get('x-outbound-key'))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        headers = {}
+        if isinstance(status, tuple):
+            status, headers = status
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+class HangUpHandler(StubHandler):
+    # Reads each request and closes the connection without answering.
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('content-length', 0)))
+        self.server.requests.append((self.path, self.client_address, body))
+        self.close_connection = True
+
+class StubServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.requests = []
+        self.encodings = []
+        self.keys = []
+        self.statuses = []
+        self.delay = 0
+        self.active = self.max_active = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/v2' % self.server_address[1]
+
+    def payloads(self):
+        return [json.loads(body.decode('utf-8')) for _, _, body in self.requests]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class StubServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        outbound.init(api_key, base_url=self.server.url)
+
+    def tearDown(self):
+        outbound.close()
+        self.server.stop()
+
+class SessionTests(StubServerTestCase):
+    def test_connection_reuse(self):
+        successes = []
+        for i in range(3):
+            outbound.identify(i, on_success=lambda: successes.append(1))
+        self.assertEqual(3, len(successes))
+        self.assertEqual(1, len(set(addr for _, addr, _ in self.server.requests)),
+            "Expected all requests to share one connection.")
+
+    def test_close(self):
+        outbound.close()
+        def on_error(code, err):
+            self.assertEqual(outbound.ERROR_INIT, code, "Expected init() error.")
+        outbound.track(1, "event", on_error=on_error)
+        self.assertEqual([], self.server.requests)
+
+class ClientTests(StubServerTestCase):
+    def test_independent_clients(self):
+        first = outbound.Client('first', base_url=self.server.url)
+        second = outbound.Client('second', base_url=self.server.url, buffered=True)
+        try:
+            first.track(1, 'event')
+            second.track(2, 'event')
+            outbound.track(3, 'event')
+            self.assertTrue(second.flush(1))
+        finally:
+            first.close()
+            second.close()
+        self.assertEqual(sorted(['first', 'second', api_key]), sorted(self.server.keys))
+
+        errors = []
+        first.track(1, 'event', on_error=lambda code, err: errors.append(code))
+        self.assertEqual([outbound.ERROR_INIT], errors)
+
+    def test_track_with_user_fields(self):
+        errors = []
+        outbound.track(1, 'event', email='ada@example.com', on_error=lambda code, err: errors.append(code))
+        self.assertEqual([], errors)
+        self.assertEqual({'email': 'ada@example.com'}, self.server.payloads()[0]['user'])
+
+    def test_registry(self):
+        registry = outbound.ClientRegistry(max_size=2, base_url=self.server.url)
+        a = registry.get('a')
+        self.assertIs(a, registry.get('a'))
+        b = registry.get('b')
+        registry.get('a')
+        registry.get('c')
+        self.assertEqual(2, len(registry))
+        self.assertTrue(b.closed)
+        self.assertFalse(a.closed)
+
+        registry.get('a').identify(1)
+        self.assertEqual(['a'], self.server.keys)
+        registry.close()
+        self.assertTrue(a.closed)
+        self.assertEqual(0, len(registry))
+
+class TransportTests(StubServerTestCase):
+    def setUp(self):
+        self.server = StubServer()
+        outbound.init(api_key, base_url=self.server.url, transport=HTTPClientTransport)
+
+    def test_http_client(self):
+        successes, errors = [], []
+        for i in range(3):
+            outbound.identify(i, on_success=lambda: successes.append(1))
+        self.server.statuses.extend([(429, {'Retry-After': '0'}), 200, 400])
+        outbound.track(1, 'event', on_success=lambda: successes.append(1))
+        outbound.track(1, 'event', on_error=lambda code, err: errors.append(code))
+        self.assertEqual(4, len(successes))
+        self.assertEqual([outbound.ERROR_UNKNOWN], errors)
+        self.assertEqual(6, len(self.server.requests))
+        self.assertEqual(1, len(set(addr for _, addr, _ in self.server.requests)),
+            "Expected all requests to share one connection.")
+
+    def test_connection_error(self):
+        errors = []
+        client = outbound.Client(api_key, base_url=unused_url(), transport=HTTPClientTransport,
+            retry_policy=outbound.RetryPolicy(max_retries=0))
+        client.track(1, 'event', on_error=lambda code, err: errors.append(code))
+        client.close()
+        self.assertEqual([outbound.ERROR_CONNECTION], errors)
+
+    def test_stale_connection(self):
+        self.server.RequestHandlerClass = type('IdleStubHandler', (StubHandler,), {'timeout': 0.1})
+        outbound.init(api_key, base_url=self.server.url, transport=HTTPClientTransport,
+            retry_policy=outbound.RetryPolicy(max_retries=0))
+        errors = []
+        outbound.track(1, 'event', on_error=lambda code, err: errors.append(code))
+        time.sleep(0.3)
+        outbound.track(2, 'event', on_error=lambda code, err: errors.append(code))
+        self.assertEqual([], errors)
+        self.assertEqual(2, len(set(addr for _, addr, _ in self.server.requests)))
+
+    def test_sent_requests_not_resent(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for transport in (HTTPClientTransport, RequestsTransport):
+            self.server.requests, self.server.delay = [], 0
+            outbound.init(api_key, base_url=self.server.url, transport=transport, timeout=0.2,
+                spool_dir=directory)
+            outbound.track(1, 'warm')
+            self.server.delay = 0.5
+            errors = []
+            started = time.time()
+            outbound.track(1, 'slow', on_error=lambda code, err: errors.append(code))
+            self.assertLess(time.time() - started, 0.4)
+            self.assertEqual([outbound.ERROR_RESPONSE_TIMEOUT], errors)
+            time.sleep(0.6)
+            self.assertEqual(['warm', 'slow'], [p['event'] for p in self.server.payloads()])
+            self.assertEqual(0, outbound.replay_spool())
+
+    def test_unanswered_requests_not_resent(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.server.RequestHandlerClass = HangUpHandler
+        for transport in (HTTPClientTransport, RequestsTransport):
+            self.server.requests = []
+            outbound.init(api_key, base_url=self.server.url, transport=transport,
+                spool_dir=directory, retry_policy=outbound.RetryPolicy(max_retries=3, backoff_factor=0))
+            errors = []
+            outbound.track(1, 'event', on_error=lambda code, err: errors.append(code))
+            self.assertEqual([outbound.ERROR_RESPONSE_TIMEOUT], errors)
+            self.assertEqual(1, len(self.server.requests))
+            self.assertEqual(0, outbound.replay_spool())
+
+    def test_lazy_imports(self):
+        import subprocess
+        import sys
+        output = subprocess.check_output([sys.executable, '-c',
+            'import sys, outbound; print([m for m in ("requests", "six") if m in sys.modules])'])
+        self.assertEqual(b'[]', output.strip())
+
+    def test_http2_falls_back_to_http1(self):
+        client = outbound.Client(api_key, base_url=self.server.url, transport=HTTP2Transport)
+        try:
+            self.assertEqual([], list(client.track_many([dict(user_id=1, event='event')])))
+        finally:
+            client.close()
+        self.assertEqual(1, len(self.server.requests))
+
+@unittest.skipIf(h2 is None, 'requires h2')
+class HTTP2TransportTests(unittest.TestCase):
+    def setUp(self):
+        self.server = H2StubServer(latency=0.05, max_concurrent_streams=4).start()
+        self.addCleanup(self.server.stop)
+
+    def client(self, **options):
+        transport = functools.partial(HTTP2Transport, prior_knowledge=True, **options)
+        client = outbound.Client(api_key, base_url=self.server.url, transport=transport,
+            retry_policy=outbound.RetryPolicy(max_retries=0))
+        self.addCleanup(client.close)
+        return client
+
+    def test_multiplexing(self):
+        records = [dict(user_id=i, event='event') for i in range(12)]
+        started = time.time()
+        self.assertEqual([], list(self.client().track_many(records, concurrency=12)))
+        self.assertLess(time.time() - started, 12 * 0.05)
+        self.assertEqual(({200: 12}, 1, 4), (self.server.counts, self.server.connections, self.server.max_active))
+
+        self.server.counts = {}
+        self.server.throttle_rate = 1
+        errors = list(self.client(max_connections=2).track_many(records[:1]))
+        self.assertEqual([(0, outbound.ERROR_UNKNOWN)], [(index, code) for index, code, _ in errors])
+        self.assertEqual({429: 1}, self.server.counts)
+
+    def test_timeout(self):
+        self.server.latency = 1
+        client = self.client()
+        client.timeout = 0.1
+        errors = []
+        client.track(1, 'event', on_error=lambda code, err: errors.append(code))
+        self.assertEqual([outbound.ERROR_RESPONSE_TIMEOUT], errors)
+
+    def test_reset_streams(self):
+        # INTERNAL_ERROR after the request arrived: it may have been
+        # processed, so it is not retried. REFUSED_STREAM: it was not.
+        for error_code, code, streams in ((2, outbound.ERROR_RESPONSE_TIMEOUT, 1), (7, outbound.ERROR_CONNECTION, 4)):
+            url, received = resetting_h2_server(error_code)
+            transport = functools.partial(HTTP2Transport, prior_knowledge=True)
+            client = outbound.Client(api_key, base_url=url, transport=transport,
+                retry_policy=outbound.RetryPolicy(max_retries=3, backoff_factor=0))
+            errors = []
+            client.track(1, 'event', on_error=lambda code, err: errors.append(code))
+            client.close()
+            self.assertEqual([code], errors)
+            self.assertEqual(streams, len(received))
+
+def resetting_h2_server(error_code):
+    # Serves one HTTP/2 connection, resetting every stream with `error_code`
+    # once its request has arrived in full. Returns the URL and the list of
+    # stream IDs reset.
+    import h2.config
+    import h2.connection
+    import h2.events
+
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    received = []
+
+    def serve():
+        sock, _ = listener.accept()
+        listener.close()
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        conn.initiate_connection()
+        sock.sendall(conn.data_to_send())
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            for event in conn.receive_data(data):
+                if isinstance(event, h2.events.StreamEnded):
+                    received.append(event.stream_id)
+                    conn.reset_stream(event.stream_id, error_code=error_code)
+            sock.sendall(conn.data_to_send())
+        sock.close()
+
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+    return 'http://127.0.0.1:%d/v2' % listener.getsockname()[1], received
+
+def track_in_child(event):
+    outbound.track(2, event)
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'requires fork')
+class ForkTests(StubServerTestCase):
+    def test_buffered_calls_sent_once(self):
+        import multiprocessing
+        outbound.init(api_key, base_url=self.server.url, buffered=True, flush_interval=5)
+        outbound.track(1, 'parent')
+        process = multiprocessing.get_context('fork').Process(target=track_in_child, args=('child',))
+        process.start()
+        process.join()
+        self.assertTrue(outbound.flush(1))
+        self.assertEqual(['child', 'parent'], sorted(p['event'] for p in self.server.payloads()))
+
+    def test_sender(self):
+        from outbound import sender
+        process, address = sender.start(api_key, base_url=self.server.url)
+        try:
+            client = outbound.Client(api_key, sender=address)
+            successes, errors = [], []
+            client.track(1, 'event', on_success=lambda: successes.append(1))
+            client.track(None, 'event', on_error=lambda code, err: errors.append(code))
+            self.server.statuses.append(400)
+            client.identify(1, on_error=lambda code, err: errors.append(code))
+            client.close()
+        finally:
+            process.terminate()
+        self.assertEqual([1], successes)
+        self.assertEqual([outbound.ERROR_USER_ID, outbound.ERROR_UNKNOWN], errors)
+        self.assertEqual(2, len(self.server.requests))
+
+        client.track(1, 'event', on_error=lambda code, err: errors.append(code))
+        self.assertEqual(outbound.ERROR_INIT, errors[-1])
+
+    def test_sender_deadline(self):
+        from outbound import sender
+        process, address = sender.start(api_key, base_url=self.server.url)
+        try:
+            remote = sender.Remote(address)
+            body = outbound.serializers.stdlib({'user_id': 1, 'event': 'event'})
+            # Already past its deadline when the sender gets it: not sent.
+            code, _ = remote.deliver('track', body, time.time() - 1)
+            self.assertEqual(outbound.ERROR_RESPONSE_TIMEOUT, code)
+            self.assertEqual((None, None), remote.deliver('track', body))
+            self.assertEqual(1, len(self.server.requests))
+            self.server.delay = 1
+            code, _ = remote.deliver('track', body, time.time() + 0.2)
+            self.assertEqual(outbound.ERROR_RESPONSE_TIMEOUT, code)
+            remote.close()
+        finally:
+            process.terminate()
+
+class BufferedTests(StubServerTestCase):
+    def setUp(self):
+        self.server = StubServer()
+
+    def test_size_flush(self):
+        outbound.init(api_key, base_url=self.server.url, buffered=True,
+            max_batch_size=2, flush_interval=60)
+        successes = []
+        for i in range(5):
+            outbound.track(i, "event", on_success=lambda: successes.append(1))
+        self.assertTrue(outbound.flush(timeout=5))
+        self.assertEqual(5, len(successes))
+        self.assertEqual(list(range(5)), [p['user_id'] for p in self.server.payloads()])
+
+    def test_interval_flush(self):
+        outbound.init(api_key, base_url=self.server.url, buffered=True,
+            flush_interval=0.05)
+        done = threading.Event()
+        outbound.identify(1, on_success=done.set)
+        self.assertTrue(done.wait(5), "Expected queued identify to be sent.")
+
+    def test_queue_full(self):
+        outbound.init(api_key, base_url=self.server.url, buffered=True,
+            max_queue_size=0)
+        errors = []
+        outbound.track(1, "event", on_error=lambda code, err: errors.append(code))
+        self.assertEqual([outbound.ERROR_QUEUE_FULL], errors)
+
+    def test_close_drains(self):
+        outbound.init(api_key, base_url=self.server.url, buffered=True,
+            flush_interval=60)
+        outbound.track(1, "event")
+        outbound.close()
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_close_times_out(self):
+        self.server.delay = 0.2
+        outbound.init(api_key, base_url=self.server.url, buffered=True, flush_interval=0,
+            drain_timeout=0.1)
+        successes, errors = [], []
+        for i in range(5):
+            outbound.track(i, "event", on_success=lambda: successes.append(1),
+                on_error=lambda code, err: errors.append(code))
+        outbound.close()
+        self.assertEqual(5, len(successes) + len(errors))
+        self.assertEqual([outbound.ERROR_TIMEOUT] * len(errors), errors)
+        self.assertEqual(len(successes), len(self.server.requests))
+
+    def overflow(self, policy, **options):
+        outbound.init(api_key, base_url=self.server.url, buffered=True, flush_interval=60,
+            max_queue_bytes=120, overflow=policy, **options)
+        errors = []
+        for i in range(3):
+            outbound.track(i, "event", timestamp=1, on_error=lambda code, err, i=i: errors.append((i, code)))
+        self.assertTrue(outbound.flush(timeout=5))
+        return errors, [p['user_id'] for p in self.server.payloads()]
+
+    def test_overflow_policies(self):
+        self.assertEqual(([(2, outbound.ERROR_QUEUE_FULL)], [0, 1]), self.overflow('drop_newest'))
+        self.server.requests = []
+        self.assertEqual(([(0, outbound.ERROR_QUEUE_FULL)], [1, 2]), self.overflow('drop_oldest'))
+        self.server.requests = []
+        self.assertEqual(([(2, outbound.ERROR_QUEUE_FULL)], [0, 1]), self.overflow('block', block_timeout=0.05))
+        self.server.requests = []
+        self.assertRaises(outbound.QueueFull, self.overflow, 'raise')
+
+    def test_deadline(self):
+        outbound.init(api_key, base_url=self.server.url, buffered=True, flush_interval=60,
+            deadline=0.05)
+        errors = []
+        outbound.track(1, "event", on_error=lambda code, err: errors.append(code))
+        time.sleep(0.1)
+        self.assertTrue(outbound.flush(timeout=5))
+        self.assertEqual([outbound.ERROR_TIMEOUT], errors)
+        self.assertEqual([], self.server.requests)
+
+    def test_lanes_keep_per_user_order(self):
+        outbound.init(api_key, base_url=self.server.url, buffered=True, lanes=4,
+            flush_interval=60, metrics=outbound.Metrics())
+        for i in range(20):
+            for user_id in range(8):
+                outbound.track(user_id, 'e%d' % i)
+        outbound.alias(3, 'anonymous')
+        outbound.register_token(outbound.APNS, 3, 'token')
+        depths = [outbound.stats()['gauges']['lane_depth_%d' % lane] for lane in range(4)]
+        self.assertEqual(162, sum(depths))
+        self.assertEqual([40, 40, 40, 42], depths)
+        self.assertTrue(outbound.flush(timeout=5))
+
+        payloads = self.server.payloads()
+        for user_id in range(8):
+            events = [p['event'] for p in payloads if p['user_id'] == user_id and 'event' in p]
+            self.assertEqual(['e%d' % i for i in range(20)], events)
+        self.assertEqual(['/v2/track', '/v2/identify', '/v2/apns/register'],
+            [path for path, _, body in self.server.requests if b'"user_id":3' in body.replace(b' ', b'')][-3:])
+
+    def test_lanes_mix_id_types(self):
+        from outbound.buffer import Call, ShardedQueue
+        queue = ShardedQueue(lambda call: None, lanes=8, flush_interval=60)
+        try:
+            for user_id in range(20):
+                before = queue.depths()
+                queue.put(Call('track', b'{}', None, None, None), user_id)
+                queue.put(Call('track', b'{}', None, None, None), str(user_id))
+                added = [after - depth for after, depth in zip(queue.depths(), before)]
+                self.assertEqual([0] * 7 + [2], sorted(added))
+        finally:
+            queue.close(1)
+
+    def test_request_timeout(self):
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        try:
+            outbound.init(api_key, base_url='http://127.0.0.1:%d/v2' % listener.getsockname()[1],
+                timeout=0.1, retry_policy=outbound.RetryPolicy(max_retries=0))
+            errors = []
+            started = time.time()
+            outbound.track(1, "event", on_error=lambda code, err: errors.append(code))
+            self.assertEqual([outbound.ERROR_RESPONSE_TIMEOUT], errors)
+            self.assertLess(time.time() - started, 2)
+        finally:
+            listener.close()
+
+def unused_url():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return 'http://127.0.0.1:%d/v2' % port
+
+class SpoolTests(StubServerTestCase):
+    def setUp(self):
+        StubServerTestCase.setUp(self)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        StubServerTestCase.tearDown(self)
+        shutil.rmtree(self.directory)
+
+    def test_rotation_and_resume(self):
+        spool = Spool(self.directory, segment_size=64)
+        for i in range(10):
+            self.assertTrue(spool.append('track', {'user_id': i}))
+        self.assertTrue(len([n for n in os.listdir(self.directory) if n.endswith('.seg')]) > 1)
+
+        sent = []
+        def send(path, data):
+            if len(sent) == 4:
+                return False
+            sent.append(data['user_id'])
+            return True
+        self.assertEqual(4, spool.replay(send))
+
+        def send_all(path, data):
+            sent.append(data['user_id'])
+            return True
+        self.assertEqual(6, spool.replay(send_all))
+        self.assertEqual(list(range(10)), sent)
+        self.assertEqual(0, len(spool))
+
+    def test_max_size(self):
+        spool = Spool(self.directory, max_size=40)
+        self.assertTrue(spool.append('track', {'user_id': 1}))
+        self.assertFalse(spool.append('track', {'user_id': 2}))
+
+    def test_replay_after_connection_error(self):
+        outbound.init(api_key, base_url=unused_url(), spool_dir=self.directory,
+            retry_policy=outbound.RetryPolicy(max_retries=0))
+        errors = []
+        outbound.track(1, "event", on_error=lambda code, err: errors.append(code))
+        self.assertEqual([outbound.ERROR_CONNECTION], errors)
+
+        outbound.init(api_key, base_url=self.server.url, spool_dir=self.directory)
+        self.assertEqual(1, outbound.replay_spool())
+        self.assertEqual([1], [p['user_id'] for p in self.server.payloads()])
+
+    def test_background_replay(self):
+        outbound.init(api_key, base_url=unused_url(), spool_dir=self.directory,
+            retry_policy=outbound.RetryPolicy(max_retries=0))
+        for i in range(3):
+            outbound.track(i, "spooled")
+
+        outbound.init(api_key, base_url=self.server.url, spool_dir=self.directory)
+        for i in range(20):
+            outbound.track(i, "live")
+        deadline = time.time() + 5
+        while len(self.server.requests) < 23 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([0, 1, 2], [p['user_id'] for p in self.server.payloads() if p['event'] == 'spooled'])
+        self.assertEqual(1, len([t for t in threading.enumerate() if t.name == 'outbound-replay']))
+
+class BulkTests(StubServerTestCase):
+    def test_track_many(self):
+        def records():
+            for i in range(250):
+                yield dict(user_id=i if i != 7 else None, event="event", properties={'i': i})
+        self.server.statuses = [200] * 3 + [400]
+        failures = list(outbound.track_many(records(), concurrency=1, chunk_size=50))
+        self.assertEqual([(3, outbound.ERROR_UNKNOWN), (7, outbound.ERROR_USER_ID)],
+            [(index, code) for index, code, _ in failures])
+        self.assertEqual(249, len(self.server.requests))
+
+    def test_invalid_records(self):
+        records = [dict(user_id=1, event='event'), dict(event='event'), dict(user_id=2),
+            dict(user_id=3, event='event', colour='red'), dict(user_id=4, event='event')]
+        failures = list(outbound.track_many(iter(records)))
+        self.assertEqual([(1, outbound.ERROR_USER_ID), (2, outbound.ERROR_EVENT_NAME), (3, outbound.ERROR_UNKNOWN)],
+            [(index, code) for index, code, _ in failures])
+        self.assertIn('colour', failures[2][2])
+        self.assertEqual([1, 4], sorted(p['user_id'] for p in self.server.payloads()))
+
+    def test_identify_many(self):
+        records = [dict(user_id=i, email='%d@example.com' % i) for i in range(10)]
+        self.assertEqual([], list(outbound.identify_many(iter(records))))
+        self.assertEqual(sorted(r['email'] for r in records),
+            sorted(p['email'] for p in self.server.payloads()))
+
+    def test_unsubscribe_many(self):
+        items = [(1, ['a']), (2, None), (1, ['b', 'a']), (None, ['a']), (2, ['c']), (1, ['a'])]
+        report = list(outbound.unsubscribe_many(iter(items), chunk_size=10))
+        self.assertEqual([(i, outbound.ERROR_USER_ID if i == 3 else None) for i in range(6)],
+            [(index, code) for index, code, _ in report])
+        requests = sorted((path, json.loads(body.decode('utf-8'))) for path, _, body in self.server.requests)
+        self.assertEqual([
+            ('/v2/unsubscribe/all', {'user_id': 2}),
+            ('/v2/unsubscribe/campaigns', {'user_id': 1, 'campaign_ids': ['a', 'b']}),
+        ], requests)
+
+    def test_invalid_items(self):
+        items = [(1, ['a']), (2, ['a'], 'x'), 3, (4, []), (5, None)]
+        report = list(outbound.subscribe_many(iter(items)))
+        self.assertEqual([None, outbound.ERROR_UNKNOWN, outbound.ERROR_UNKNOWN, outbound.ERROR_TOKEN, None],
+            [code for _, code, _ in report])
+        self.assertEqual("One or more campaigns must be specified.", report[3][2])
+        self.assertEqual([1, 5], sorted(p['user_id'] for p in self.server.payloads()))
+
+        items = [(outbound.APNS, 6, 't6'), (outbound.APNS, 7), (outbound.GCM, 8, 't8')]
+        report = list(outbound.register_token_many(iter(items)))
+        self.assertEqual([None, outbound.ERROR_UNKNOWN, None], [code for _, code, _ in report])
+        self.assertIn('Invalid item', report[1][2])
+        self.assertEqual([1, 5, 6, 8], sorted(p['user_id'] for p in self.server.payloads()))
+
+    def test_disable_token_many(self):
+        items = [
+            (outbound.APNS, 1, 't1'), (outbound.GCM, 1, 't1'), (outbound.APNS, 1, 't1'),
+            (outbound.APNS, 2, 't2'), (outbound.APNS, 2, None), (outbound.GCM, 3, 5),
+        ]
+        report = list(outbound.disable_token_many(items, concurrency=2))
+        self.assertEqual([None] * 5 + [outbound.ERROR_TOKEN], [code for _, code, _ in report])
+        self.assertEqual(['/v2/apns/disable', '/v2/apns/disable', '/v2/gcm/disable'],
+            sorted(path for path, _, _ in self.server.requests))
+        self.assertEqual([{'user_id': 1, 'token': 't1'}, {'user_id': 1, 'token': 't1'}, {'user_id': 2, 'all': True}],
+            sorted(self.server.payloads(), key=lambda p: (p['user_id'], 'token' not in p)))
+
+class ImporterTests(StubServerTestCase):
+    def setUp(self):
+        StubServerTestCase.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(''.join(line + '\n' for line in lines))
+        return path
+
+    def test_ndjson_checkpoint(self):
+        from outbound.importer import import_file
+        lines = [json.dumps(dict(user_id=i, event='e', plan='pro')) for i in range(20)]
+        lines[5] = '{not json'
+        path = self.write('events.ndjson', lines)
+        checkpoint = os.path.join(self.directory, 'events.ckpt')
+        failures, reports = [], []
+        report = import_file(path, api_key, base_url=self.server.url, batch_size=64, workers=3,
+            checkpoint=checkpoint, progress=reports.append,
+            on_failure=lambda offset, code, error: failures.append((offset, code)))
+        self.assertEqual((20, 1, os.path.getsize(path)), (report['records'], report['failed'], report['offset']))
+        self.assertEqual([(sum(len(line) + 1 for line in lines[:5]), outbound.ERROR_UNKNOWN)], failures)
+        self.assertEqual(sorted(r['offset'] for r in reports), [r['offset'] for r in reports])
+        self.assertEqual(list(range(20))[:5] + list(range(6, 20)),
+            sorted(p['user_id'] for p in self.server.payloads()))
+        self.assertEqual({'plan': 'pro'}, self.server.payloads()[0]['properties'])
+
+        import_file(path, api_key, base_url=self.server.url, checkpoint=checkpoint)
+        self.assertEqual(19, len(self.server.requests))
+
+    def test_invalid_records_and_mapping(self):
+        from outbound.importer import import_file
+        lines = [json.dumps(dict(user_id=1, event='e')), json.dumps(dict(event='e')), json.dumps(dict(user_id=3))]
+        path = self.write('events.ndjson', lines)
+        failures = []
+        report = import_file(path, api_key, base_url=self.server.url,
+            on_failure=lambda offset, code, error: failures.append(code))
+        self.assertEqual((3, 2), (report['records'], report['failed']))
+        self.assertEqual([outbound.ERROR_USER_ID, outbound.ERROR_EVENT_NAME], failures)
+        self.assertEqual([1], [p['user_id'] for p in self.server.payloads()])
+        self.assertRaises(ValueError, import_file, path, api_key, mapping={'userid': 'uid'})
+
+    def test_bounded_run_ahead(self):
+        from outbound.importer import import_file
+        path = self.write('events.ndjson', [json.dumps(dict(user_id=i, event='e')) for i in range(10)])
+        self.server.statuses = [(429, {'Retry-After': '0.2'})]
+        ahead = []
+        import_file(path, api_key, base_url=self.server.url, batch_size=1, workers=2,
+            progress=lambda report: ahead.append(len(self.server.requests) - report['records']))
+        self.assertLessEqual(max(ahead), 3)
+
+    def test_csv_cli(self):
+        from outbound.__main__ import main
+        path = self.write('users.csv', ['uid,email,plan', '1,a@example.com,', '2,b@example.com,pro'])
+        self.assertEqual(0, main(['import', path, '--key', api_key, '--base-url', self.server.url,
+            '--identify', '--map', 'user_id=uid', '--processes', '--workers', '2']))
+        self.assertEqual([
+            {'user_id': '1', 'email': 'a@example.com'},
+            {'user_id': '2', 'email': 'b@example.com', 'attributes': {'plan': 'pro'}},
+        ], sorted(self.server.payloads(), key=lambda p: p['user_id']))
+
+    def test_csv_mapped_timestamp(self):
+        from outbound.importer import import_file
+        path = self.write('events.csv', ['uid,event,ts', '1,e,1500000000.5'])
+        import_file(path, api_key, base_url=self.server.url, mapping={'user_id': 'uid', 'timestamp': 'ts'})
+        self.assertEqual([{'user_id': '1', 'event': 'e', 'timestamp': 1500000000}], self.server.payloads())
+
+class AdaptiveLimitTests(StubServerTestCase):
+    def test_simulation(self):
+        limit = outbound.AdaptiveLimit(initial_limit=2, max_limit=8,
+            initial_batch_size=20, min_batch_size=5, max_batch_size=200)
+        outbound.init(api_key, base_url=self.server.url, concurrency_limit=limit,
+            retry_policy=outbound.RetryPolicy(max_retries=0))
+        records = lambda n: (dict(user_id=i, event='e') for i in range(n))
+
+        self.assertEqual([], list(outbound.track_many(records(300))))
+        healthy = limit.snapshot()
+        self.assertGreater(healthy['limit'], 2)
+        self.assertGreater(healthy['batch_size'], 20)
+
+        # Outbound starts throttling.
+        self.server.statuses = [429] * 20
+        self.assertEqual(20, len(list(outbound.track_many(records(20)))))
+        throttled = limit.snapshot()
+        self.assertLess(throttled['limit'], healthy['limit'])
+        self.assertLess(throttled['batch_size'], healthy['batch_size'])
+
+        # Throttling stops but latency jumps, then settles at its new level
+        # and the limits grow back.
+        self.server.delay = 0.005
+        self.assertEqual([], list(outbound.track_many(records(150))))
+        self.assertGreater(limit.snapshot()['limit'], throttled['limit'])
+        self.assertEqual(0, limit.snapshot()['in_flight'])
+        self.assertLessEqual(self.server.max_active, 8)
+
+    def test_breaker_and_failures_free_slots(self):
+        limit = outbound.AdaptiveLimit(initial_limit=1, max_limit=1)
+        outbound.init(api_key, base_url=self.server.url, concurrency_limit=limit, deadline=0.05,
+            breaker_threshold=1, breaker_reset_timeout=0.05, retry_policy=outbound.RetryPolicy(max_retries=0))
+        errors = []
+        on_error = lambda code, err: errors.append(code)
+        self.server.statuses = [503]
+        outbound.track(1, 'event', on_error=on_error)
+        time.sleep(0.1)
+
+        # The breaker's trial call can't get a slot in time, then gets one.
+        self.assertTrue(limit.acquire())
+        outbound.track(1, 'event', on_error=on_error)
+        limit.cancel()
+        outbound.track(1, 'event', on_error=on_error)
+        outbound.track(1, 'event', on_error=on_error)
+        self.assertEqual([outbound.ERROR_UNKNOWN, outbound.ERROR_TIMEOUT], errors)
+
+        class BrokenTransport(object):
+            def __init__(self, **options):
+                pass
+            def post(self, url, body, headers, timeout=None):
+                raise ValueError(timeout)
+            def close(self):
+                pass
+        client = outbound.Client(api_key, transport=BrokenTransport, concurrency_limit=limit)
+        self.assertRaises(ValueError, client.track, 1, 'event')
+        client.close()
+        self.assertEqual(0, limit.snapshot()['in_flight'])
+
+class CompressionTests(StubServerTestCase):
+    def test_threshold(self):
+        outbound.init(api_key, base_url=self.server.url, compress=True, compress_min_size=200)
+        outbound.track(1, "small")
+        outbound.track(2, "large", properties={'blob': 'x' * 500})
+        self.assertEqual([None, 'gzip'], self.server.encodings)
+        self.assertEqual('x' * 500, self.server.payloads()[1]['properties']['blob'])
+
+class SerializerTests(StubServerTestCase):
+    def test_custom_serializer(self):
+        calls = []
+        def serializer(data):
+            calls.append(data)
+            return outbound.serializers.stdlib(data)
+        outbound.init(api_key, base_url=self.server.url, serializer=serializer)
+        outbound.identify(1, email='a@example.com')
+        self.assertEqual(1, len(calls))
+        self.assertEqual('a@example.com', self.server.payloads()[0]['email'])
+
+    def test_default_handles_non_string_keys(self):
+        body = outbound.serializers.default()({'properties': {1: 'one'}})
+        self.assertEqual({'properties': {'1': 'one'}}, json.loads(body.decode('utf-8')))
+
+class IdentifyCacheTests(StubServerTestCase):
+    def test_suppresses_identical_calls(self):
+        outbound.init(api_key, base_url=self.server.url, identify_cache_size=2)
+        successes = []
+        for attributes in [{'a': 1}, {'a': 1}, {'a': 2}, {'a': 2}]:
+            outbound.identify(1, attributes=attributes, on_success=lambda: successes.append(1))
+        self.assertEqual(4, len(successes))
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual(dict(hits=2, misses=2, size=1), outbound.identify_cache_stats())
+
+    def test_failed_calls_not_cached(self):
+        outbound.init(api_key, base_url=self.server.url, identify_cache_size=2)
+        self.server.statuses = [400]
+        outbound.identify(1)
+        outbound.identify(1)
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_lru_eviction(self):
+        cache = LRUCache(2)
+        cache.set(1, 'a')
+        cache.set(2, 'b')
+        cache.get(1)
+        cache.set(3, 'c')
+        self.assertEqual(['a', None, 'c'], [cache.get(k) for k in (1, 2, 3)])
+
+    def test_ttl(self):
+        cache = LRUCache(2, ttl=0)
+        cache.set(1, 'a')
+        self.assertFalse(cache.check(1, 'a'))
+
+class CoalesceTests(StubServerTestCase):
+    def test_merges_identify_calls(self):
+        outbound.init(api_key, base_url=self.server.url, identify_coalesce_window=60)
+        successes = []
+        on_success = lambda: successes.append(1)
+        outbound.identify(1, attributes={'plan': 'free', 'a': {'b': 1}}, apns_tokens=['t1'], on_success=on_success)
+        outbound.identify(1, attributes={'plan': 'pro', 'a': {'c': 2}}, apns_tokens=('t2', 't1'),
+            on_success=on_success)
+        outbound.identify(1, group_attributes={'size': 3}, email='a@example.com', on_success=on_success)
+        outbound.identify(2, on_success=on_success)
+        self.assertEqual([], self.server.requests)
+        self.assertTrue(outbound.flush())
+        self.assertEqual(4, len(successes))
+        self.assertEqual([
+            {'user_id': 1, 'attributes': {'plan': 'pro', 'a': {'b': 1, 'c': 2}}, 'apns': ['t1', 't2'],
+                'group_attributes': {'size': 3}, 'email': 'a@example.com'},
+            {'user_id': 2},
+        ], self.server.payloads())
+
+    def test_window_and_ordering(self):
+        outbound.init(api_key, base_url=self.server.url, identify_coalesce_window=0.05)
+        errors, done = [], threading.Event()
+        on_error = lambda code, err: errors.append(code)
+        self.server.statuses = [400]
+        outbound.identify(1, email='a@example.com', on_error=on_error)
+        outbound.identify(1, first_name='A', on_error=on_error)
+        outbound.identify(2, on_success=done.set)
+        outbound.track(1, 'signed up')
+        self.assertEqual([outbound.ERROR_UNKNOWN] * 2, errors)
+        self.assertTrue(done.wait(5), "Expected held identify to be sent after the window.")
+        self.assertEqual(['/v2/identify', '/v2/track', '/v2/identify'],
+            [path for path, _, _ in self.server.requests])
+
+    def test_track_waits_for_identify_being_sent(self):
+        outbound.init(api_key, base_url=self.server.url, identify_coalesce_window=0.05)
+        self.server.delay = 0.3
+        outbound.identify(1, email='a@example.com')
+        time.sleep(0.15)
+        outbound.track(1, 'signed up')
+        self.assertEqual(['/v2/identify', '/v2/track'], [path for path, _, _ in self.server.requests])
+        self.assertEqual(1, self.server.max_active)
+
+    def test_identify_after_close(self):
+        client = outbound.Client(api_key, base_url=self.server.url, identify_coalesce_window=60)
+        client.close()
+        errors = []
+        client.identify(1, on_error=lambda code, err: errors.append(code))
+        self.assertEqual([outbound.ERROR_INIT], errors)
+
+class TokenCacheTests(StubServerTestCase):
+    def paths(self):
+        return [path for path, _, _ in self.server.requests]
+
+    def test_suppresses_redundant_calls(self):
+        outbound.init(api_key, base_url=self.server.url, token_cache_size=10)
+        successes = []
+        on_success = lambda: successes.append(1)
+        outbound.register_token(outbound.APNS, 1, 'a', on_success=on_success)
+        outbound.register_token(outbound.APNS, 1, 'a', on_success=on_success)
+        outbound.register_token(outbound.GCM, 1, 'a', on_success=on_success)
+        outbound.disable_token(outbound.APNS, 1, 'a', on_success=on_success)
+        outbound.disable_token(outbound.APNS, 1, 'a', on_success=on_success)
+        outbound.register_token(outbound.APNS, 1, 'a', on_success=on_success)
+        self.assertEqual(6, len(successes))
+        self.assertEqual(['/v2/apns/register', '/v2/gcm/register', '/v2/apns/disable',
+            '/v2/apns/register'], self.paths())
+        self.assertEqual(dict(hits=2, misses=4, size=2), outbound.token_cache_stats())
+
+    def test_disable_all_and_user_tokens(self):
+        outbound.init(api_key, base_url=self.server.url, token_cache_size=10)
+        outbound.identify(1, apns_tokens=['a'])
+        outbound.track(1, 'opened', gcm_tokens='b')
+        outbound.register_token(outbound.APNS, 1, 'a')
+        outbound.register_token(outbound.GCM, 1, 'b')
+        outbound.disable_all_tokens(outbound.APNS, 1)
+        outbound.disable_token(outbound.APNS, 1, 'c')
+        outbound.disable_all_tokens(outbound.APNS, 1)
+        outbound.register_token(outbound.APNS, 1, 'a')
+        self.assertEqual(['/v2/identify', '/v2/track', '/v2/apns/disable', '/v2/apns/register'],
+            self.paths())
+
+    def test_failed_calls_not_cached(self):
+        outbound.init(api_key, base_url=self.server.url, token_cache_size=10)
+        self.server.statuses = [400]
+        outbound.register_token(outbound.APNS, 1, 'a')
+        outbound.register_token(outbound.APNS, 1, 'a')
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_bulk_and_persistence(self):
+        path = os.path.join(tempfile.mkdtemp(), 'tokens.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        outbound.init(api_key, base_url=self.server.url, token_cache_size=10, token_cache_file=path)
+        outbound.register_token(outbound.APNS, 1, 'a')
+        items = [(outbound.APNS, 1, 'a'), (outbound.APNS, 2, 'b')]
+        self.assertEqual([(0, None, None), (1, None, None)], list(outbound.register_token_many(items)))
+        outbound.close()
+
+        outbound.init(api_key, base_url=self.server.url, token_cache_size=10, token_cache_file=path)
+        outbound.register_token(outbound.APNS, 2, 'b')
+        list(outbound.disable_token_many([(outbound.APNS, 2, 'b')]))
+        outbound.register_token(outbound.APNS, 2, 'b')
+        self.assertEqual(['/v2/apns/register'] * 2 + ['/v2/apns/disable', '/v2/apns/register'],
+            self.paths())
+
+class RateLimitTests(StubServerTestCase):
+    def test_limits(self):
+        limiter = outbound.RateLimiter(event_rate=0.001, burst=2, user_rate=0.001)
+        outbound.init(api_key, base_url=self.server.url, rate_limiter=limiter)
+        errors = []
+        on_error = lambda code, err: errors.append(code)
+        for i in range(3):
+            outbound.track(i, "heartbeat", on_error=on_error)
+        outbound.track(0, "click", on_error=on_error)
+        outbound.track(0, "click", on_error=on_error)
+        outbound.identify(1, on_error=on_error)
+        self.assertEqual([outbound.ERROR_RATE_LIMITED] * 2, errors)
+        self.assertEqual([0, 1, 0, 1], [p['user_id'] for p in self.server.payloads()])
+
+    def test_slow_rates(self):
+        limiter = outbound.RateLimiter(rate=0.5)
+        self.assertEqual([True, False], [limiter.allow(1), limiter.allow(1)])
+        limiter._global.updated -= 2
+        self.assertTrue(limiter.allow(1))
+        self.assertRaises(ValueError, outbound.RateLimiter, rate=0.5, burst=0.5)
+
+    def test_sampling_is_deterministic(self):
+        limiter = outbound.RateLimiter(rate=0.001, burst=1, sample_rate=0.5)
+        self.assertTrue(limiter.allow(0, "event"))
+        allowed = [limiter.allow(i, "event") for i in range(1000)]
+        self.assertTrue(300 < sum(allowed) < 700)
+        self.assertEqual(allowed, [limiter.allow(i, "event") for i in range(1000)])
+
+    def test_user_buckets_bounded(self):
+        limiter = outbound.RateLimiter(user_rate=1, max_users=10)
+        for i in range(100):
+            limiter.allow(i)
+        self.assertEqual(10, len(limiter._users))
+
+class MetricsTests(StubServerTestCase):
+    def test_stats(self):
+        self.assertEqual(None, outbound.stats())
+        outbound.init(api_key, base_url=self.server.url, metrics=outbound.Metrics())
+        self.server.statuses = [400]
+        outbound.track(1, "event")
+        outbound.track(2, "event")
+        outbound.track(None, "event")
+        outbound.register_token(outbound.APNS, 1, "token")
+
+        stats = outbound.stats()
+        self.assertEqual(dict(success=1, error=2), stats['calls']['track'])
+        self.assertEqual({outbound.ERROR_UNKNOWN: 1, outbound.ERROR_USER_ID: 1}, stats['errors']['track'])
+        self.assertEqual(dict(success=1, error=0), stats['calls']['register_token'])
+        self.assertEqual(3, stats['latency']['request']['count'])
+        self.assertEqual(4, stats['latency']['total']['count'])
+        self.assertTrue(stats['bytes_sent'] > 0)
+        self.assertEqual(0, stats['gauges']['queue_depth'])
+
+    def test_exporters(self):
+        from outbound.metrics import prometheus_text, statsd_lines
+        metrics = outbound.Metrics()
+        metrics.error('track', outbound.ERROR_CONNECTION)
+        metrics.observe('request', 0.002)
+        first = metrics.snapshot()
+        metrics.success('track')
+
+        text = prometheus_text(metrics.snapshot())
+        self.assertTrue('outbound_calls_total{endpoint="track",result="success"} 1' in text)
+        self.assertTrue('outbound_errors_total{endpoint="track",code="4"} 1' in text)
+        self.assertTrue('outbound_phase_seconds_bucket{phase="request",le="0.0025"} 1' in text)
+        self.assertEqual(['outbound.calls.track.success:1|c'], statsd_lines(metrics.snapshot(), first))
+
+class RetryTests(StubServerTestCase):
+    def test_retry_after(self):
+        self.server.statuses = [(429, {'Retry-After': '0'}), (503, {'Retry-After': '0'})]
+        successes = []
+        outbound.identify(1, on_success=lambda: successes.append(1))
+        self.assertEqual([1], successes)
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_no_retry_on_client_error(self):
+        self.server.statuses = [400]
+        errors = []
+        outbound.identify(1, on_error=lambda code, err: errors.append(code))
+        self.assertEqual([outbound.ERROR_UNKNOWN], errors)
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_backoff(self):
+        policy = outbound.RetryPolicy(max_retries=2, backoff_factor=1, max_backoff=1.5)
+        self.assertTrue(0 <= policy.delay(0) <= 1)
+        self.assertTrue(0 <= policy.delay(1) <= 1.5)
+        self.assertEqual(None, policy.delay(2))
+        self.assertEqual(None, policy.delay(0, retry_after='60'))
+
+    def test_circuit_breaker(self):
+        outbound.init(api_key, base_url=self.server.url, breaker_threshold=2,
+            breaker_reset_timeout=60, retry_policy=outbound.RetryPolicy(max_retries=0))
+        self.server.statuses = [503, 503]
+        errors = []
+        for i in range(3):
+            outbound.track(i, "event", on_error=lambda code, err: errors.append(code))
+        self.assertEqual([outbound.ERROR_UNKNOWN, outbound.ERROR_UNKNOWN,
+            outbound.ERROR_CIRCUIT_OPEN], errors)
+        self.assertEqual(2, len(self.server.requests))
+
+        outbound.identify(1, on_success=lambda: errors.append(None))
+        self.assertEqual(None, errors[-1], "Expected other endpoints to be unaffected.")
+
+try:
+    import asyncio
+    from outbound import aio
+except (ImportError, SyntaxError):
+    aio = None
+
+@unittest.skipIf(aio is None, "aiohttp is not installed.")
+class AsyncClientTests(StubServerTestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.server.stop()
+
+    def test_calls(self):
+        errors = []
+        async def run():
+            async with aio.Client(api_key, base_url=self.server.url, concurrency=4) as client:
+                results = await asyncio.gather(*[client.track(i, "event") for i in range(10)])
+                await client.identify(None, on_error=lambda code, err: errors.append(code))
+                await client.register_token(outbound.GCM, 1, "token")
+                return results
+        results = self.loop.run_until_complete(run())
+        self.assertEqual([True] * 10, results)
+        self.assertEqual([outbound.ERROR_USER_ID], errors)
+        self.assertEqual(11, len(self.server.requests))
+        self.assertEqual('/v2/gcm/register', self.server.requests[-1][0])
+
+    def test_unknown_error(self):
+        self.server.statuses = [500]
+        errors = []
+        async def run():
+            async with aio.Client(api_key, base_url=self.server.url) as client:
+                await client.alias(1, 2, on_error=lambda code, err: errors.append(code))
+        self.loop.run_until_complete(run())
+        self.assertEqual([outbound.ERROR_UNKNOWN], errors)
+
+    def test_missing_campaigns(self):
+        errors = []
+        async def run():
+            async with aio.Client(api_key, base_url=self.server.url) as client:
+                await client.subscribe(1, campaign_ids=[], on_error=lambda code, err: errors.append((code, err)))
+                await client.unsubscribe(1, on_error=lambda code, err: errors.append((code, err)))
+        self.loop.run_until_complete(run())
+        message = "One or more campaigns must be specified."
+        self.assertEqual([(outbound.ERROR_TOKEN, message)] * 2, errors)
+        self.assertEqual([], self.server.requests)
+
+    def test_response_timeout(self):
+        self.server.delay = 0.5
+        errors = []
+        async def run():
+            async with aio.Client(api_key, base_url=self.server.url, timeout=0.1) as client:
+                await client.alias(1, 2, on_error=lambda code, err: errors.append(code))
+        self.loop.run_until_complete(run())
+        self.assertEqual([outbound.ERROR_RESPONSE_TIMEOUT], errors)
+
+    def test_serializer(self):
+        bodies = []
+        def serializer(data):
+            bodies.append(data)
+            return outbound.serializers.stdlib(data)
+        async def run():
+            async with aio.Client(api_key, base_url=self.server.url, serializer=serializer) as client:
+                await client.alias(1, 2)
+        self.loop.run_until_complete(run())
+        self.assertEqual([{'user_id': 1, 'previous_id': 2}], bodies)
+        self.assertEqual(1, len(self.server.requests))
+
 if __name__ == '__main__':
     unittest.main()